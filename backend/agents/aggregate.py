@@ -0,0 +1,168 @@
+"""
+Incremental aggregation of test verdicts into results/suites rows.
+
+Counts and usage totals (tokens, screenshots, cost) are updated as each test
+finishes and flushed to the database at most once per QAI_AGGREGATE_FLUSH_S
+seconds, so dashboards see partial numbers while a result is still running. With fail-fast enabled, the first
+failing required test sets `stop_event` so the remaining work can be skipped.
+"""
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from database import get_suites_with_tests_for_result, get_write_queue, update_result_fields, update_suite_fields
+from prompts import priority_for
+from telemetry import combine_usage
+
+
+# Stored run_status values that are a test's final verdict
+FINISHED_STATUSES = ("PASSED", "FAILED", "CANCELLED")
+
+
+def is_required(test: Dict[str, Any]) -> bool:
+    """Tests flagged required, or HIGH priority ("critical" in the summary)."""
+    return bool(test.get("required")) or priority_for(test) == "HIGH"
+
+
+def order_tests(tests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Required / critical tests first so fail-fast trips early; DB order otherwise."""
+    return sorted(tests, key=lambda t: 0 if is_required(t) else 1)
+
+
+class ResultAggregator:
+    def __init__(
+        self,
+        result_id: int,
+        specs: List[Dict[str, Any]],
+        fail_fast: bool = False,
+        flush_interval: Optional[float] = None,
+    ) -> None:
+        self.result_id = result_id
+        self.fail_fast = fail_fast
+        self.flush_interval = float(flush_interval if flush_interval is not None else os.getenv("QAI_AGGREGATE_FLUSH_S", 2))
+        self.stop_event = asyncio.Event()
+        self.stop_reason: Optional[str] = None
+        # (suite_id, test name) -> "PASSED" | "FAILED" | "CANCELLED" | None (pending)
+        self._verdicts: Dict[Tuple[Any, str], Optional[str]] = {}
+        self._suite_written: Dict[Any, Optional[bool]] = {}
+        self._usage: Dict[Tuple[Any, str], Dict[str, Any]] = {}
+        self._suite_usage_written: Dict[Any, Dict[str, Any]] = {}
+        for spec in specs:
+            for test in spec.get("tests") or []:
+                self._verdicts[(spec.get("suite_id"), test.get("name"))] = None
+        self._last_flush = 0.0
+        self._dirty = False
+        self._pending_flush: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    def overall_result(self) -> Dict[str, int]:
+        verdicts = list(self._verdicts.values())
+        return {
+            "passed_tests": verdicts.count("PASSED"),
+            "failed_tests": verdicts.count("FAILED"),
+            "cancelled_tests": verdicts.count("CANCELLED"),
+            "pending_tests": verdicts.count(None),
+            "total_tests": len(verdicts),
+        }
+
+    def suite_success(self, suite_id: Any) -> Optional[bool]:
+        """False as soon as a test fails, True once every test passed, None while undecided."""
+        verdicts = [v for (sid, _), v in self._verdicts.items() if sid == suite_id]
+        if any(v in ("FAILED", "CANCELLED") for v in verdicts):
+            return False
+        if verdicts and all(v == "PASSED" for v in verdicts):
+            return True
+        return None
+
+    def usage(self, suite_id: Any = None) -> Dict[str, Any]:
+        """Summed test usage for one suite, or for the whole result when suite_id is None."""
+        return combine_usage(
+            [u for (sid, _), u in self._usage.items() if suite_id is None or sid == suite_id], count_key="tests"
+        )
+
+    def run_status(self, final: bool = False) -> str:
+        overall = self.overall_result()
+        if overall["failed_tests"] or overall["cancelled_tests"] or not overall["total_tests"]:
+            return "FAILED"
+        if overall["pending_tests"]:
+            # Tests that never reported by the end of the run count against it
+            return "FAILED" if final else "RUNNING"
+        return "PASSED"
+
+    async def record(self, suite_id: Any, test: Dict[str, Any], status: str, usage: Optional[Dict[str, Any]] = None) -> None:
+        """Record (or revise) one test's verdict and usage and schedule a throttled flush."""
+        self._verdicts[(suite_id, test.get("name"))] = status
+        if usage:
+            self._usage[(suite_id, test.get("name"))] = usage
+        if self.fail_fast and status == "FAILED" and is_required(test) and not self.stop_event.is_set():
+            self.stop_reason = f"required test '{test.get('name')}' failed"
+            print(f"[aggregate] fail-fast for result {self.result_id}: {self.stop_reason}")
+            self.stop_event.set()
+        self._dirty = True
+        await self._maybe_flush()
+
+    async def fail_remaining(self, suite_id: Any) -> None:
+        """Mark a suite's unreported tests failed (e.g. its agent crashed)."""
+        for key, verdict in self._verdicts.items():
+            if key[0] == suite_id and verdict is None:
+                self._verdicts[key] = "FAILED"
+        self._dirty = True
+        await self._maybe_flush()
+
+    async def _maybe_flush(self) -> None:
+        wait = self._last_flush + self.flush_interval - time.monotonic()
+        if wait <= 0:
+            await self.flush()
+        elif self._pending_flush is None or self._pending_flush.done():
+            self._pending_flush = asyncio.create_task(self._delayed_flush(wait))
+
+    async def _delayed_flush(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        await self.flush()
+
+    async def flush(self, final: bool = False) -> None:
+        async with self._lock:
+            if not self._dirty and not final:
+                return
+            self._dirty = False
+            self._last_flush = time.monotonic()
+            fields: Dict[str, Any] = {"overall_result": self.overall_result(), "usage": self.usage()}
+            if final:
+                fields["run_status"] = self.run_status(final=True)
+            await update_result_fields(self.result_id, fields)
+            for suite_id in {sid for sid, _ in self._verdicts}:
+                success = self.suite_success(suite_id)
+                if success is not None and self._suite_written.get(suite_id) != success:
+                    await update_suite_fields(suite_id, {"suites-success": success})
+                    self._suite_written[suite_id] = success
+                usage = self.usage(suite_id)
+                if usage["tests"] and self._suite_usage_written.get(suite_id) != usage:
+                    await update_suite_fields(suite_id, {"usage": usage})
+                    self._suite_usage_written[suite_id] = usage
+
+    async def finalize(self) -> Dict[str, Any]:
+        """Force a last write including run_status and return the final aggregate."""
+        if self._pending_flush is not None and not self._pending_flush.done():
+            self._pending_flush.cancel()
+        await self.flush(final=True)
+        return {"overall_result": self.overall_result(), "run_status": self.run_status(final=True), "usage": self.usage()}
+
+
+async def finalize_result(result_id: int) -> Dict[str, Any]:
+    """Aggregate the stored test verdicts of a result into its results/suites rows.
+
+    CANCELLED tests (fail-fast, a failed preflight) count as finished, so they
+    are never reported as pending.
+    """
+    flush_timeout = float(os.getenv("QAI_WRITE_FLUSH_TIMEOUT_S", 30))
+    await get_write_queue().flush(flush_timeout)
+    specs: List[Dict[str, Any]] = await get_suites_with_tests_for_result(result_id)
+    aggregator = ResultAggregator(result_id, specs)
+    for spec in specs:
+        for test in spec.get("tests") or []:
+            if test.get("run_status") in FINISHED_STATUSES:
+                await aggregator.record(spec.get("suite_id"), test, test["run_status"], test.get("usage"))
+    final = await aggregator.finalize()
+    await get_write_queue().flush(flush_timeout)
+    return {"result_id": result_id, **final}
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
@@ -15,30 +15,55 @@ sys.path.append(str(parent_dir))
 from dotenv import load_dotenv
 load_dotenv()
 
+# Only the database layer is imported at module load. The agent runtime
+# (runner -> agent, computer, record, ...) is imported on first use by the
+# run endpoints, so cold starts that only serve CRUD requests never pay for it.
 try:
-    from runner import run_single_agent, run_agents, run_qai_tests
     from database import (
-        get_or_create_test,
+        supabase,
         create_result,
-        set_suite_result_id,
-        get_suite_with_tests,
-        update_test_fields,
-        append_test_step,
+        create_result_tree,
+        get_test_steps,
         _has_client
     )
 except ImportError as e:
     # Fallback for when running on Vercel with different import paths
     print(f"Import error: {e}")
-    # Define stub functions to prevent startup errors
-    async def run_qai_tests(suite_id): 
-        return {"agent_result": {"status": "failed", "error": "Agent runner not available"}}
-    async def run_single_agent(spec): 
-        return []
-    async def run_agents(specs, pr_name, pr_link): 
-        return {}
+    supabase = None
     def _has_client(): 
         return False
 
+from singleflight import SingleFlight
+from listing import MAX_PAGE_SIZE, select_fields, paginate, etag_response, escape_like
+from cache import (
+    get_read_cache,
+    invalidate_results,
+    invalidate_suites,
+    invalidate_tests,
+    RESULTS_PREFIX,
+    SUITES_PREFIX,
+    TESTS_PREFIX,
+)
+
+# Columns that may be requested with ?fields=
+RESULT_FIELDS = {"id", "created_at", "pr-link", "pr_name", "overall_result", "run_status", "eta_seconds", "res-success", "usage"}
+SUITE_FIELDS = {"id", "created_at", "result_id", "name", "suites-success", "s3-link", "usage"}
+TEST_FIELDS = {
+    "id", "created_at", "suite_id", "name", "summary", "test_success", "run_status", "steps", "s3_link",
+    "routing", "duration_s", "rerun", "runner_id", "heartbeat_at", "usage", "media", "evidence", "visual",
+}
+
+# Duplicate /run-suite requests share one in-flight run
+run_requests = SingleFlight()
+
+def _load_runner():
+    """Import the agent runtime on first use by a run endpoint."""
+    try:
+        import runner
+    except ImportError as e:
+        raise HTTPException(status_code=503, detail=f"Agent runner not available: {e}")
+    return runner
+
 app = FastAPI(
     title="QAI Agent Runner API", 
     version="1.0.0",
@@ -60,6 +85,19 @@ class CreateResultRequest(BaseModel):
     prLink: str
     prName: str
 
+class BulkTestRequest(BaseModel):
+    name: str
+    summary: Optional[str] = None
+
+class BulkSuiteRequest(BaseModel):
+    name: str
+    tests: List[BulkTestRequest] = []
+
+class BulkResultRequest(BaseModel):
+    prLink: str
+    prName: str
+    suites: List[BulkSuiteRequest] = []
+
 class UpdateResultRequest(BaseModel):
     resSuccess: bool
 
@@ -85,6 +123,7 @@ class UpdateTestRequest(BaseModel):
 
 class RunSuiteRequest(BaseModel):
     suite_id: int
+    idempotency_key: Optional[str] = None
 
 class AgentRunRequest(BaseModel):
     spec: Dict[str, Any]
@@ -116,6 +155,7 @@ async def create_result_endpoint(request: CreateResultRequest):
         result_id = await create_result(request.prName, request.prLink, {}, "PENDING")
         if result_id is None:
             raise HTTPException(status_code=500, detail="Failed to create result")
+        invalidate_results()
         
         return {
             "success": True,
@@ -132,6 +172,31 @@ async def create_result_endpoint(request: CreateResultRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create result: {str(e)}")
 
+@app.post("/results/bulk")
+async def create_result_tree_endpoint(request: BulkResultRequest):
+    """Create a result with all its suites and tests in one request"""
+    try:
+        if not _has_client():
+            raise HTTPException(status_code=500, detail="Database not configured")
+        
+        tree = await create_result_tree(
+            request.prName,
+            request.prLink,
+            [suite.model_dump() for suite in request.suites],
+        )
+        if tree is None:
+            raise HTTPException(status_code=500, detail="Failed to create result tree")
+        
+        return {
+            "success": True,
+            "message": "Result, suites and tests created successfully",
+            "data": tree
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to create result tree: {str(e)}")
+
 @app.patch("/results/{result_id}")
 async def update_result_endpoint(result_id: int, request: UpdateResultRequest):
     """Update result success status"""
@@ -140,8 +205,6 @@ async def update_result_endpoint(result_id: int, request: UpdateResultRequest):
             raise HTTPException(status_code=500, detail="Database not configured")
         
         # Import here to handle Vercel deployment issues
-        from supabase import create_client
-        supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
         
         response = supabase.table('results').update({
             'res-success': request.resSuccess
@@ -149,6 +212,7 @@ async def update_result_endpoint(result_id: int, request: UpdateResultRequest):
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Result not found")
+        invalidate_results()
         
         return {
             "success": True,
@@ -161,24 +225,79 @@ async def update_result_endpoint(result_id: int, request: UpdateResultRequest):
         raise HTTPException(status_code=500, detail=f"Failed to update result: {str(e)}")
 
 @app.get("/results")
-async def get_all_results():
-    """Get all results"""
+async def get_all_results(
+    request: Request,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    status: Optional[str] = None,
+    pr: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+):
+    """Get results, newest first, one keyset page at a time"""
     try:
         if not _has_client():
             raise HTTPException(status_code=500, detail="Database not configured")
         
-        from supabase import create_client
-        supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
         
-        response = supabase.table('results').select('*').order('created_at', desc=True).execute()
+        async def _load():
+            query = supabase.table('results').select(select_fields(fields, RESULT_FIELDS))
+            if status:
+                query = query.eq('run_status', status.upper())
+            if pr:
+                query = query.eq('pr-link', pr) if pr.startswith('http') else query.ilike('pr_name', f'%{escape_like(pr)}%')
+            if since:
+                query = query.gte('created_at', since)
+            if until:
+                query = query.lt('created_at', until)
+            rows, next_cursor = paginate(query, limit, cursor)
+            return {
+                "success": True,
+                "data": rows,
+                "next_cursor": next_cursor,
+            }
         
-        return {
-            "success": True,
-            "data": response.data or []
-        }
+        body = await get_read_cache().get_or_load(f"{RESULTS_PREFIX}{request.url.query}", _load)
+        return etag_response(request, body)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch results: {str(e)}")
 
+@app.get("/results/{result_id}/usage")
+async def get_result_usage(request: Request, result_id: int, top: int = 10):
+    """Get token/cost totals for a result and its suites, plus its most expensive tests"""
+    try:
+        if not _has_client():
+            raise HTTPException(status_code=500, detail="Database not configured")
+        
+        def _load():
+            result = supabase.table('results').select('id, pr_name, run_status, usage').eq('id', result_id).execute()
+            if not result.data:
+                raise HTTPException(status_code=404, detail="Result not found")
+            suites = supabase.table('suites').select('id, name, usage').eq('result_id', result_id).order('id').execute().data
+            tests = []
+            if suites:
+                tests = supabase.table('tests').select('id, suite_id, name, run_status, duration_s, usage') \
+                    .in_('suite_id', [s['id'] for s in suites]).execute().data
+            tests = [t for t in tests if t.get('usage')]
+            tests.sort(key=lambda t: (t['usage'].get('cost_usd') or 0, t['usage'].get('input_tokens') or 0), reverse=True)
+            return {
+                "success": True,
+                "data": {
+                    **result.data[0],
+                    "suites": suites,
+                    "top_tests": tests[:max(0, min(top, MAX_PAGE_SIZE))],
+                },
+            }
+        
+        return etag_response(request, _load())
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch usage: {str(e)}")
+
 # Suite endpoints
 
 @app.post("/suites")
@@ -188,8 +307,6 @@ async def create_suite_endpoint(request: CreateSuiteRequest):
         if not _has_client():
             raise HTTPException(status_code=500, detail="Database not configured")
         
-        from supabase import create_client
-        supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
         
         suite_data = {
             'result_id': request.resultId,
@@ -203,6 +320,7 @@ async def create_suite_endpoint(request: CreateSuiteRequest):
         
         if not response.data:
             raise HTTPException(status_code=500, detail="Failed to create suite")
+        invalidate_suites(request.resultId)
         
         return {
             "success": True,
@@ -221,8 +339,6 @@ async def update_suite_endpoint(suite_id: int, request: UpdateSuiteRequest):
         if not _has_client():
             raise HTTPException(status_code=500, detail="Database not configured")
         
-        from supabase import create_client
-        supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
         
         update_data = {}
         if request.suitesSuccess is not None:
@@ -237,6 +353,7 @@ async def update_suite_endpoint(suite_id: int, request: UpdateSuiteRequest):
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Suite not found")
+        invalidate_suites(response.data[0].get('result_id'))
         
         return {
             "success": True,
@@ -249,24 +366,43 @@ async def update_suite_endpoint(suite_id: int, request: UpdateSuiteRequest):
         raise HTTPException(status_code=500, detail=f"Failed to update suite: {str(e)}")
 
 @app.get("/results/{result_id}/suites")
-async def get_suites_for_result(result_id: int):
+async def get_suites_for_result(
+    request: Request,
+    result_id: int,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+):
     """Get suites for a specific result"""
     try:
         if not _has_client():
             raise HTTPException(status_code=500, detail="Database not configured")
         
-        from supabase import create_client
-        supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
         
-        response = supabase.table('suites').select('*').eq('result_id', result_id).order('created_at', desc=True).execute()
+        async def _load():
+            query = supabase.table('suites').select(select_fields(fields, SUITE_FIELDS)).eq('result_id', result_id)
+            rows, next_cursor = paginate(query, limit, cursor)
+            return {
+                "success": True,
+                "data": rows,
+                "next_cursor": next_cursor,
+            }
         
-        return {
-            "success": True,
-            "data": response.data or []
-        }
+        body = await get_read_cache().get_or_load(f"{SUITES_PREFIX}{result_id}:{request.url.query}", _load)
+        return etag_response(request, body)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch suites: {str(e)}")
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """Read cache hit/miss counters"""
+    return {
+        "success": True,
+        "data": get_read_cache().stats()
+    }
+
 # Test endpoints
 
 @app.post("/tests")
@@ -276,8 +412,6 @@ async def create_test_endpoint(request: CreateTestRequest):
         if not _has_client():
             raise HTTPException(status_code=500, detail="Database not configured")
         
-        from supabase import create_client
-        supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
         
         test_data = {
             'suite_id': request.suiteId,
@@ -290,6 +424,7 @@ async def create_test_endpoint(request: CreateTestRequest):
         
         if not response.data:
             raise HTTPException(status_code=500, detail="Failed to create test")
+        invalidate_tests(request.suiteId)
         
         return {
             "success": True,
@@ -308,8 +443,6 @@ async def update_test_endpoint(test_id: int, request: UpdateTestRequest):
         if not _has_client():
             raise HTTPException(status_code=500, detail="Database not configured")
         
-        from supabase import create_client
-        supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
         
         update_data = {}
         if request.testSuccess is not None:
@@ -324,6 +457,7 @@ async def update_test_endpoint(test_id: int, request: UpdateTestRequest):
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Test not found")
+        invalidate_tests(response.data[0].get('suite_id'))
         
         return {
             "success": True,
@@ -336,33 +470,71 @@ async def update_test_endpoint(test_id: int, request: UpdateTestRequest):
         raise HTTPException(status_code=500, detail=f"Failed to update test: {str(e)}")
 
 @app.get("/suites/{suite_id}/tests")
-async def get_tests_for_suite(suite_id: int):
-    """Get tests for a specific suite"""
+async def get_tests_for_suite(
+    request: Request,
+    suite_id: int,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    status: Optional[str] = None,
+):
+    """Get tests for a specific suite (use ?fields= to leave out large columns like steps)"""
     try:
         if not _has_client():
             raise HTTPException(status_code=500, detail="Database not configured")
         
-        from supabase import create_client
-        supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
         
-        response = supabase.table('tests').select('*').eq('suite_id', suite_id).order('created_at', desc=True).execute()
+        async def _load():
+            query = supabase.table('tests').select(select_fields(fields, TEST_FIELDS)).eq('suite_id', suite_id)
+            if status:
+                query = query.eq('run_status', status.upper())
+            rows, next_cursor = paginate(query, limit, cursor)
+            return {
+                "success": True,
+                "data": rows,
+                "next_cursor": next_cursor,
+            }
         
-        return {
-            "success": True,
-            "data": response.data or []
-        }
+        body = await get_read_cache().get_or_load(f"{TESTS_PREFIX}{suite_id}:{request.url.query}", _load)
+        return etag_response(request, body)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch tests: {str(e)}")
 
+@app.get("/tests/{test_id}/steps")
+async def get_steps_for_test(request: Request, test_id: int, after: int = 0, limit: int = 200):
+    """Get step log rows with seq > after (poll with the last seq seen for live progress)"""
+    try:
+        if not _has_client():
+            raise HTTPException(status_code=500, detail="Database not configured")
+        
+        rows = await get_test_steps(test_id, after, max(1, min(limit, MAX_PAGE_SIZE)))
+        return etag_response(request, {
+            "success": True,
+            "data": rows,
+            "last_seq": rows[-1]["seq"] if rows else after,
+        })
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch steps: {str(e)}")
+
 # Agent execution endpoints
 
 @app.post("/run-suite")
-async def run_suite_endpoint(request: RunSuiteRequest):
+async def run_suite_endpoint(request: RunSuiteRequest, idempotency_key: Optional[str] = Header(None)):
     """
     Run a test suite by ID - This is the main endpoint called by the CICD pipeline
     """
+    key = idempotency_key or request.idempotency_key
     try:
-        result = await run_qai_tests(request.suite_id)
+        runner = _load_runner()
+        result = await run_requests.do(
+            f"suite:{request.suite_id}",
+            lambda: runner.run_qai_tests(request.suite_id),
+            idempotency_key=f"run-suite:{key}" if key else None,
+        )
         
         if result['agent_result']['status'] == 'success':
             return {
@@ -384,8 +556,10 @@ async def run_suite_endpoint(request: RunSuiteRequest):
 async def run_agent_endpoint(request: AgentRunRequest):
     """Run a single agent test (legacy endpoint)"""
     try:
-        result = await run_single_agent(request.spec)
+        result = await _load_runner().run_single_agent(request.spec)
         return {"status": "success", "result": result}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Agent execution failed: {str(e)}")
 
@@ -393,8 +567,10 @@ async def run_agent_endpoint(request: AgentRunRequest):
 async def run_agents_endpoint(request: MultiAgentRunRequest):
     """Run multiple agent tests (legacy endpoint)"""
     try:
-        result = await run_agents(request.test_specs, request.pr_name, request.pr_link)
+        result = await _load_runner().run_agents(request.test_specs, request.pr_name, request.pr_link)
         return {"status": "success", "result": result}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Agents execution failed: {str(e)}")
 
@@ -408,6 +584,7 @@ async def root():
         "endpoints": {
             "health": "/health",
             "results": "/results",
+            "results_bulk": "/results/bulk",
             "suites": "/suites", 
             "tests": "/tests",
             "run_suite": "/run-suite"
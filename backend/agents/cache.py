@@ -0,0 +1,150 @@
+"""
+Read-through TTL cache for the dashboard GET endpoints.
+
+The default backend is an in-process LRU. Set QAI_CACHE_REDIS_URL (with the
+optional `redis` package installed) to share entries and invalidations between
+API instances and the runner, or install any object with the same
+get/set/delete_prefix methods via set_cache_backend(). Redis is required for
+cross-process invalidation: with the in-process backend, writes made by the
+runner never reach the API's entries, which then expire after QAI_CACHE_TTL_S.
+"""
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class MemoryBackend:
+    """In-process LRU with per-entry expiry."""
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete_prefix(self, prefix: str) -> int:
+        keys = [k for k in self._entries if k.startswith(prefix)]
+        for key in keys:
+            del self._entries[key]
+        return len(keys)
+
+
+class RedisBackend:
+    """Shared backend on Redis; values are stored as JSON."""
+
+    def __init__(self, url: str, namespace: str = "qai:cache:") -> None:
+        import redis  # optional dependency
+
+        self.client = redis.Redis.from_url(url)
+        self.namespace = namespace
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self.client.get(self.namespace + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self.client.set(self.namespace + key, json.dumps(value, default=str), px=int(ttl * 1000))
+
+    def delete_prefix(self, prefix: str) -> int:
+        keys = list(self.client.scan_iter(match=self.namespace + prefix + "*"))
+        return self.client.delete(*keys) if keys else 0
+
+
+class ReadCache:
+    def __init__(self, backend: Optional[Any] = None, ttl: Optional[float] = None) -> None:
+        self.backend = backend or MemoryBackend()
+        self.ttl = float(ttl if ttl is not None else os.getenv("QAI_CACHE_TTL_S", 5))
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "errors": 0}
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for key, or load, store and return it."""
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            self._stats["errors"] += 1
+            print(f"[cache] get error for {key}: {e}")
+            value = None
+        if value is not None:
+            self._stats["hits"] += 1
+            return value
+        self._stats["misses"] += 1
+        value = await loader()
+        try:
+            self.backend.set(key, value, self.ttl)
+        except Exception as e:
+            self._stats["errors"] += 1
+            print(f"[cache] set error for {key}: {e}")
+        return value
+
+    def invalidate(self, *prefixes: str) -> None:
+        for prefix in prefixes:
+            try:
+                self._stats["invalidations"] += self.backend.delete_prefix(prefix)
+            except Exception as e:
+                self._stats["errors"] += 1
+                print(f"[cache] invalidate error for {prefix}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else 0.0,
+            "backend": type(self.backend).__name__,
+            "ttl_s": self.ttl,
+        }
+
+
+_cache: Optional[ReadCache] = None
+
+
+def get_read_cache() -> ReadCache:
+    global _cache
+    if _cache is None:
+        backend = None
+        redis_url = os.getenv("QAI_CACHE_REDIS_URL")
+        if redis_url:
+            try:
+                backend = RedisBackend(redis_url)
+            except Exception as e:
+                print(f"[cache] Redis backend unavailable ({e}); using in-process cache")
+        _cache = ReadCache(backend)
+    return _cache
+
+
+def set_cache_backend(backend: Any) -> None:
+    get_read_cache().backend = backend
+
+
+# Key prefixes shared by the API handlers and the runner's write paths
+RESULTS_PREFIX = "results:"
+SUITES_PREFIX = "suites:"
+TESTS_PREFIX = "tests:"
+
+
+def invalidate_results() -> None:
+    get_read_cache().invalidate(RESULTS_PREFIX)
+
+
+def invalidate_suites(result_id: Optional[int] = None) -> None:
+    get_read_cache().invalidate(f"{SUITES_PREFIX}{result_id}:" if result_id is not None else SUITES_PREFIX)
+
+
+def invalidate_tests(suite_id: Optional[int] = None) -> None:
+    get_read_cache().invalidate(f"{TESTS_PREFIX}{suite_id}:" if suite_id is not None else TESTS_PREFIX)
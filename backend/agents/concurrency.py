@@ -0,0 +1,212 @@
+"""
+Adaptive (AIMD) limit on the number of agent trajectories running at once.
+
+Every agent run (one run_single_agent call: a suite or a rerun replica) holds a
+slot while it runs (run_with_slot), so a cut also throttles the result that
+caused it: its next suites wait for a free slot. Containers are leased only
+once a slot is free and at most up to the current limit (lease_within_limit),
+so a saturated limiter doesn't lease VMs that would sit idle. The limit grows
+by one after a window of healthy turns and is cut multiplicatively when turns
+get slower than QAI_AGENT_TURN_LATENCY_TARGET_S, or when the model provider
+rate limits us, or when a VM or its connection fails. It never exceeds
+QAI_MAX_CONCURRENT_AGENTS. A cut only takes effect for new runs; agents already
+in flight finish normally.
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+RATE_LIMIT_MARKERS = ("rate limit", "ratelimit", "rate_limit", "too many requests", "429", "overloaded", "529")
+# Transport and VM failures from the cua computer interface; ordinary agent/test errors don't count
+VM_ERROR_TYPES = ("ConnectionClosed", "ConnectionClosedError", "InvalidHandshake", "InvalidStatus", "WebSocketException")
+VM_ERROR_MARKERS = (
+    "connection refused",
+    "connection reset",
+    "connection aborted",
+    "broken pipe",
+    "websocket connection",
+    "computer-server",
+    "computer server",
+    "vm is not running",
+    "container is not running",
+    "no route to host",
+)
+
+
+def classify_error(exc: BaseException) -> Optional[str]:
+    """Return "rate_limit", "vm" or None for an exception raised by an agent run."""
+    if getattr(exc, "status_code", None) == 429:
+        return "rate_limit"
+    text = f"{type(exc).__name__} {exc}".lower()
+    if any(marker in text for marker in RATE_LIMIT_MARKERS):
+        return "rate_limit"
+    if isinstance(exc, ConnectionError) or type(exc).__name__ in VM_ERROR_TYPES:
+        return "vm"
+    if any(marker in text for marker in VM_ERROR_MARKERS):
+        return "vm"
+    return None
+
+
+class AIMDLimiter:
+    def __init__(
+        self,
+        ceiling: Optional[int] = None,
+        initial: Optional[int] = None,
+        latency_target_s: Optional[float] = None,
+        backoff: float = 0.5,
+        cooldown_s: Optional[float] = None,
+    ) -> None:
+        self.ceiling = max(1, int(ceiling if ceiling is not None else os.getenv("QAI_MAX_CONCURRENT_AGENTS", 4)))
+        start = initial if initial is not None else os.getenv("QAI_INITIAL_CONCURRENT_AGENTS", self.ceiling)
+        self.limit = float(max(1, min(self.ceiling, int(start))))
+        self.latency_target_s = float(
+            latency_target_s if latency_target_s is not None else os.getenv("QAI_AGENT_TURN_LATENCY_TARGET_S", 30)
+        )
+        self.backoff = backoff
+        # One cut per congestion episode, however many agents report it
+        self.cooldown_s = float(cooldown_s if cooldown_s is not None else os.getenv("QAI_AIMD_COOLDOWN_S", 20))
+        self.in_flight = 0
+        self._healthy_turns = 0
+        self._last_cut = float("-inf")
+        self._cond: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.stats = {"increases": 0, "decreases": 0, "rate_limits": 0, "vm_errors": 0, "slow_turns": 0, "waits": 0}
+
+    @property
+    def current_limit(self) -> int:
+        return max(1, int(self.limit))
+
+    def _condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if self._cond is None or self._loop is not loop:
+            self._cond = asyncio.Condition()
+            self._loop = loop
+            self.in_flight = 0
+        return self._cond
+
+    async def wait_for_slot(self) -> None:
+        """Wait until a slot is free without taking it."""
+        cond = self._condition()
+        async with cond:
+            if self.in_flight >= self.current_limit:
+                self.stats["waits"] += 1
+            await cond.wait_for(lambda: self.in_flight < self.current_limit)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold one agent slot, waiting while the limit is reached."""
+        cond = self._condition()
+        async with cond:
+            if self.in_flight >= self.current_limit:
+                self.stats["waits"] += 1
+            await cond.wait_for(lambda: self.in_flight < self.current_limit)
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            async with cond:
+                self.in_flight -= 1
+                cond.notify_all()
+
+    def on_turn(self, latency_s: float) -> None:
+        """Feed one agent turn's latency; healthy windows raise the limit by one."""
+        if latency_s > self.latency_target_s:
+            self.stats["slow_turns"] += 1
+            self._cut(f"turn took {latency_s:.1f}s")
+            return
+        self._healthy_turns += 1
+        # Additive increase once per window of `limit` healthy turns (one "round trip" per slot)
+        if self._healthy_turns >= self.current_limit and self.limit < self.ceiling:
+            self._healthy_turns = 0
+            self.limit = min(self.ceiling, self.limit + 1)
+            self.stats["increases"] += 1
+            print(f"[concurrency] limit raised to {self.current_limit}")
+            self._wake()
+
+    def on_error(self, exc: BaseException) -> Optional[str]:
+        """Feed an agent/VM exception; rate limits and VM errors cut the limit."""
+        kind = classify_error(exc)
+        if kind == "rate_limit":
+            self.stats["rate_limits"] += 1
+            self._cut("provider rate limit")
+        elif kind == "vm":
+            self.stats["vm_errors"] += 1
+            self._cut("VM error")
+        return kind
+
+    def _cut(self, reason: str) -> None:
+        self._healthy_turns = 0
+        now = time.monotonic()
+        if now - self._last_cut < self.cooldown_s:
+            return
+        self._last_cut = now
+        previous = self.current_limit
+        self.limit = max(1.0, self.limit * self.backoff)
+        self.stats["decreases"] += 1
+        print(f"[concurrency] limit cut {previous} -> {self.current_limit} ({reason})")
+
+    def _wake(self) -> None:
+        cond = self._cond
+        if cond is None:
+            return
+
+        async def _notify() -> None:
+            async with cond:
+                cond.notify_all()
+
+        try:
+            asyncio.get_running_loop().create_task(_notify())
+        except RuntimeError:
+            pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "limit": self.current_limit,
+            "ceiling": self.ceiling,
+            "in_flight": self.in_flight,
+            "latency_target_s": self.latency_target_s,
+        }
+
+
+async def run_with_slot(fn: Callable[..., Awaitable[Any]], *args: Any, limiter: Optional[AIMDLimiter] = None) -> Any:
+    """Run one agent run (e.g. run_single_agent) while holding a slot.
+
+    Exceptions are fed to the limiter before they propagate.
+    """
+    limiter = limiter or get_concurrency_limiter()
+    async with limiter.slot():
+        try:
+            return await fn(*args)
+        except Exception as e:
+            limiter.on_error(e)
+            raise
+
+
+@asynccontextmanager
+async def lease_within_limit(
+    manager: Any, count: int, owner: str, priority: int = 0, limiter: Optional[AIMDLimiter] = None
+) -> AsyncIterator[List[str]]:
+    """Lease at most the limiter's current limit of containers from manager.
+
+    Nothing is leased while the limiter is saturated, so the VMs stay free for
+    other runners. The slots themselves are taken per run (run_with_slot).
+    """
+    limiter = limiter or get_concurrency_limiter()
+    await limiter.wait_for_slot()
+    count = max(1, min(count, limiter.current_limit, len(manager.containers) or count))
+    async with manager.lease(count, owner, priority) as containers:
+        yield containers
+
+
+_limiter: Optional[AIMDLimiter] = None
+
+
+def get_concurrency_limiter() -> AIMDLimiter:
+    """Process-wide limiter shared by every run in this runner."""
+    global _limiter
+    if _limiter is None:
+        _limiter = AIMDLimiter()
+    return _limiter
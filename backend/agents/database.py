@@ -1,7 +1,13 @@
 from typing import Dict, Any, Optional, List
 from supabase import create_client
 from dotenv import load_dotenv, find_dotenv
+import asyncio
 import os
+import time
+
+from cache import invalidate_results, invalidate_suites, invalidate_tests
+from utils import utc_now_iso
+from writeback import WriteBehindQueue
 
 load_dotenv(find_dotenv())
 SUPABASE_URL = os.getenv('SUPABASE_URL')
@@ -13,6 +19,35 @@ def _has_client() -> bool:
 	return supabase is not None
 
 
+def _apply_write(op: Dict[str, Any]) -> None:
+	"""Execute one queued write against Supabase (runs in a worker thread)."""
+	table = supabase.table(op['table'])
+	if op['op'] == 'update':
+		table.update(op['fields']).eq('id', op['id']).execute()
+	else:
+		table.upsert(op['row'], on_conflict=op['on_conflict']).execute()
+
+
+def _invalidate_after_write(op: Dict[str, Any]) -> None:
+	if op['table'] == 'results':
+		invalidate_results()
+	elif op['table'] == 'suites':
+		invalidate_suites()
+	elif op['table'] == 'tests':
+		invalidate_tests()
+
+
+_write_queue: Optional[WriteBehindQueue] = None
+
+
+def get_write_queue() -> WriteBehindQueue:
+	"""Process-wide write-behind queue used by the update helpers below."""
+	global _write_queue
+	if _write_queue is None:
+		_write_queue = WriteBehindQueue(_apply_write, after_apply=_invalidate_after_write)
+	return _write_queue
+
+
 async def create_result(pr_name: str, pr_link: str, overall_result: Dict[str, Any], run_status: str) -> Optional[int]:
 	"""Insert a new row into results and return its id."""
 	try:
@@ -27,6 +62,7 @@ async def create_result(pr_name: str, pr_link: str, overall_result: Dict[str, An
 		}
 		resp = supabase.table('results').insert(payload).execute()
 		row = (resp.data or [{}])[0]
+		invalidate_results()
 		print(f"[db] Created result id={row.get('id')} status={run_status}")
 		return row.get('id')
 	except Exception as e:
@@ -34,6 +70,65 @@ async def create_result(pr_name: str, pr_link: str, overall_result: Dict[str, An
 		return None
 
 
+async def create_result_tree(pr_name: str, pr_link: str, suites: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+	"""Insert a result with all its suites and tests using one multi-row insert per table.
+
+	suites: [{"name": ..., "tests": [{"name": ..., "summary": ...}, ...]}, ...]
+	Returns {"id", "suites": [{"id", "name", "tests": [{"id", "name"}]}]} or None on failure.
+	"""
+	result_id = None
+	try:
+		if not _has_client():
+			print("[db] Skipping create_result_tree: SUPABASE not configured")
+			return None
+		resp = supabase.table('results').insert({
+			"pr_name": pr_name,
+			"pr-link": pr_link,
+			"overall_result": {},
+			"run_status": "QUEUED",
+		}).execute()
+		result_id = (resp.data or [{}])[0].get('id')
+		if result_id is None:
+			return None
+
+		tree: Dict[str, Any] = {"id": result_id, "suites": []}
+		if suites:
+			suite_rows = supabase.table('suites').insert([
+				{"result_id": result_id, "name": suite.get('name')} for suite in suites
+			]).execute().data or []
+			# PostgREST returns inserted rows in request order
+			test_payload: List[Dict[str, Any]] = []
+			for suite, row in zip(suites, suite_rows):
+				tree["suites"].append({"id": row.get('id'), "name": row.get('name'), "tests": []})
+				for test in suite.get('tests') or []:
+					test_payload.append({
+						"suite_id": row.get('id'),
+						"name": test.get('name'),
+						"summary": test.get('summary'),
+						"steps": [],
+						"run_status": "QUEUED",
+						"test_success": None,
+					})
+			if test_payload:
+				test_rows = supabase.table('tests').insert(test_payload).execute().data or []
+				by_suite = {s["id"]: s for s in tree["suites"]}
+				for row in test_rows:
+					by_suite[row.get('suite_id')]["tests"].append({"id": row.get('id'), "name": row.get('name')})
+
+		invalidate_results()
+		print(f"[db] Created result tree id={result_id} with {len(tree['suites'])} suites")
+		return tree
+	except Exception as e:
+		print(f"[db] ❌ create_result_tree error: {str(e)}")
+		if result_id is not None:
+			# Best-effort cleanup; suites/tests cascade from results
+			try:
+				supabase.table('results').delete().eq('id', result_id).execute()
+			except Exception as cleanup_error:
+				print(f"[db] ❌ create_result_tree cleanup error: {str(cleanup_error)}")
+		return None
+
+
 async def set_suite_result_id(suite_id: int, result_id: int) -> None:
 	"""Link a suite to a result by setting suites.result_id."""
 	try:
@@ -41,11 +136,22 @@ async def set_suite_result_id(suite_id: int, result_id: int) -> None:
 			print(f"[db] Skipping set_suite_result_id for suite {suite_id}: no client")
 			return
 		supabase.table('suites').update({"result_id": result_id}).eq('id', suite_id).execute()
+		invalidate_suites()
 		print(f"[db] Linked suite {suite_id} -> result {result_id}")
 	except Exception as e:
 		print(f"[db] ❌ set_suite_result_id error: {str(e)}")
 
 
+async def update_suite_fields(suite_id: int, fields: Dict[str, Any]) -> None:
+	"""Queue an update of a suites row (write-behind; see writeback.py)."""
+	try:
+		if not _has_client():
+			return
+		get_write_queue().update('suites', suite_id, fields)
+	except Exception as e:
+		print(f"[db] ❌ update_suite_fields error: {str(e)}")
+
+
 async def get_or_create_test(suite_id: int, name: str) -> Optional[int]:
 	"""Find a test row by (suite_id, name) or create it. Returns test id."""
 	try:
@@ -66,6 +172,7 @@ async def get_or_create_test(suite_id: int, name: str) -> Optional[int]:
 		}
 		ins = supabase.table('tests').insert(payload).execute()
 		row = (ins.data or [{}])[0]
+		invalidate_tests(suite_id)
 		print(f"[db] Created test id={row.get('id')} for suite {suite_id}, name '{name}'")
 		return row.get('id')
 	except Exception as e:
@@ -73,29 +180,89 @@ async def get_or_create_test(suite_id: int, name: str) -> Optional[int]:
 		return None
 
 
-async def append_test_step(test_id: int, step: Any) -> None:
-	"""Append a single step to tests.steps immediately (read-modify-write)."""
+# Next seq per running test; seeded from the log so resumed tests keep appending.
+# Entries are dropped by finish_test_steps when the test ends.
+_step_seq: Dict[int, int] = {}
+
+
+async def _next_step_seq(test_id: int) -> int:
+	"""Seq after the last row already logged for the test.
+
+	When the log can't be read, seq continues from the current time in milliseconds,
+	which is above every seq an earlier attempt could have written (steps are
+	counted from 1, or from an earlier such timestamp), so the upsert on
+	(test_id, seq) never overwrites existing rows.
+	"""
+	try:
+		res = await asyncio.to_thread(
+			lambda: supabase.table('test_steps').select('seq').eq('test_id', test_id).order('seq', desc=True).limit(1).execute()
+		)
+		return (res.data[0].get('seq') + 1) if res.data else 1
+	except Exception as e:
+		print(f"[db] append_test_step could not read last seq for test {test_id}: {str(e)}")
+		return int(time.time() * 1000)
+
+
+async def append_test_step(
+	test_id: int,
+	step: Any,
+	actions: Optional[List[Dict[str, Any]]] = None,
+	screenshot: Optional[str] = None,
+) -> Optional[int]:
+	"""Queue one row for the test_steps log and return its seq (screenshot: SHA-256 of the frame at the step)."""
 	try:
 		if not _has_client():
-			return
-		res = supabase.table('tests').select('steps').eq('id', test_id).limit(1).execute()
-		steps = []
-		if res.data:
-			curr = res.data[0].get('steps')
-			if isinstance(curr, list):
-				steps = curr
-		steps.append(step)
-		supabase.table('tests').update({"steps": steps}).eq('id', test_id).execute()
+			return None
+		if test_id not in _step_seq:
+			_step_seq[test_id] = await _next_step_seq(test_id)
+		seq = _step_seq[test_id]
+		_step_seq[test_id] = seq + 1
+		# Upsert keeps the write queue's retries idempotent; seq is unique per test
+		get_write_queue().upsert('test_steps', {
+			"test_id": test_id,
+			"seq": seq,
+			"created_at": utc_now_iso(),
+			"text": step,
+			"actions": actions,
+			"screenshot": screenshot,
+		}, on_conflict="test_id,seq")
+		return seq
 	except Exception as e:
 		print(f"[db] ❌ append_test_step error: {str(e)}")
+		return None
+
+
+def finish_test_steps(test_id: int) -> None:
+	"""Forget a finished test's seq counter; a later run of it re-reads the log."""
+	_step_seq.pop(test_id, None)
+
+
+async def get_test_steps(test_id: int, after: int = 0, limit: int = 200) -> List[Dict[str, Any]]:
+	"""Return step log rows with seq > after, oldest first."""
+	try:
+		if not _has_client():
+			return []
+		resp = (
+			supabase.table('test_steps')
+			.select('seq,created_at,text,actions,screenshot')
+			.eq('test_id', test_id)
+			.gt('seq', after)
+			.order('seq')
+			.limit(limit)
+			.execute()
+		)
+		return resp.data or []
+	except Exception as e:
+		print(f"[db] ❌ get_test_steps error: {str(e)}")
+		return []
 
 
 async def update_test_fields(test_id: int, fields: Dict[str, Any]) -> None:
-	"""Generic update of tests row."""
+	"""Queue an update of a tests row (write-behind; see writeback.py)."""
 	try:
 		if not _has_client():
 			return
-		supabase.table('tests').update(fields).eq('id', test_id).execute()
+		get_write_queue().update('tests', test_id, fields)
 	except Exception as e:
 		print(f"[db] ❌ update_test_fields error: {str(e)}")
 
@@ -124,7 +291,9 @@ async def get_suite_with_tests(suite_id: int) -> Optional[Dict[str, Any]]:
 		formatted_tests = []
 		for test in tests:
 			formatted_tests.append({
+				'id': test.get('id'),
 				'name': test.get('name', 'Untitled Test'),
+				'summary': test.get('summary'),
 				'instructions': [
 					{
 						'role': 'user',
@@ -180,7 +349,12 @@ async def get_suites_with_tests_for_result(result_id: int) -> List[Dict[str, Any
 			formatted_tests: List[Dict[str, Any]] = []
 			for t in tests:
 				formatted_tests.append({
+					'id': t.get('id'),
 					'name': t.get('name', 'Untitled Test'),
+					'summary': t.get('summary'),
+					'run_status': t.get('run_status'),
+					'test_success': t.get('test_success'),
+					'usage': t.get('usage'),
 					'instructions': [
 						{
 							'role': 'user',
@@ -214,10 +388,37 @@ async def get_result_basics(result_id: int) -> Optional[Dict[str, Any]]:
 
 
 async def update_result_fields(result_id: int, fields: Dict[str, Any]) -> None:
-	"""Generic update for a results row."""
+	"""Queue an update of a results row (write-behind; see writeback.py)."""
 	try:
 		if not _has_client():
 			return
-		supabase.table('results').update(fields).eq('id', result_id).execute()
+		get_write_queue().update('results', result_id, fields)
 	except Exception as e:
 		print(f"[db] ❌ update_result_fields error: {str(e)}")
+
+
+async def get_orphaned_running_tests(stale_before: str) -> List[Dict[str, Any]]:
+	"""Tests left RUNNING whose runner heartbeat is older than stale_before (ISO timestamp)."""
+	try:
+		if not _has_client():
+			return []
+		resp = supabase.table('tests').select('id, suite_id, name, runner_id, heartbeat_at') \
+			.eq('run_status', 'RUNNING') \
+			.or_(f'heartbeat_at.lt.{stale_before},heartbeat_at.is.null') \
+			.execute()
+		return resp.data or []
+	except Exception as e:
+		print(f"[db] ❌ get_orphaned_running_tests error: {str(e)}")
+		return []
+
+
+async def get_result_ids_for_suites(suite_ids: List[int]) -> List[int]:
+	"""Distinct result ids owning the given suites."""
+	try:
+		if not _has_client() or not suite_ids:
+			return []
+		resp = supabase.table('suites').select('result_id').in_('id', suite_ids).execute()
+		return sorted({row['result_id'] for row in (resp.data or []) if row.get('result_id') is not None})
+	except Exception as e:
+		print(f"[db] ❌ get_result_ids_for_suites error: {str(e)}")
+		return []
@@ -0,0 +1,118 @@
+"""
+Rolling per-test duration estimates and longest-processing-time-first packing.
+
+Durations are kept as an exponentially weighted moving average keyed by test
+summary (falling back to test name) in a small JSON file (QAI_DURATIONS_PATH).
+Only full agent runs that reached a verdict are recorded, and the file is
+written once per suite (flush) rather than after every test.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def _summary_key(test: Dict[str, Any]) -> Optional[str]:
+    summary = (test.get("summary") or "").strip()
+    if not summary:
+        return None
+    return "summary:" + hashlib.sha1(summary.encode("utf-8")).hexdigest()
+
+
+def _name_key(test: Dict[str, Any]) -> str:
+    return "name:" + str(test.get("name") or "test")
+
+
+def representative_run(run_status: str, replica: bool = False, replayed: bool = False) -> bool:
+    """Whether a test's duration says how long a full agent run takes.
+
+    Cancelled tests stop early, rerun replicas skip recording and uploads, and
+    visual fast-path replays skip the model, so none of them are recorded.
+    """
+    return run_status in ("PASSED", "FAILED") and not replica and not replayed
+
+
+class DurationStore:
+    """EWMA of observed test durations, persisted as JSON."""
+
+    def __init__(self, path: Optional[str] = None, alpha: float = 0.3, default_s: Optional[float] = None) -> None:
+        self.path = Path(path or os.getenv("QAI_DURATIONS_PATH", "/tmp/qai/durations.json"))
+        self.alpha = alpha
+        self.default_s = float(default_s or os.getenv("QAI_DEFAULT_TEST_DURATION_S", 90))
+        self._data: Dict[str, Dict[str, float]] = {}
+        self._dirty = False
+        if self.path.exists():
+            try:
+                self._data = json.loads(self.path.read_text(encoding="utf-8"))
+            except Exception as e:
+                print(f"[durations] could not read {self.path}: {e}")
+                self._data = {}
+
+    def _update(self, key: str, duration_s: float) -> None:
+        entry = self._data.get(key)
+        if entry is None:
+            self._data[key] = {"ewma_s": duration_s, "samples": 1}
+        else:
+            entry["ewma_s"] = self.alpha * duration_s + (1 - self.alpha) * entry["ewma_s"]
+            entry["samples"] += 1
+
+    def record(self, test: Dict[str, Any], duration_s: float) -> None:
+        """Fold one observed duration into the estimates for this test (persisted by flush)."""
+        self._update(_name_key(test), duration_s)
+        key = _summary_key(test)
+        if key:
+            self._update(key, duration_s)
+        self._dirty = True
+
+    def flush(self) -> None:
+        """Write the estimates if anything was recorded since the last flush."""
+        if not self._dirty:
+            return
+        self._dirty = False
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self._data), encoding="utf-8")
+            tmp.replace(self.path)
+        except Exception as e:
+            print(f"[durations] could not write {self.path}: {e}")
+
+    def estimate(self, test: Dict[str, Any]) -> float:
+        """Estimated seconds for a test: by summary, then by name, then the default."""
+        for key in (_summary_key(test), _name_key(test)):
+            if key and key in self._data:
+                return self._data[key]["ewma_s"]
+        return self.default_s
+
+    def estimate_suite(self, spec: Dict[str, Any]) -> float:
+        overhead = float(os.getenv("QAI_SUITE_OVERHEAD_S", 20))
+        return overhead + sum(self.estimate(t) for t in spec.get("tests") or [])
+
+
+def plan_lpt(
+    specs: List[Dict[str, Any]],
+    containers: List[str],
+    estimate: Callable[[Dict[str, Any]], float],
+) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, float]]:
+    """Assign suites to containers longest-first onto the least-loaded container.
+
+    Returns (container -> ordered suites, container -> predicted seconds).
+    """
+    queues: Dict[str, List[Dict[str, Any]]] = {c: [] for c in containers}
+    loads: Dict[str, float] = {c: 0.0 for c in containers}
+    for spec in sorted(specs, key=estimate, reverse=True):
+        target = min(containers, key=lambda c: loads[c])
+        queues[target].append(spec)
+        loads[target] += estimate(spec)
+    return queues, loads
+
+
+_store: Optional[DurationStore] = None
+
+
+def get_duration_store() -> DurationStore:
+    global _store
+    if _store is None:
+        _store = DurationStore()
+    return _store
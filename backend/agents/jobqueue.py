@@ -0,0 +1,229 @@
+"""
+Shared job queue for runner workers (see worker.py).
+
+The API enqueues one job per suite; worker processes lease jobs, run them and
+report the result. A lease is only valid until its visibility timeout, which
+the worker keeps extending with heartbeats. When a worker dies its job becomes
+visible again and is re-run by another worker, up to max_attempts times. Once
+every job of a group is done or failed, claim_finished_groups() hands the group
+to exactly one caller, which aggregates it.
+
+Jobs live in a SQLite file (QAI_JOB_DB). Every worker on the host, and any
+host that mounts the file, shares the same queue.
+"""
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+from typing import Any, Dict, List, Optional
+
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+
+class SqliteJobQueue:
+    def __init__(self, path: Optional[str] = None, visibility_timeout: Optional[float] = None) -> None:
+        self.path = path or os.getenv("QAI_JOB_DB", "/tmp/qai/jobs.db")
+        self.visibility_timeout = float(
+            visibility_timeout if visibility_timeout is not None else os.getenv("QAI_JOB_VISIBILITY_S", 300)
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " job_group TEXT,"
+                " kind TEXT NOT NULL,"
+                " priority INTEGER NOT NULL DEFAULT 0,"
+                " payload TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " max_attempts INTEGER NOT NULL DEFAULT 3,"
+                " worker TEXT,"
+                " lease_expires REAL,"
+                " result TEXT,"
+                " error TEXT,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_idx ON jobs (status, priority, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_group_idx ON jobs (job_group)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS finished_groups (job_group TEXT PRIMARY KEY, finished_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode; lease() manages its own transaction
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    @staticmethod
+    def _row(cursor: sqlite3.Cursor, row: tuple) -> Dict[str, Any]:
+        job = {col[0]: value for col, value in zip(cursor.description, row)}
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job.get("result") else None
+        return job
+
+    def enqueue(
+        self,
+        kind: str,
+        payload: Dict[str, Any],
+        group: Optional[str] = None,
+        priority: int = 0,
+        max_attempts: int = 3,
+    ) -> int:
+        """Add a job and return its id; lower priority values are leased first."""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                "INSERT INTO jobs (job_group, kind, priority, payload, status, max_attempts, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (group, kind, priority, json.dumps(payload, default=str), QUEUED, max_attempts, now, now),
+            )
+            if group is not None:
+                # A new run of the group has to be finalized again
+                conn.execute("DELETE FROM finished_groups WHERE job_group = ?", (group,))
+            return cur.lastrowid
+
+    def _requeue_expired(self, conn: sqlite3.Connection, now: float) -> None:
+        """Make jobs whose worker stopped heartbeating visible again (or fail them when out of attempts)."""
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = 'lease expired after final attempt', updated_at = ?"
+            " WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts",
+            (FAILED, now, LEASED, now),
+        )
+        conn.execute(
+            "UPDATE jobs SET status = ?, worker = NULL, lease_expires = NULL, updated_at = ?"
+            " WHERE status = ? AND lease_expires < ?",
+            (QUEUED, now, LEASED, now),
+        )
+
+    def lease(self, worker: str, visibility_timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Atomically take the next visible job for worker, or None if there is none."""
+        timeout = visibility_timeout if visibility_timeout is not None else self.visibility_timeout
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            self._requeue_expired(conn, now)
+            cur = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY priority, id LIMIT 1", (QUEUED,)
+            )
+            row = cur.fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            job = self._row(cur, row)
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ?"
+                " WHERE id = ?",
+                (LEASED, worker, now + timeout, now, job["id"]),
+            )
+            conn.execute("COMMIT")
+            job.update(status=LEASED, worker=worker, lease_expires=now + timeout, attempts=job["attempts"] + 1)
+            return job
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def heartbeat(self, job_id: int, worker: str, visibility_timeout: Optional[float] = None) -> bool:
+        """Extend worker's lease on a job; False if the lease was lost (expired and re-leased)."""
+        timeout = visibility_timeout if visibility_timeout is not None else self.visibility_timeout
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND worker = ? AND status = ?",
+                (now + timeout, now, job_id, worker, LEASED),
+            )
+            return cur.rowcount == 1
+
+    def complete(self, job_id: int, worker: str, result: Any) -> bool:
+        """Store a job's result; False if worker no longer holds the lease."""
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, lease_expires = NULL, updated_at = ?"
+                " WHERE id = ? AND worker = ? AND status = ?",
+                (DONE, json.dumps(result, default=str), time.time(), job_id, worker, LEASED),
+            )
+            return cur.rowcount == 1
+
+    def fail(self, job_id: int, worker: str, error: str, retry: bool = True) -> bool:
+        """Record an error; the job is queued again while it has attempts left and retry is set."""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET status = CASE WHEN ? AND attempts < max_attempts THEN ? ELSE ? END,"
+                " error = ?, worker = NULL, lease_expires = NULL, updated_at = ?"
+                " WHERE id = ? AND worker = ? AND status = ?",
+                (int(retry), QUEUED, FAILED, error, now, job_id, worker, LEASED),
+            )
+            return cur.rowcount == 1
+
+    def group_jobs(self, group: str) -> List[Dict[str, Any]]:
+        with closing(self._connect()) as conn:
+            cur = conn.execute("SELECT * FROM jobs WHERE job_group = ? ORDER BY id", (group,))
+            return [self._row(cur, row) for row in cur.fetchall()]
+
+    def group_finished(self, group: str) -> bool:
+        """True once no job in the group is queued or leased."""
+        with closing(self._connect()) as conn:
+            self._requeue_expired(conn, time.time())
+            (open_jobs,) = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE job_group = ? AND status IN (?, ?)", (group, QUEUED, LEASED)
+            ).fetchone()
+            return open_jobs == 0
+
+    def claim_finished_groups(self) -> List[str]:
+        """Return the groups whose jobs all reached done/failed since they were last claimed.
+
+        Each group is returned to one caller only, whichever transition finished it
+        (a completed job, a failed one, or a lease that expired after its last attempt).
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            self._requeue_expired(conn, now)
+            groups = [g for (g,) in conn.execute(
+                "SELECT job_group FROM jobs WHERE job_group IS NOT NULL"
+                " AND job_group NOT IN (SELECT job_group FROM finished_groups)"
+                " GROUP BY job_group HAVING SUM(status IN (?, ?)) = 0",
+                (QUEUED, LEASED),
+            ).fetchall()]
+            conn.executemany(
+                "INSERT INTO finished_groups (job_group, finished_at) VALUES (?, ?)", [(g, now) for g in groups]
+            )
+            conn.execute("COMMIT")
+            return groups
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with closing(self._connect()) as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            workers = [w for (w,) in conn.execute("SELECT DISTINCT worker FROM jobs WHERE status = ?", (LEASED,))]
+        return {"path": self.path, "jobs": counts, "active_workers": workers}
+
+
+_queue: Optional[SqliteJobQueue] = None
+
+
+def get_job_queue() -> SqliteJobQueue:
+    global _queue
+    if _queue is None:
+        _queue = SqliteJobQueue()
+    return _queue
+
+
+def worker_mode_enabled() -> bool:
+    """QAI_WORKER_MODE=1 makes /run-result enqueue suites for worker.py instead of running them in-process."""
+    return os.getenv("QAI_WORKER_MODE", "0").lower() in ("1", "true", "yes")
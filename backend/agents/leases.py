@@ -0,0 +1,269 @@
+"""
+Container lease manager with a priority/FIFO admission queue.
+
+Each run must hold a lease on the CUA containers it drives. Leases expire unless
+renewed by a heartbeat, so a crashed holder frees its VMs after the TTL. If a
+renewal finds the lease gone (e.g. the event loop stalled past the TTL), the
+heartbeat re-claims the same containers when they are still free and otherwise
+aborts the holder with LeaseLost, so two runs never drive one VM. Set
+QAI_LEASE_DB to a SQLite path to share the lock table between processes on the
+same host; otherwise leases are tracked in memory for this process only.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import sqlite3
+import time
+from contextlib import asynccontextmanager, closing
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+
+class LeaseLost(RuntimeError):
+    """The containers of a lease expired and were taken by another owner."""
+
+
+class MemoryLeaseTable:
+    """In-process lock table: container -> (owner, expires_at)."""
+
+    def __init__(self) -> None:
+        self._rows: Dict[str, Dict[str, Any]] = {}
+
+    def _expire(self) -> None:
+        now = time.time()
+        for container in [c for c, row in self._rows.items() if row["expires_at"] < now]:
+            del self._rows[container]
+
+    def claim(self, candidates: List[str], count: int, owner: str, ttl: float) -> List[str]:
+        """Atomically lease `count` free containers to owner, or none at all."""
+        self._expire()
+        free = [c for c in candidates if c not in self._rows]
+        if len(free) < count:
+            return []
+        expires_at = time.time() + ttl
+        for container in free[:count]:
+            self._rows[container] = {"owner": owner, "expires_at": expires_at}
+        return free[:count]
+
+    def renew(self, owner: str, ttl: float) -> int:
+        expires_at = time.time() + ttl
+        renewed = 0
+        for row in self._rows.values():
+            if row["owner"] == owner:
+                row["expires_at"] = expires_at
+                renewed += 1
+        return renewed
+
+    def release(self, owner: str) -> None:
+        for container in [c for c, row in self._rows.items() if row["owner"] == owner]:
+            del self._rows[container]
+
+    def holders(self) -> Dict[str, str]:
+        self._expire()
+        return {c: row["owner"] for c, row in self._rows.items()}
+
+
+class SqliteLeaseTable:
+    """Cross-process lock table stored in a SQLite file."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS container_leases ("
+                " container TEXT PRIMARY KEY,"
+                " owner TEXT NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode; claim() manages its own transaction
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def claim(self, candidates: List[str], count: int, owner: str, ttl: float) -> List[str]:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            conn.execute("DELETE FROM container_leases WHERE expires_at < ?", (now,))
+            held = {row[0] for row in conn.execute("SELECT container FROM container_leases")}
+            free = [c for c in candidates if c not in held]
+            if len(free) < count:
+                conn.execute("ROLLBACK")
+                return []
+            conn.executemany(
+                "INSERT INTO container_leases (container, owner, expires_at) VALUES (?, ?, ?)",
+                [(c, owner, now + ttl) for c in free[:count]],
+            )
+            conn.execute("COMMIT")
+            return free[:count]
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def renew(self, owner: str, ttl: float) -> int:
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                "UPDATE container_leases SET expires_at = ? WHERE owner = ?", (time.time() + ttl, owner)
+            )
+            return cur.rowcount
+
+    def release(self, owner: str) -> None:
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM container_leases WHERE owner = ?", (owner,))
+
+    def holders(self) -> Dict[str, str]:
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT container, owner FROM container_leases WHERE expires_at >= ?", (time.time(),)
+            ).fetchall()
+        return {c: o for c, o in rows}
+
+
+class ContainerLeaseManager:
+    """Grants container leases to runs in priority order (lower first), FIFO within a priority."""
+
+    def __init__(
+        self,
+        containers: List[str],
+        table: Optional[Any] = None,
+        ttl: Optional[float] = None,
+        poll_interval: float = 2.0,
+    ) -> None:
+        self.containers = list(containers)
+        self.table = table or MemoryLeaseTable()
+        self.ttl = float(ttl or os.getenv("QAI_LEASE_TTL", 120))
+        self.poll_interval = poll_interval
+        self._queue: List[tuple] = []
+        self._seq = itertools.count()
+        self._cond = asyncio.Condition()
+        self._waiting: Dict[tuple, Dict[str, Any]] = {}
+        self._stats = {"admitted": 0, "total_wait_s": 0.0, "max_wait_s": 0.0}
+
+    async def acquire(self, count: int, owner: str, priority: int = 0) -> List[str]:
+        """Wait for admission and return the leased container names."""
+        if not self.containers:
+            raise RuntimeError("No containers configured for leasing")
+        count = max(1, min(count, len(self.containers)))
+        ticket = (priority, next(self._seq))
+        enqueued = time.monotonic()
+        heapq.heappush(self._queue, ticket)
+        self._waiting[ticket] = {"owner": owner, "count": count, "priority": priority, "enqueued": enqueued}
+        granted: List[str] = []
+        try:
+            async with self._cond:
+                while True:
+                    # Strict head-of-line admission keeps large requests from starving
+                    if self._queue[0] == ticket:
+                        granted = await asyncio.to_thread(self.table.claim, self.containers, count, owner, self.ttl)
+                        if granted:
+                            break
+                    try:
+                        # Poll as well as wait: other processes and expiries don't notify us
+                        await asyncio.wait_for(self._cond.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+            self._waiting.pop(ticket, None)
+            await self._notify()
+
+        waited = time.monotonic() - enqueued
+        self._stats["admitted"] += 1
+        self._stats["total_wait_s"] += waited
+        self._stats["max_wait_s"] = max(self._stats["max_wait_s"], waited)
+        print(f"[leases] {owner} admitted with {granted} after {waited:.1f}s")
+        return granted
+
+    async def release(self, owner: str) -> None:
+        await asyncio.to_thread(self.table.release, owner)
+        print(f"[leases] {owner} released its containers")
+        await self._notify()
+
+    async def _notify(self) -> None:
+        async with self._cond:
+            self._cond.notify_all()
+
+    async def _heartbeat(self, owner: str, containers: List[str], holder: asyncio.Task, lost: List[str]) -> None:
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                renewed = await asyncio.to_thread(self.table.renew, owner, self.ttl)
+                if renewed >= len(containers):
+                    continue
+                # Some rows expired: take them back if nobody else has, otherwise stop the holder
+                held = await asyncio.to_thread(self.table.holders)
+                missing = [c for c in containers if held.get(c) != owner]
+                taken = [c for c in missing if c in held]
+                if not taken and await asyncio.to_thread(self.table.claim, missing, len(missing), owner, self.ttl):
+                    print(f"[leases] {owner} re-acquired expired lease on {missing}")
+                    continue
+                print(f"[leases] {owner} lost its lease on {taken or missing}; aborting")
+                lost.extend(taken or missing)
+                holder.cancel()
+                return
+            except Exception as e:
+                print(f"[leases] heartbeat error for {owner}: {e}")
+
+    @asynccontextmanager
+    async def lease(self, count: int, owner: str, priority: int = 0) -> AsyncIterator[List[str]]:
+        """Acquire containers, keep them alive with heartbeats, and release on exit.
+
+        Raises LeaseLost in the holder if the containers are taken over while it runs.
+        """
+        containers = await self.acquire(count, owner, priority)
+        lost: List[str] = []
+        heartbeat = asyncio.create_task(self._heartbeat(owner, containers, asyncio.current_task(), lost))
+        try:
+            yield containers
+        except asyncio.CancelledError:
+            if not lost:
+                raise
+            asyncio.current_task().uncancel()
+            raise LeaseLost(f"lease of {owner} on {lost} was lost")
+        finally:
+            heartbeat.cancel()
+            await self.release(owner)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        admitted = self._stats["admitted"]
+        return {
+            "queue_depth": len(self._queue),
+            "waiting": [
+                {"owner": w["owner"], "count": w["count"], "priority": w["priority"], "wait_s": round(now - w["enqueued"], 1)}
+                for _, w in sorted(self._waiting.items())
+            ],
+            "containers": len(self.containers),
+            "leased": self.table.holders(),
+            "admitted": admitted,
+            "avg_wait_s": round(self._stats["total_wait_s"] / admitted, 2) if admitted else 0.0,
+            "max_wait_s": round(self._stats["max_wait_s"], 2),
+        }
+
+
+def configured_containers() -> List[str]:
+    """Container names from CUA_CONTAINER_1..4."""
+    containers: List[str] = []
+    for i in range(1, 5):
+        val = os.getenv(f"CUA_CONTAINER_{i}")
+        if val:
+            containers.append(val)
+    return containers
+
+
+_manager: Optional[ContainerLeaseManager] = None
+
+
+def get_lease_manager() -> ContainerLeaseManager:
+    """Process-wide lease manager over the configured containers."""
+    global _manager
+    if _manager is None:
+        db_path = os.getenv("QAI_LEASE_DB")
+        table = SqliteLeaseTable(db_path) if db_path else MemoryLeaseTable()
+        _manager = ContainerLeaseManager(configured_containers(), table=table)
+    return _manager
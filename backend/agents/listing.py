@@ -0,0 +1,82 @@
+"""
+Helpers for the dashboard read endpoints: keyset pagination on (created_at, id),
+`fields=` projection and ETag / If-None-Match handling.
+"""
+import base64
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse, Response
+
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    raw = json.dumps({"created_at": row.get("created_at"), "id": row.get("id")}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """Return the (created_at, id) position of a cursor.
+
+    Both values end up inside a PostgREST or() filter string, so the client-supplied
+    cursor must hold an ISO timestamp and a positive integer id and nothing else.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        created_at = datetime.fromisoformat(data["created_at"])
+        row_id = data["id"]
+        if not isinstance(row_id, int) or isinstance(row_id, bool) or row_id < 1:
+            raise ValueError(f"bad id {row_id!r}")
+        return created_at.isoformat(), row_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def escape_like(value: str) -> str:
+    """Escape LIKE wildcards so a search term only matches literally."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def select_fields(fields: Optional[str], allowed: Iterable[str]) -> str:
+    """Build a select() column list from a comma-separated `fields` parameter.
+
+    id and created_at are always included because the cursor needs them.
+    """
+    if not fields:
+        return "*"
+    allowed = set(allowed)
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    columns = ["id", "created_at"] + [f for f in requested if f not in ("id", "created_at")]
+    # Hyphenated legacy column names must be quoted for PostgREST
+    return ",".join(f'"{c}"' if "-" in c else c for c in columns)
+
+
+def paginate(query: Any, limit: int, cursor: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Apply newest-first keyset pagination and return (rows, next_cursor)."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.or_(f"created_at.lt.{created_at},and(created_at.eq.{created_at},id.lt.{row_id})")
+    response = query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1).execute()
+    rows = response.data or []
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def etag_response(request: Request, body: Dict[str, Any]) -> Response:
+    """Return 304 when If-None-Match matches the body's ETag, else the JSON body with its ETag."""
+    payload = json.dumps(body, sort_keys=True, separators=(",", ":"), default=str)
+    etag = '"' + hashlib.sha1(payload.encode("utf-8")).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match") or ""
+    if etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=json.loads(payload), headers=headers)
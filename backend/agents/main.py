@@ -1,23 +1,40 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import os
+import asyncio
 from dotenv import load_dotenv
 
-from runner import run_agents, run_qai_tests, run_suites_for_result
+from runner import run_agents, run_qai_tests, run_suites_for_result, enqueue_result
+from recovery import recover_orphaned_tests
 from database import (
-    _has_client
+    _has_client,
+    get_write_queue,
 )
+from leases import get_lease_manager
+from singleflight import SingleFlight
+from cache import get_read_cache
+from jobqueue import get_job_queue, worker_mode_enabled
+from concurrency import get_concurrency_limiter
+from spool import get_screenshot_spool, spool_enabled
 
 load_dotenv()
 
+# One write-behind journal per runner process (QAI_RUNNER_NAME keeps it stable across restarts)
+os.environ.setdefault(
+    "QAI_WRITE_JOURNAL", f"/tmp/qai/write_journal-{os.getenv('QAI_RUNNER_NAME') or os.getenv('PORT', '8000')}.jsonl"
+)
+
 app = FastAPI(
     title="QAI Agent Runner API", 
     version="1.0.0",
     description="FastAPI server for QAI autonomous testing agents"
 )
 
+# Duplicate /run-result and /run-suite requests share one in-flight run
+run_requests = SingleFlight()
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -58,6 +75,8 @@ class UpdateTestRequest(BaseModel):
 
 class RunSuiteRequest(BaseModel):
     suite_id: int
+    idempotency_key: Optional[str] = None
+    fail_fast: Optional[bool] = None  # default QAI_FAIL_FAST
 
 class AgentRunRequest(BaseModel):
     spec: Dict[str, Any]
@@ -69,6 +88,25 @@ class MultiAgentRunRequest(BaseModel):
 
 class RunResultRequest(BaseModel):
     result_id: int
+    priority: Optional[int] = 0
+    reruns: Optional[int] = None
+    fail_fast: Optional[bool] = None
+    resume: Optional[bool] = False  # retry: keep PASSED tests, run the rest again
+    idempotency_key: Optional[str] = None
+
+@app.on_event("startup")
+async def recover_interrupted_runs():
+    """Requeue tests orphaned by a crashed runner and optionally resume their results."""
+    # Replay DB writes journaled before the last shutdown
+    get_write_queue().start()
+    result_ids = await recover_orphaned_tests()
+    if result_ids and os.getenv("QAI_AUTO_RESUME", "0").lower() in ("1", "true", "yes"):
+        for result_id in result_ids:
+            print(f"[API] Auto-resuming result_id: {result_id}")
+            # Through run_requests so a concurrent /run-result for the same id joins this run
+            run = enqueue_result if worker_mode_enabled() else run_suites_for_result
+            # Only the interrupted tests run again; finished verdicts are kept
+            asyncio.create_task(run_requests.do(f"result:{result_id}", lambda rid=result_id: run(rid, resume="recover")))
 
 @app.get("/health")
 async def health_check():
@@ -84,20 +122,38 @@ async def health_check():
     print(f"[API] Health check response: {response}")
     return response
 
+@app.get("/metrics")
+async def metrics():
+    """Runner metrics: admission queue depth, wait times, container leases and subsystem counters"""
+    return {
+        "admission": get_lease_manager().stats(),
+        "run_requests": run_requests.snapshot(),
+        "read_cache": get_read_cache().stats(),
+        "db_writes": get_write_queue().snapshot(),
+        "concurrency": get_concurrency_limiter().snapshot(),
+        "jobs": get_job_queue().stats() if worker_mode_enabled() else None,
+        "screenshot_spool": get_screenshot_spool().snapshot() if spool_enabled() else None,
+    }
+
 # Agent execution endpoints
 
 @app.post("/run-suite")
-async def run_suite_endpoint(request: RunSuiteRequest):
+async def run_suite_endpoint(request: RunSuiteRequest, idempotency_key: Optional[str] = Header(None)):
     """
     Run a test suite by ID - This is the main endpoint called by the CICD pipeline
     """
     suite_id = request.suite_id
+    key = idempotency_key or request.idempotency_key
     print(f"[API] Starting suite execution for suite_id: {suite_id}")
     print(f"[API] Request received at: {__import__('datetime').datetime.now().isoformat()}")
     
     try:
         print(f"[API] Calling run_qai_tests for suite_id: {suite_id}")
-        result = await run_qai_tests(suite_id)
+        result = await run_requests.do(
+            f"suite:{suite_id}",
+            lambda: run_qai_tests(suite_id, request.fail_fast),
+            idempotency_key=f"run-suite:{key}" if key else None,
+        )
         print(f"[API] run_qai_tests completed for suite_id: {suite_id}")
         print(f"[API] Result status: {result.get('agent_result', {}).get('status', 'unknown')}")
         
@@ -144,30 +200,46 @@ async def root():
             "health": "/health",
             "run_suite": "/run-suite",
             "run_result": "/run-result",
-            "run_agents": "/run-agents"
+            "run_agents": "/run-agents",
+            "metrics": "/metrics"
         }
     }
 
 
 @app.post("/run-result")
-async def run_result_endpoint(request: RunResultRequest):
-    """Run all suites and tests for a given result_id."""
+async def run_result_endpoint(request: RunResultRequest, idempotency_key: Optional[str] = Header(None)):
+    """Run all suites and tests for a given result_id (duplicate requests share one run)."""
     result_id = request.result_id
+    key = idempotency_key or request.idempotency_key
     print(f"[API] Starting result execution for result_id: {result_id}")
     try:
-        summary = await run_suites_for_result(result_id)
-        status = summary.get("run_status")
-        if status == "PASSED" or status == "FAILED":
-            return {
-                "status": "success",
-                "message": f"Result {result_id} executed",
-                "data": summary,
-            }
+        if worker_mode_enabled():
+            if request.reruns:
+                raise HTTPException(status_code=400, detail="reruns are not supported with QAI_WORKER_MODE")
+            # Workers (worker.py) pick the suites up from the shared job queue
+            run = lambda: enqueue_result(
+                result_id, request.priority or 0, "retry" if request.resume else None, request.fail_fast
+            )
+        else:
+            run = lambda: run_suites_for_result(
+                result_id,
+                request.priority or 0,
+                request.reruns,
+                request.fail_fast,
+                "retry" if request.resume else None,
+            )
+        summary = await run_requests.do(
+            f"result:{result_id}",
+            run,
+            idempotency_key=f"run-result:{key}" if key else None,
+        )
         return {
             "status": "success",
             "message": f"Result {result_id} executed",
             "data": summary,
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[API] run_result failed: {e}")
         raise HTTPException(status_code=500, detail=f"Result execution failed: {str(e)}")
@@ -0,0 +1,94 @@
+"""
+Pre-flight probe of the deployment under test.
+
+Before any container is leased, the base URL and the routes mentioned in test
+summaries are fetched concurrently. If the site is unreachable or answers 5xx,
+the result fails immediately as an infrastructure error instead of sending
+every agent to discover it. 4xx answers are reported as warnings because a test
+may be about a missing or protected page.
+"""
+import asyncio
+import os
+import re
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List, Optional
+from urllib.parse import urljoin, urlparse
+
+# "/login", "/settings/profile" (preceded by start, whitespace, quote or paren)
+ROUTE_PATTERN = re.compile(r"(?:^|(?<=[\s\"'(`]))(/[A-Za-z0-9_\-./~%]*[A-Za-z0-9_\-~%/])")
+URL_PATTERN = re.compile(r"https?://[^\s\"'<>)`]+")
+
+
+def preflight_enabled() -> bool:
+    return os.getenv("QAI_PREFLIGHT", "1").lower() not in ("0", "false", "no")
+
+
+def extract_routes(base_url: str, specs: List[Dict[str, Any]], limit: Optional[int] = None) -> List[str]:
+    """Absolute URLs on the deployment's host for the routes named in test summaries."""
+    limit = int(limit if limit is not None else os.getenv("QAI_PREFLIGHT_MAX_ROUTES", 10))
+    host = urlparse(base_url).netloc
+    urls: List[str] = []
+    for spec in specs:
+        for test in spec.get("tests") or []:
+            text = " ".join(str(test.get(k) or "") for k in ("summary", "name"))
+            for url in URL_PATTERN.findall(text):
+                url = url.rstrip(".,;:")
+                if urlparse(url).netloc == host:
+                    urls.append(url)
+            for path in ROUTE_PATTERN.findall(text):
+                if not path.startswith("//"):
+                    urls.append(urljoin(base_url.rstrip("/") + "/", path.lstrip("/")))
+    unique = list(dict.fromkeys(u for u in urls if u.rstrip("/") != base_url.rstrip("/")))
+    return unique[:limit]
+
+
+def _fetch(url: str, timeout: float) -> Dict[str, Any]:
+    started = time.perf_counter()
+    request = urllib.request.Request(url, headers={"User-Agent": "qai-preflight"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as resp:
+            resp.read(1024)
+            status: Optional[int] = resp.status
+        error = None
+    except urllib.error.HTTPError as e:
+        status, error = e.code, None
+    except Exception as e:
+        status, error = None, f"{type(e).__name__}: {getattr(e, 'reason', e)}"
+    return {
+        "url": url,
+        "status": status,
+        "error": error,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+async def run_preflight(base_url: str, specs: List[Dict[str, Any]], timeout: Optional[float] = None) -> Dict[str, Any]:
+    """Probe the base URL and key routes concurrently.
+
+    Returns {ok, failures, warnings, checked, duration_ms}; ok is False when any
+    probe is unreachable or answers 5xx.
+    """
+    timeout = float(timeout if timeout is not None else os.getenv("QAI_PREFLIGHT_TIMEOUT_S", 5))
+    started = time.perf_counter()
+    urls = [base_url] + extract_routes(base_url, specs)
+    checked = await asyncio.gather(*(asyncio.to_thread(_fetch, url, timeout) for url in urls))
+    failures = [c for c in checked if c["status"] is None or c["status"] >= 500]
+    warnings = [c for c in checked if c["status"] is not None and 400 <= c["status"] < 500]
+    return {
+        "ok": not failures,
+        "failures": failures,
+        "warnings": warnings,
+        "checked": list(checked),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def describe_failure(report: Dict[str, Any]) -> str:
+    """One-line reason for a failed pre-flight, e.g. for the run summary."""
+    parts = [
+        f"{f['url']} -> {f['status'] if f['status'] is not None else f['error']}"
+        for f in report.get("failures") or []
+    ]
+    return "Deployment pre-flight failed: " + "; ".join(parts)
@@ -1,20 +1,14 @@
-from typing import List, Dict
+from typing import Dict
 import os
 
 from dotenv import load_dotenv
 load_dotenv()
 
 
-def build_agent_instructions(tests: List[Dict], suite: Dict) -> str:
-	"""Build optimized instructions for autonomous agent testing with concise STEP emissions."""
-	base_url = os.getenv("DEPLOYMENT_URL", "https://qai-zeta.vercel.app")
-
-	# Create concise, UI-friendly testing instructions
-	instructions = f"""
-You are an autonomous QA testing agent for web applications. Your goal is to thoroughly test the deployment at {base_url}.
-
-SUITE: {suite['name']}
-TOTAL TESTS: {len(tests)}
+# Static preamble shared by every suite and run. Keep anything that varies per
+# deployment, suite or test OUT of this string so providers can cache it.
+AGENT_PREAMBLE = """
+You are an autonomous QA testing agent for web applications. Your goal is to thoroughly test the deployment named in the TEST CONTEXT message.
 
 COMMUNICATION RULES (MANDATORY):
 - Only output concise major steps in the exact format: "STEP: <short gerund phrase>".
@@ -26,23 +20,11 @@ COMMUNICATION RULES (MANDATORY):
 - After completing each test scenario, output exactly one line: "RESULT: PASSED" or "RESULT: FAILED".
 
 TESTING APPROACH:
-1. Navigate to the base URL: {base_url}
+1. Navigate to the base URL given in the TEST CONTEXT
 2. Execute each scenario's intent
 3. Verify the expected destination/state
 4. Document ONLY major actions using STEP lines in gerund form
 
-SPECIFIC TEST SCENARIOS:
-"""
-
-	for i, test in enumerate(tests, 1):
-		instructions += f"""
-{i}. {test['name']}
-   Description: {test.get('summary', 'No description provided')}
-   Priority: {'HIGH' if 'critical' in test.get('summary', '').lower() else 'MEDIUM'}
-"""
-
-	instructions += """
-
 TESTING GUIDELINES:
 - Be thorough, but keep communication to STEP lines only
 - Take screenshots at key moments for your own reasoning, but do not describe them
@@ -53,4 +35,27 @@ FINAL VERDICT FORMAT (MANDATORY):
 - After each scenario, output exactly one line: RESULT: PASSED or RESULT: FAILED
 """
 
-	return instructions
\ No newline at end of file
+
+def get_base_url() -> str:
+	return os.getenv("DEPLOYMENT_URL", "https://qai-zeta.vercel.app")
+
+
+def priority_for(test: Dict) -> str:
+	"""Return HIGH for tests whose summary mentions 'critical', MEDIUM otherwise."""
+	return 'HIGH' if 'critical' in (test.get('summary') or '').lower() else 'MEDIUM'
+
+
+def build_agent_preamble() -> str:
+	"""Return the static, cacheable system prompt used for every agent."""
+	return AGENT_PREAMBLE
+
+
+def build_test_context(test: Dict, suite: Dict, index: int, total: int) -> str:
+	"""Build the small per-suite/per-test tail sent ahead of a test's instructions."""
+	return f"""TEST CONTEXT:
+BASE URL: {get_base_url()}
+SUITE: {suite.get('name')}
+TEST {index} OF {total}: {test.get('name')}
+Priority: {priority_for(test)}
+"""
+
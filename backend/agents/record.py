@@ -5,6 +5,10 @@ Notes:
   - Each function is self-contained (no module-level helper dependencies),
     so execution environments that serialize only the function body will work.
   - State is stored at /tmp/cua_recorder/state.json
+  - stop_recording only stops ffmpeg. upload_video posts the file to the
+    upload endpoint; with direct uploads (storage.py) the runner instead passes
+    pre-signed part URLs to upload_parts, which PUTs the parts straight to
+    object storage, and falls back to upload_video if that fails.
 """
 
 
@@ -91,10 +95,10 @@ def start_recording(output_dir=None, fps=None, width=None, height=None, display=
         return {"ok": False, "error": repr(e)}
 
 
-def stop_recording(upload_url=None):
+def stop_recording():
     """Stop ffmpeg recording using the persisted PID.
 
-    Returns a dict with { ok, path }.
+    The file stays in the VM for upload_video or upload_parts. Returns a dict with { ok, path, bytes }.
     """
     # Local imports for serialized execution environments
     import os as _os
@@ -102,8 +106,6 @@ def stop_recording(upload_url=None):
     import time as _time
     import signal as _signal
     from pathlib import Path as _Path
-    import urllib.request as _urlreq
-    import uuid as _uuid
 
     state_path = _Path("/tmp/cua_recorder/state.json")
     data = {}
@@ -139,56 +141,104 @@ def stop_recording(upload_url=None):
             state_path.write_text(_json.dumps({}), encoding="utf-8")
         except Exception:
             pass
-        # Try upload to server
-        upload = {"ok": False}
+        size = _os.path.getsize(path) if path and _os.path.exists(path) else None
+        return {"ok": True, "path": path, "bytes": size}
+    except Exception as e:
+        print(f"Error: {e}")
+        return {"ok": False, "error": repr(e)}
+
+
+def upload_video(path, upload_url=None):
+    """POST a stopped recording to the upload endpoint as multipart form data.
+
+    Used without an object store, or when a direct upload to it fails. Returns a dict with { ok, response }.
+    """
+    # Local imports for serialized execution environments
+    import os as _os
+    import json as _json
+    import urllib.request as _urlreq
+    import uuid as _uuid
+
+    VIDEO_UPLOAD_URL = "https://qai-ashy.vercel.app/upload-video"
+
+    if not path or not _os.path.exists(path):
+        return {"ok": False, "error": "video_not_found", "path": path}
+    try:
+        boundary = f"----WebKitFormBoundary{_uuid.uuid4().hex}"
+        CRLF = "\r\n"
+        with open(path, "rb") as f:
+            file_bytes = f.read()
+        body_prefix = (
+            f"--{boundary}{CRLF}"
+            f"Content-Disposition: form-data; name=\"video\"; filename=\"{_os.path.basename(path)}\"{CRLF}"
+            f"Content-Type: video/mp4{CRLF}{CRLF}"
+        ).encode("utf-8")
+        body = body_prefix + file_bytes + (CRLF + f"--{boundary}--{CRLF}").encode("utf-8")
+        req = _urlreq.Request(
+            url=upload_url or VIDEO_UPLOAD_URL,
+            data=body,
+            method="POST",
+            headers={
+                "Content-Type": f"multipart/form-data; boundary={boundary}",
+                "Content-Length": str(len(body)),
+            },
+        )
+        with _urlreq.urlopen(req, timeout=30) as resp:
+            resp_body = resp.read().decode("utf-8", errors="ignore")
         try:
-            VIDEO_UPLOAD_URL = "https://qai-ashy.vercel.app/upload-video"
-
-            # Determine upload URL: param overrides env, skip if none
-            _url = upload_url
-            if not _url:
-                _url = VIDEO_UPLOAD_URL
-            # print(f"Upload URL: {_url}")
-
-            if path and _os.path.exists(path) and _url:
-                boundary = f"----WebKitFormBoundary{_uuid.uuid4().hex}"
-                CRLF = "\r\n"
-                # Build multipart body
-                with open(path, "rb") as f:
-                    file_bytes = f.read()
-                parts = []
-                parts.append(f"--{boundary}{CRLF}")
-                parts.append(
-                    "Content-Disposition: form-data; name=\"video\"; filename=\"" + _os.path.basename(path) + "\"" + CRLF
-                )
-                parts.append("Content-Type: video/mp4" + CRLF + CRLF)
-                body_prefix = ("".join(parts)).encode("utf-8")
-                body_suffix = (CRLF + f"--{boundary}--{CRLF}").encode("utf-8")
-                body = body_prefix + file_bytes + body_suffix
-                # print(f"Body: {body}")
+            return {"ok": True, "response": _json.loads(resp_body)}
+        except Exception:
+            return {"ok": True, "response": {"raw": resp_body}}
+    except Exception as e:
+        return {"ok": False, "error": repr(e)}
+
+
+def upload_parts(path, part_urls, part_size, concurrency=None, retries=3):
+    """PUT consecutive `part_size` slices of `path` to pre-signed multipart part URLs in parallel.
+
+    Returns a dict with { ok, parts: [{ PartNumber, ETag }], bytes, elapsed_s }.
+    """
+    # Local imports for serialized execution environments
+    import os as _os
+    import time as _time
+    import urllib.request as _urlreq
+    from concurrent.futures import ThreadPoolExecutor as _Pool
+
+    started = _time.monotonic()
+    try:
+        size = _os.path.getsize(path)
+    except Exception as e:
+        return {"ok": False, "error": repr(e)}
+    part_size = int(part_size)
+    needed = max(1, -(-size // part_size))
+    if needed > len(part_urls):
+        return {"ok": False, "error": f"need {needed} part urls, got {len(part_urls)}", "bytes": size}
+
+    def _put(index):
+        with open(path, "rb") as f:
+            f.seek(index * part_size)
+            data = f.read(part_size)
+        last_error = None
+        for attempt in range(retries):
+            try:
                 req = _urlreq.Request(
-                    url=_url,
-                    data=body,
-                    method="POST",
-                    headers={
-                        "Content-Type": f"multipart/form-data; boundary={boundary}",
-                        "Content-Length": str(len(body)),
-                    },
+                    url=part_urls[index], data=data, method="PUT", headers={"Content-Length": str(len(data))}
                 )
-                with _urlreq.urlopen(req, timeout=30) as resp:
-                    resp_body = resp.read().decode("utf-8", errors="ignore")
-                    try:
-                        upload_json = _json.loads(resp_body)
-                    except Exception:
-                        upload_json = {"raw": resp_body}
-                    upload = {"ok": True, "response": upload_json}
-        except Exception as _e:
-            upload = {"ok": False, "error": repr(_e)}
-        print(f"Upload: {upload}")
-        return {"ok": True, "path": path, "upload": upload}
+                with _urlreq.urlopen(req, timeout=120) as resp:
+                    resp.read()
+                    return {"PartNumber": index + 1, "ETag": resp.headers.get("ETag")}
+            except Exception as e:
+                last_error = e
+                _time.sleep(0.5 * 2 ** attempt)
+        raise RuntimeError(f"part {index + 1}: {last_error!r}")
+
+    workers = max(1, min(int(concurrency or _os.getenv("QAI_S3_UPLOAD_CONCURRENCY", 4)), needed))
+    try:
+        with _Pool(max_workers=workers) as pool:
+            parts = list(pool.map(_put, range(needed)))
     except Exception as e:
-        print(f"Error: {e}")
-        return {"ok": False, "error": repr(e)}
+        return {"ok": False, "error": repr(e), "bytes": size}
+    return {"ok": True, "parts": parts, "bytes": size, "elapsed_s": round(_time.monotonic() - started, 3)}
 
 
 def status():
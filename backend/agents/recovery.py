@@ -0,0 +1,64 @@
+"""
+Checkpoint recovery and resume of results.
+
+Tests are checkpointed QUEUED -> RUNNING -> PASSED/FAILED/CANCELLED with a
+heartbeat while they run. When a runner dies, recover_orphaned_tests requeues
+its stale RUNNING tests on the next startup and returns their results, which
+are then resumed with resume="recover": only the interrupted tests run again and
+every verdict already reached is kept. A client retrying a result asks for
+resume="retry" instead, which keeps only PASSED tests so failed ones get another
+run. Without resume every test of the result runs.
+"""
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from database import get_orphaned_running_tests, get_result_ids_for_suites, get_write_queue, update_test_fields
+
+# Verdicts each resume mode keeps instead of running the test again
+RESUME_KEEP = {
+    "recover": ("PASSED", "FAILED"),
+    "retry": ("PASSED",),
+}
+
+
+def split_resumed(
+    specs: List[Dict[str, Any]], resume: Optional[str] = None
+) -> Tuple[List[Tuple[Dict[str, Any], Dict[str, Any]]], List[Dict[str, Any]]]:
+    """Split a result's suites into kept (spec, test) verdicts and the suites left to run."""
+    if resume is not None and resume not in RESUME_KEEP:
+        raise ValueError(f"unknown resume mode {resume!r} (expected one of {sorted(RESUME_KEEP)})")
+    keep = RESUME_KEEP.get(resume, ())
+    kept: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+    pending_specs: List[Dict[str, Any]] = []
+    for spec in specs:
+        pending_tests = []
+        for test in spec.get("tests") or []:
+            if test.get("run_status") in keep:
+                kept.append((spec, test))
+            else:
+                pending_tests.append(test)
+        if pending_tests:
+            pending_specs.append({**spec, "tests": pending_tests})
+    return kept, pending_specs
+
+
+async def recover_orphaned_tests() -> List[int]:
+    """Reset tests stranded in RUNNING by a dead runner back to QUEUED.
+
+    A test is orphaned when its heartbeat is older than QAI_ORPHAN_AFTER_S.
+    Returns the ids of the affected results so they can be resumed.
+    """
+    stale_after = float(os.getenv("QAI_ORPHAN_AFTER_S", 300))
+    stale_before = datetime.fromtimestamp(time.time() - stale_after, timezone.utc).isoformat()
+    # Journaled writes from before a restart may already have finished some of these tests
+    await get_write_queue().flush(float(os.getenv("QAI_WRITE_FLUSH_TIMEOUT_S", 30)))
+    orphans = await get_orphaned_running_tests(stale_before)
+    for row in orphans:
+        print(f"[runner] orphaned test {row.get('id')} ({row.get('name')}) from runner {row.get('runner_id')}")
+        await update_test_fields(row["id"], {"run_status": "QUEUED"})
+    result_ids = await get_result_ids_for_suites(sorted({row["suite_id"] for row in orphans if row.get("suite_id") is not None}))
+    if result_ids:
+        print(f"[runner] results with orphaned tests: {result_ids}")
+    return result_ids
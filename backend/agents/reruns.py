@@ -0,0 +1,115 @@
+"""
+Re-execution of failed tests with quorum verdicts.
+
+Failed tests are queued as N replica jobs as soon as their suite finishes.
+Container workers that run out of primary work pick replicas up, so
+confirmation overlaps with suites that are still running. Once fail-fast stops
+the result (stop_event), the stage stands down and leaves verdicts alone.
+"""
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+RunReplica = Callable[[Dict[str, Any], Dict[str, Any], str], Awaitable[bool]]
+
+
+def quorum_verdict(votes: List[bool]) -> Dict[str, Any]:
+    """Majority verdict over all runs of a test (ties fail) plus a flakiness score.
+
+    Flakiness is the share of runs that disagree with the majority (0 = stable).
+    """
+    passes = sum(1 for v in votes if v)
+    fails = len(votes) - passes
+    return {
+        "votes": ["PASSED" if v else "FAILED" for v in votes],
+        "passed": passes > fails,
+        "flakiness": round(min(passes, fails) / len(votes), 3) if votes else 0.0,
+    }
+
+
+def configured_replicas() -> int:
+    return max(0, int(os.getenv("QAI_RERUN_FAILED", 0)))
+
+
+class RerunStage:
+    """Shared replica queue drained by idle container workers."""
+
+    def __init__(
+        self,
+        replicas: int,
+        workers: int,
+        run_replica: RunReplica,
+        poll_interval: float = 1.0,
+        stop_event: Optional[asyncio.Event] = None,
+    ) -> None:
+        self.replicas = replicas
+        self.stop_event = stop_event
+        self.run_replica = run_replica
+        self.poll_interval = poll_interval
+        self._jobs: "asyncio.Queue[tuple]" = asyncio.Queue()
+        self._primary_remaining = workers
+        self._votes: Dict[int, List[bool]] = {}
+        self._tests: Dict[int, Dict[str, Any]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.replicas > 0
+
+    @property
+    def stopped(self) -> bool:
+        return self.stop_event is not None and self.stop_event.is_set()
+
+    def submit(self, spec: Dict[str, Any], suite_results: List[Dict[str, Any]]) -> None:
+        """Queue replicas for every FAILED test of a finished suite (not CANCELLED ones)."""
+        if not self.enabled or self.stopped:
+            return
+        for test_result in suite_results:
+            status = test_result.get("run_status")
+            if getattr(status, "value", status) != "FAILED":
+                continue
+            key = id(test_result)
+            self._tests[key] = test_result
+            self._votes[key] = [False]
+            for _ in range(self.replicas):
+                self._jobs.put_nowait((spec, test_result))
+            print(f"[reruns] queued {self.replicas} replicas of {test_result.get('name')} (suite {spec.get('suite_id')})")
+
+    def primary_finished(self) -> None:
+        self._primary_remaining -= 1
+
+    async def drain(self, container: str) -> None:
+        """Run replica jobs on this container until all primary work is done and the queue is empty."""
+        if not self.enabled:
+            return
+        while not self.stopped:
+            try:
+                spec, test_result = await asyncio.wait_for(self._jobs.get(), self.poll_interval)
+            except asyncio.TimeoutError:
+                if self._primary_remaining <= 0 and self._jobs.empty():
+                    return
+                continue
+            if self.stopped:
+                return
+            try:
+                passed = await self.run_replica(spec, test_result, container)
+            except Exception as e:
+                print(f"[reruns] replica of {test_result.get('name')} errored on {container}: {e}")
+                passed = False
+            self._votes[id(test_result)].append(passed)
+
+    def verdicts(self) -> List[Dict[str, Any]]:
+        """Apply quorum verdicts to the original test results and return them.
+
+        Nothing is applied once fail-fast stopped the result: tests keep the
+        verdict (FAILED or CANCELLED) they were recorded with.
+        """
+        applied: List[Dict[str, Any]] = []
+        if self.stopped:
+            return applied
+        for key, votes in self._votes.items():
+            test_result = self._tests[key]
+            verdict = quorum_verdict(votes)
+            test_result["test_success"] = verdict["passed"]
+            test_result["rerun"] = verdict
+            applied.append(test_result)
+        return applied
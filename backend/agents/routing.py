@@ -0,0 +1,95 @@
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+from prompts import priority_for
+
+# Keywords that usually mean a multi-step or stateful flow
+COMPLEX_KEYWORDS = (
+    "login", "log in", "sign in", "sign up", "signup", "register", "auth", "password",
+    "checkout", "payment", "cart", "upload", "form", "submit", "race", "concurrent",
+    "edge case", "error path", "multi-step", "session",
+)
+
+# Phrases in a verdict message that signal the agent wasn't sure
+HEDGE_PHRASES = (
+    "unable to", "could not", "couldn't", "not sure", "unclear", "cannot confirm",
+    "can't confirm", "inconclusive", "may have", "might have", "appears to",
+)
+
+
+def estimate_complexity(test: Dict[str, Any]) -> int:
+    """Heuristic complexity score from a test's summary/instructions (higher = harder)."""
+    parts: List[str] = [test.get("summary") or ""]
+    for msg in test.get("instructions") or []:
+        if isinstance(msg, dict) and isinstance(msg.get("content"), str):
+            parts.append(msg["content"])
+    text = " ".join(parts).lower()
+
+    score = sum(1 for kw in COMPLEX_KEYWORDS if kw in text)
+    # Long descriptions and chained actions ("then", "and then", ";") add weight
+    score += len(text.split()) // 40
+    score += len(re.findall(r"\bthen\b|;", text))
+    if priority_for(test) == "HIGH":
+        score += 2
+    return score
+
+
+def is_low_confidence(text: Optional[str]) -> bool:
+    if not text:
+        return False
+    lowered = text.lower()
+    return any(p in lowered for p in HEDGE_PHRASES)
+
+
+class ModelRouter:
+    """Routes simple tests to a fast model and escalates to the strong model when needed.
+
+    Routing is active only when a fast model is configured (CUA_MODEL_FAST);
+    otherwise every test runs on the strong model.
+    """
+
+    def __init__(self, strong_model: str, fast_model: Optional[str] = None, threshold: Optional[int] = None) -> None:
+        self.strong_model = strong_model
+        self.fast_model = fast_model if fast_model is not None else os.getenv("CUA_MODEL_FAST")
+        self.threshold = int(threshold if threshold is not None else os.getenv("QAI_ROUTER_COMPLEXITY_THRESHOLD", 3))
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.fast_model) and self.fast_model != self.strong_model
+
+    def route(self, test: Dict[str, Any]) -> Dict[str, Any]:
+        """Pick the starting tier for a test and return the routing record."""
+        score = estimate_complexity(test)
+        if self.enabled and score < self.threshold:
+            tier, model = "fast", self.fast_model
+        else:
+            tier, model = "strong", self.strong_model
+        return {
+            "tier": tier,
+            "initial_model": model,
+            "final_model": model,
+            "complexity": score,
+            "escalated": False,
+            "reason": None,
+            "attempts": [],
+        }
+
+    def escalation_reason(self, decision: Dict[str, Any], run_status: str, verdict_text: Optional[str]) -> Optional[str]:
+        """Return why the last attempt should be retried on the strong model, or None."""
+        if decision["final_model"] == self.strong_model or run_status == "CANCELLED":
+            return None
+        if run_status == "FAILED":
+            return "failed"
+        if run_status != "PASSED":
+            # Trajectory ended (budget exhausted or gave up) without an explicit verdict
+            return "no_verdict"
+        if is_low_confidence(verdict_text):
+            return "low_confidence"
+        return None
+
+    def escalate(self, decision: Dict[str, Any], reason: str) -> str:
+        decision["escalated"] = True
+        decision["reason"] = reason
+        decision["final_model"] = self.strong_model
+        return self.strong_model
@@ -0,0 +1,186 @@
+"""
+Screenshot pre-processing for agent turns.
+
+Screenshots returned by the computer tool are downscaled and recompressed before
+they are sent to the model, and near-identical consecutive frames (by perceptual
+difference hash) have the older copy replaced with a tiny placeholder. Model
+coordinates are mapped back to the full-resolution screen before actions run.
+Frames held as spool references (spool.py) are read from disk here.
+"""
+import base64
+import io
+import os
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from agent.callbacks.base import AsyncCallbackHandler
+except ImportError:  # cua is only needed for the callbacks; the image helpers below work without it
+    AsyncCallbackHandler = object
+
+from spool import ScreenshotSpool, is_spool_ref
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; frames pass through untouched without it
+    Image = None
+
+# 1x1 transparent PNG used in place of a frame superseded by an identical one
+PLACEHOLDER_IMAGE_URL = (
+    "data:image/png;base64,"
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+
+def decode_data_url(url: str) -> Optional[bytes]:
+    """Return the raw bytes of a base64 data URL, or None if it isn't one."""
+    if not isinstance(url, str) or not url.startswith("data:") or "," not in url:
+        return None
+    header, payload = url.split(",", 1)
+    if ";base64" not in header:
+        return None
+    try:
+        return base64.b64decode(payload)
+    except Exception:
+        return None
+
+
+def dhash(image: Any, size: int = 8) -> int:
+    """Difference hash of a PIL image: one bit per horizontally adjacent pixel pair."""
+    gray = image.convert("L").resize((size + 1, size))
+    pixels = gray.tobytes()
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (1 if left > right else 0)
+    return bits
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def downscale(data: bytes, max_width: int, quality: int) -> Tuple[bytes, Tuple[int, int], Tuple[int, int], int]:
+    """Resize to at most max_width and recompress as JPEG.
+
+    Returns (jpeg_bytes, original_size, new_size, dhash).
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        original_size = img.size
+        frame_hash = dhash(img)
+        img = img.convert("RGB")
+        if img.width > max_width:
+            height = max(1, round(img.height * max_width / img.width))
+            img = img.resize((max_width, height), Image.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=quality, optimize=True)
+        return buf.getvalue(), original_size, img.size, frame_hash
+
+
+class ScreenshotPreprocessor(AsyncCallbackHandler):
+    """Agent callback that shrinks screenshots and suppresses duplicate frames."""
+
+    def __init__(
+        self,
+        max_width: Optional[int] = None,
+        quality: Optional[int] = None,
+        dedup_distance: Optional[int] = None,
+        cache_size: int = 64,
+        spool: Optional[ScreenshotSpool] = None,
+    ) -> None:
+        self.max_width = int(max_width or os.getenv("CUA_SCREENSHOT_MAX_WIDTH", 1024))
+        self.quality = int(quality or os.getenv("CUA_SCREENSHOT_QUALITY", 70))
+        # Frames whose dhash differs by at most this many bits count as identical (-1 disables)
+        self.dedup_distance = int(dedup_distance if dedup_distance is not None else os.getenv("CUA_SCREENSHOT_DEDUP_DISTANCE", 2))
+        self.scale: Tuple[float, float] = (1.0, 1.0)
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._cache_size = cache_size
+        self.spool = spool
+        self.stats = {"frames": 0, "bytes_in": 0, "bytes_out": 0, "duplicates_suppressed": 0}
+
+    def _process(self, url: str) -> Optional[Dict[str, Any]]:
+        cached = self._cache.get(url)
+        if cached is not None:
+            self._cache.move_to_end(url)
+            return cached
+        if is_spool_ref(url):
+            data = self.spool.read(url) if self.spool is not None else None
+        else:
+            data = decode_data_url(url)
+        if data is None or Image is None:
+            return None
+        try:
+            jpeg, (ow, oh), (nw, nh), frame_hash = downscale(data, self.max_width, self.quality)
+        except Exception as e:
+            print(f"[screenshots] preprocessing failed: {e}")
+            return None
+        processed = {
+            "url": "data:image/jpeg;base64," + base64.b64encode(jpeg).decode("ascii"),
+            "hash": frame_hash,
+            "scale": (ow / nw, oh / nh),
+        }
+        self.stats["frames"] += 1
+        self.stats["bytes_in"] += len(data)
+        self.stats["bytes_out"] += len(jpeg)
+        self._cache[url] = processed
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return processed
+
+    async def on_llm_start(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        result = list(messages)
+        prev_index: Optional[int] = None
+        prev_hash: Optional[int] = None
+        # The model's coordinates refer to the latest frame it sees, so the scale comes from that
+        # frame alone (1:1 when it went through untouched or there is none yet)
+        scale: Tuple[float, float] = (1.0, 1.0)
+        for i, msg in enumerate(result):
+            if not isinstance(msg, dict) or msg.get("type") != "computer_call_output":
+                continue
+            output = msg.get("output") or {}
+            processed = self._process(output.get("image_url")) if isinstance(output, dict) else None
+            if processed is None:
+                scale = (1.0, 1.0)
+                continue
+            if (
+                prev_index is not None
+                and self.dedup_distance >= 0
+                and hamming(prev_hash, processed["hash"]) <= self.dedup_distance
+            ):
+                # The newer frame carries the same picture; drop the older copy's pixels
+                prev = result[prev_index]
+                result[prev_index] = {**prev, "output": {**prev["output"], "image_url": PLACEHOLDER_IMAGE_URL}}
+                self.stats["duplicates_suppressed"] += 1
+            result[i] = {**msg, "output": {**output, "image_url": processed["url"]}}
+            prev_index, prev_hash = i, processed["hash"]
+            scale = processed["scale"]
+        self.scale = scale
+        return result
+
+    async def on_llm_end(self, output: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        sx, sy = self.scale
+        if sx == 1.0 and sy == 1.0:
+            return output
+        mapped = []
+        for item in output:
+            if isinstance(item, dict) and item.get("type") == "computer_call" and isinstance(item.get("action"), dict):
+                item = {**item, "action": scale_action(item["action"], sx, sy)}
+            mapped.append(item)
+        return mapped
+
+
+def scale_action(action: Dict[str, Any], sx: float, sy: float) -> Dict[str, Any]:
+    """Map an action's coordinates from downscaled screenshot space back to the screen."""
+    scaled = dict(action)
+    if isinstance(scaled.get("x"), (int, float)):
+        scaled["x"] = round(scaled["x"] * sx)
+    if isinstance(scaled.get("y"), (int, float)):
+        scaled["y"] = round(scaled["y"] * sy)
+    if isinstance(scaled.get("path"), list):
+        scaled["path"] = [
+            {**p, "x": round(p["x"] * sx), "y": round(p["y"] * sy)} if isinstance(p, dict) and "x" in p and "y" in p else p
+            for p in scaled["path"]
+        ]
+    return scaled
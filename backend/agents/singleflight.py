@@ -0,0 +1,65 @@
+"""
+Coalescing of duplicate run requests.
+
+Concurrent calls with the same key (e.g. "result:<id>") share one in-flight
+execution and all get its result, whether or not they carry an idempotency key.
+The idempotency key only names the finished result: it is replayed to later
+calls with that key for QAI_IDEMPOTENCY_TTL_S seconds. Callers namespace their
+idempotency keys per endpoint so one endpoint never replays another's response.
+"""
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+class SingleFlight:
+    def __init__(self, ttl: Optional[float] = None) -> None:
+        self.ttl = float(ttl if ttl is not None else os.getenv("QAI_IDEMPOTENCY_TTL_S", 3600))
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._done: Dict[str, Tuple[float, Any]] = {}
+        self.stats = {"calls": 0, "executions": 0, "coalesced": 0, "replayed": 0}
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for key in [k for k, (expires, _) in self._done.items() if expires < now]:
+            del self._done[key]
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]], idempotency_key: Optional[str] = None) -> Any:
+        """Run fn once per key at a time; duplicates await the same execution.
+
+        The execution runs as its own task, so a disconnecting caller doesn't
+        cancel the run for everyone else.
+        """
+        self.stats["calls"] += 1
+        self._expire()
+        if idempotency_key is not None and idempotency_key in self._done:
+            self.stats["replayed"] += 1
+            print(f"[singleflight] replaying finished run for {idempotency_key}")
+            return self._done[idempotency_key][1]
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            print(f"[singleflight] coalescing duplicate request for {key}")
+        else:
+            self.stats["executions"] += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+
+            def _finished(t: asyncio.Task, key: str = key) -> None:
+                if self._inflight.get(key) is t:
+                    del self._inflight[key]
+
+            task.add_done_callback(_finished)
+        if idempotency_key is not None:
+            # Joining a run started without (or with another) key still records this key's response
+            def _remember(t: asyncio.Task, idempotency_key: str = idempotency_key) -> None:
+                if not t.cancelled() and t.exception() is None:
+                    self._done[idempotency_key] = (time.monotonic() + self.ttl, t.result())
+
+            task.add_done_callback(_remember)
+        return await asyncio.shield(task)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "in_flight": sorted(self._inflight), "remembered": len(self._done)}
@@ -0,0 +1,206 @@
+"""
+Content-addressed on-disk spool for agent screenshots.
+
+Every computer call returns a full screenshot as a base64 data URL, which would
+otherwise stay in the agent's history and output dicts for the whole test. The
+ScreenshotSpooler callback writes each frame to QAI_SPOOL_DIR under its SHA-256
+(identical frames are stored once) and leaves a short "qai-spool://<sha>.png"
+reference in its place. References are turned back into image data only for
+the model call (ScreenshotPreprocessor reads them directly; the spooler's
+on_llm_start covers runs without it), so runner memory no longer grows per turn.
+
+prune() keeps the spool under QAI_SPOOL_MAX_MB by deleting the least recently
+used frames, but never one written or touched since the oldest test still in
+use() began: those may still be referenced by that test's history, step log or
+evidence upload.
+"""
+import asyncio
+import base64
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    from agent.callbacks.base import AsyncCallbackHandler
+except ImportError:  # cua is only needed for the callbacks; the spool itself works without it
+    AsyncCallbackHandler = object
+
+SPOOL_PREFIX = "qai-spool://"
+# Slack for coarse filesystem mtimes when comparing frames against use() start times
+MTIME_SLACK_S = 2.0
+
+
+def spool_enabled() -> bool:
+    return os.getenv("QAI_SCREENSHOT_SPOOL", "1").lower() not in ("0", "false", "no")
+
+
+def is_spool_ref(url: Any) -> bool:
+    return isinstance(url, str) and url.startswith(SPOOL_PREFIX)
+
+
+def ref_digest(ref: str) -> str:
+    """The SHA-256 part of a spool reference (stored with step log rows)."""
+    return ref[len(SPOOL_PREFIX):].split(".", 1)[0]
+
+
+class ScreenshotSpool:
+    def __init__(self, root: Optional[str] = None, max_mb: Optional[float] = None) -> None:
+        self.root = Path(root or os.getenv("QAI_SPOOL_DIR", "/tmp/qai/screenshots"))
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(float(max_mb if max_mb is not None else os.getenv("QAI_SPOOL_MAX_MB", 2048)) * 1024 * 1024)
+        self.stats = {"frames": 0, "stored": 0, "deduplicated": 0, "bytes_stored": 0, "pruned": 0}
+        # use() token -> start time of each test currently using the spool
+        self._in_use: Dict[object, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def use(self) -> Iterator[None]:
+        """Protect every frame written or touched from now on from prune() until the block exits."""
+        token = object()
+        with self._lock:
+            self._in_use[token] = time.time()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_use.pop(token, None)
+
+    def put(self, data: bytes, ext: str = "png") -> str:
+        """Store a frame (once per content) and return its reference."""
+        digest = hashlib.sha256(data).hexdigest()
+        ext = "".join(c for c in ext.lower() if c.isalnum()) or "bin"
+        path = self.root / digest[:2] / f"{digest}.{ext}"
+        self.stats["frames"] += 1
+        if path.exists():
+            self.stats["deduplicated"] += 1
+            # Still in use: keep it away from prune()
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write-then-rename so a concurrent reader never sees a partial frame
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+            self.stats["stored"] += 1
+            self.stats["bytes_stored"] += len(data)
+            # Leftovers from earlier runs on the first store, then every 200 frames
+            if self.stats["stored"] % 200 == 1:
+                self.prune()
+        return f"{SPOOL_PREFIX}{digest}.{ext}"
+
+    def path(self, ref: str) -> Path:
+        name = ref[len(SPOOL_PREFIX):]
+        return self.root / name[:2] / name
+
+    def read(self, ref: str) -> Optional[bytes]:
+        try:
+            return self.path(ref).read_bytes()
+        except OSError:
+            return None
+
+    def data_url(self, ref: str) -> Optional[str]:
+        data = self.read(ref)
+        if data is None:
+            return None
+        ext = ref.rsplit(".", 1)[-1]
+        mime = "image/jpeg" if ext in ("jpg", "jpeg") else f"image/{ext}"
+        return f"data:{mime};base64," + base64.b64encode(data).decode("ascii")
+
+    def prune(self) -> int:
+        """Delete the least recently written frames while the spool is over QAI_SPOOL_MAX_MB.
+
+        Frames newer than the oldest active use() are kept even over the cap.
+        """
+        with self._lock:
+            oldest_use = min(self._in_use.values(), default=None)
+        keep_after = oldest_use - MTIME_SLACK_S if oldest_use is not None else float("inf")
+        files = []
+        for path in self.root.glob("*/*.*"):
+            if path.suffix == ".tmp":
+                continue  # being written by put()
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for mtime, size, path in sorted(files):
+            if total <= self.max_bytes or mtime >= keep_after:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        self.stats["pruned"] += removed
+        return removed
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "root": str(self.root), "in_use": len(self._in_use)}
+
+
+def spool_output_item(item: Any, spool: ScreenshotSpool) -> Optional[str]:
+    """Move a computer_call_output screenshot into the spool (in place) and return its reference."""
+    if not isinstance(item, dict) or item.get("type") != "computer_call_output":
+        return None
+    output = item.get("output")
+    url = output.get("image_url") if isinstance(output, dict) else None
+    if is_spool_ref(url):
+        return url
+    if not isinstance(url, str) or not url.startswith("data:") or ";base64," not in url:
+        return None
+    header, payload = url.split(",", 1)
+    try:
+        data = base64.b64decode(payload)
+    except Exception:
+        return None
+    ext = header[len("data:image/"):].split(";", 1)[0] if header.startswith("data:image/") else "png"
+    ref = spool.put(data, "jpg" if ext == "jpeg" else ext)
+    output["image_url"] = ref
+    return ref
+
+
+class ScreenshotSpooler(AsyncCallbackHandler):
+    """Agent callback that keeps only spool references to screenshots in the agent history."""
+
+    def __init__(self, spool: Optional[ScreenshotSpool] = None) -> None:
+        self.spool = spool or get_screenshot_spool()
+
+    async def on_computer_call_end(self, item: Dict[str, Any], result: List[Dict[str, Any]]) -> None:
+        for output_item in result or []:
+            # Hashing, writing and the occasional prune stay off the event loop
+            await asyncio.to_thread(spool_output_item, output_item, self.spool)
+
+    async def on_llm_start(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        result = list(messages)
+        for i, msg in enumerate(result):
+            if not isinstance(msg, dict) or msg.get("type") != "computer_call_output":
+                continue
+            output = msg.get("output") or {}
+            if isinstance(output, dict) and is_spool_ref(output.get("image_url")):
+                url = await asyncio.to_thread(self.spool.data_url, output["image_url"])
+                if url is not None:
+                    result[i] = {**msg, "output": {**output, "image_url": url}}
+        return result
+
+
+_spool: Optional[ScreenshotSpool] = None
+
+
+def get_screenshot_spool() -> ScreenshotSpool:
+    """Process-wide spool shared by every agent in this runner."""
+    global _spool
+    if _spool is None:
+        _spool = ScreenshotSpool()
+    return _spool
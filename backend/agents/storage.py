@@ -0,0 +1,160 @@
+"""
+Direct-to-object-store uploads for recordings.
+
+Instead of proxying every video through the /upload-video function, the runner
+starts an S3 multipart upload, mints one pre-signed URL per part and hands them
+to the VM, which PUTs the parts in parallel (record.upload_parts). The runner
+then completes the upload with the returned ETags. Small renditions (poster,
+sprite sheet, preview) get single pre-signed PUT URLs, and step evidence
+frames are uploaded from the runner host with upload_artifact.
+
+Enabled when QAI_S3_BUCKET is set and the optional `boto3` package is
+installed. S3_BUCKET_NAME alone (the Node server's bucket) does not turn it on. QAI_S3_ENDPOINT_URL points
+it at any S3-compatible store (MinIO, LocalStack, a local stand-in).
+"""
+import json
+import math
+import os
+import time
+import urllib.request
+import uuid
+from typing import Any, Dict, List, Optional
+
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 minimum for every part but the last
+VIDEO_UPLOAD_URL = "https://qai-ashy.vercel.app/upload-video"
+
+
+class ObjectStore:
+    def __init__(
+        self,
+        bucket: str,
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        public_url: Optional[str] = None,
+        part_size: Optional[int] = None,
+        expires_s: Optional[int] = None,
+    ) -> None:
+        import boto3  # optional dependency
+        from botocore.config import Config
+
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.region = region or os.getenv("AWS_REGION") or "us-east-1"
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=self.region,
+            config=Config(signature_version="s3v4", s3={"addressing_style": "path" if endpoint_url else "auto"}),
+        )
+        self.public_url = (public_url or "").rstrip("/") or None
+        part_mb = float(os.getenv("QAI_S3_PART_SIZE_MB", 8))
+        self.part_size = max(MIN_PART_SIZE, int(part_size or part_mb * 1024 * 1024))
+        self.expires_s = int(expires_s or os.getenv("QAI_S3_PRESIGN_EXPIRES_S", 3600))
+
+    def object_key(self, filename: str, prefix: str = "video") -> str:
+        # Same naming as the Node /upload-video endpoint
+        return f"{prefix}_{int(time.time() * 1000)}_{os.path.basename(filename)}"
+
+    def object_url(self, key: str) -> str:
+        if self.public_url:
+            return f"{self.public_url}/{key}"
+        if self.endpoint_url:
+            return f"{self.endpoint_url.rstrip('/')}/{self.bucket}/{key}"
+        return f"https://{self.bucket}.s3.{self.region}.amazonaws.com/{key}"
+
+    def presign_put(self, key: str, content_type: str) -> Dict[str, str]:
+        """Single pre-signed PUT; the uploader must send the same Content-Type."""
+        put_url = self.client.generate_presigned_url(
+            "put_object",
+            Params={"Bucket": self.bucket, "Key": key, "ContentType": content_type},
+            ExpiresIn=self.expires_s,
+        )
+        return {"key": key, "put_url": put_url, "content_type": content_type, "url": self.object_url(key)}
+
+    def create_multipart(self, key: str, size: int, content_type: str = "video/mp4") -> Dict[str, Any]:
+        """Start a multipart upload for `size` bytes and pre-sign a URL for each part."""
+        upload_id = self.client.create_multipart_upload(
+            Bucket=self.bucket, Key=key, ContentType=content_type
+        )["UploadId"]
+        count = max(1, math.ceil(size / self.part_size))
+        part_urls = [
+            self.client.generate_presigned_url(
+                "upload_part",
+                Params={"Bucket": self.bucket, "Key": key, "UploadId": upload_id, "PartNumber": number},
+                ExpiresIn=self.expires_s,
+            )
+            for number in range(1, count + 1)
+        ]
+        return {"key": key, "upload_id": upload_id, "part_size": self.part_size, "part_urls": part_urls}
+
+    def complete_multipart(self, upload: Dict[str, Any], parts: List[Dict[str, Any]]) -> str:
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=upload["key"],
+            UploadId=upload["upload_id"],
+            MultipartUpload={
+                "Parts": [{"PartNumber": p["PartNumber"], "ETag": p["ETag"]} for p in sorted(parts, key=lambda p: p["PartNumber"])]
+            },
+        )
+        return self.object_url(upload["key"])
+
+    def upload_file(self, path: str, key: str, content_type: str) -> str:
+        """Upload a local file from the runner host (boto3 switches to multipart for large files)."""
+        self.client.upload_file(path, self.bucket, key, ExtraArgs={"ContentType": content_type})
+        return self.object_url(key)
+
+    def abort_multipart(self, upload: Dict[str, Any]) -> None:
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=upload["key"], UploadId=upload["upload_id"])
+        except Exception as e:
+            print(f"[storage] abort of {upload['key']} failed: {e}")
+
+
+_store: Optional[ObjectStore] = None
+_store_checked = False
+
+
+def get_object_store() -> Optional[ObjectStore]:
+    """Process-wide store, or None when direct uploads aren't configured (legacy /upload-video is used)."""
+    global _store, _store_checked
+    if not _store_checked:
+        _store_checked = True
+        bucket = os.getenv("QAI_S3_BUCKET")
+        if bucket:
+            try:
+                _store = ObjectStore(
+                    bucket,
+                    endpoint_url=os.getenv("QAI_S3_ENDPOINT_URL") or None,
+                    public_url=os.getenv("QAI_S3_PUBLIC_URL") or None,
+                )
+            except Exception as e:
+                print(f"[storage] direct uploads unavailable ({e}); using the upload endpoint")
+    return _store
+
+
+def upload_artifact(path: str, key: str, content_type: str) -> Optional[str]:
+    """Upload a file from the runner host and return its URL.
+
+    Goes to the object store when configured, otherwise through the upload
+    endpoint (QAI_UPLOAD_URL), which names the object itself.
+    """
+    store = get_object_store()
+    if store is not None:
+        return store.upload_file(path, key, content_type)
+    boundary = f"----WebKitFormBoundary{uuid.uuid4().hex}"
+    with open(path, "rb") as f:
+        data = f.read()
+    body = (
+        f"--{boundary}\r\n"
+        f"Content-Disposition: form-data; name=\"video\"; filename=\"{os.path.basename(key)}\"\r\n"
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode("utf-8") + data + f"\r\n--{boundary}--\r\n".encode("utf-8")
+    request = urllib.request.Request(
+        os.getenv("QAI_UPLOAD_URL", VIDEO_UPLOAD_URL),
+        data=body,
+        method="POST",
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}", "Content-Length": str(len(body))},
+    )
+    with urllib.request.urlopen(request, timeout=60) as resp:
+        payload = json.loads(resp.read().decode("utf-8", errors="ignore") or "{}")
+    return payload.get("fileUrl") or payload.get("url")
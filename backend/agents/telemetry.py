@@ -0,0 +1,84 @@
+import time
+from typing import Any, Dict, List, Optional
+
+
+def _cached_tokens(usage: Dict[str, Any]) -> int:
+    """Read cached prompt tokens from either OpenAI- or Anthropic-style usage dicts."""
+    details = usage.get("prompt_tokens_details") or {}
+    if isinstance(details, dict) and details.get("cached_tokens"):
+        return int(details["cached_tokens"])
+    return int(usage.get("cache_read_input_tokens") or 0)
+
+
+def _is_screenshot(item: Any) -> bool:
+    """Screenshot returned by a computer call; it is sent to the model on the next turn."""
+    if not isinstance(item, dict) or item.get("type") != "computer_call_output":
+        return False
+    output = item.get("output")
+    return isinstance(output, dict) and bool(output.get("image_url"))
+
+
+class TurnMetrics:
+    """Per-test timing and token counters collected from the agent's output stream."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.first_output_s: Optional[float] = None
+        self.turns: List[Dict[str, Any]] = []
+
+    def record(self, result: Dict[str, Any]) -> None:
+        now = time.perf_counter()
+        if self.first_output_s is None:
+            self.first_output_s = now - self.started
+        usage = result.get("usage") or {}
+        self.turns.append({
+            "latency_s": round(now - self._last, 3),
+            "input_tokens": int(usage.get("prompt_tokens") or 0),
+            "cached_input_tokens": _cached_tokens(usage),
+            "output_tokens": int(usage.get("completion_tokens") or 0),
+            "screenshots": sum(1 for item in result.get("output") or [] if _is_screenshot(item)),
+            "cost_usd": float(usage.get("response_cost") or 0.0),
+        })
+        self._last = now
+
+    def summary(self) -> Dict[str, Any]:
+        turns = len(self.turns)
+        input_tokens = sum(t["input_tokens"] for t in self.turns)
+        cached = sum(t["cached_input_tokens"] for t in self.turns)
+        cost = sum(t["cost_usd"] for t in self.turns)
+        latencies = [t["latency_s"] for t in self.turns]
+        return {
+            "turns": turns,
+            "time_to_first_output_s": round(self.first_output_s, 3) if self.first_output_s is not None else None,
+            "input_tokens": input_tokens,
+            "cached_input_tokens": cached,
+            "avg_input_tokens_per_turn": round(input_tokens / turns, 1) if turns else 0,
+            "output_tokens": sum(t["output_tokens"] for t in self.turns),
+            "screenshots": sum(t["screenshots"] for t in self.turns),
+            "avg_turn_latency_s": round(sum(latencies) / turns, 3) if turns else None,
+            "max_turn_latency_s": max(latencies) if latencies else None,
+            "duration_s": round(self._last - self.started, 3),
+            "cost_usd": round(cost, 6),
+        }
+
+
+# Counters that add up across attempts, tests, suites and results
+USAGE_SUM_KEYS = ("turns", "input_tokens", "cached_input_tokens", "output_tokens", "screenshots", "cost_usd", "duration_s")
+
+
+def combine_usage(parts: List[Optional[Dict[str, Any]]], count_key: Optional[str] = None) -> Dict[str, Any]:
+    """Sum usage dicts (attempt metrics, per-test usage, ...).
+
+    With count_key, the number of non-empty parts is stored under that key (e.g. "tests").
+    """
+    parts = [p for p in parts if p]
+    total: Dict[str, Any] = {key: 0 for key in USAGE_SUM_KEYS}
+    for part in parts:
+        for key in USAGE_SUM_KEYS:
+            total[key] += part.get(key) or 0
+    total["cost_usd"] = round(total["cost_usd"], 6)
+    total["duration_s"] = round(total["duration_s"], 3)
+    if count_key:
+        total[count_key] = len(parts)
+    return total
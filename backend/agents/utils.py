@@ -20,7 +20,12 @@ def normalize_tests(spec: dict) -> list[dict]:
         for idx, t in enumerate(tests):
             name = t.get("name") or f"test-{idx+1}"
             instructions = t.get("instructions") or []
-            normalized.append({"name": name, "instructions": instructions})
+            entry = {"name": name, "instructions": instructions}
+            # Carry optional metadata used for prompts and scheduling
+            for key in ("id", "summary", "required"):
+                if t.get(key) is not None:
+                    entry[key] = t[key]
+            normalized.append(entry)
         return normalized
     
     # Single test
@@ -97,3 +102,20 @@ def extract_major_steps(item: dict) -> list[str]:
         return steps
     return steps
 
+
+def extract_verdict(item: dict) -> tuple[str, str] | None:
+    """Return ("PASSED" | "FAILED", message text) if the item carries an explicit RESULT line."""
+    try:
+        if not isinstance(item, dict) or item.get("type") != "message":
+            return None
+        for block in item.get("content") or []:
+            text = block.get("text") if isinstance(block, dict) else None
+            if isinstance(text, str):
+                cleaned = text.strip().upper()
+                if cleaned.endswith("RESULT: PASSED"):
+                    return "PASSED", text
+                if cleaned.endswith("RESULT: FAILED"):
+                    return "FAILED", text
+    except Exception:
+        return None
+    return None
@@ -0,0 +1,293 @@
+"""
+Visual regression fast-path.
+
+Off unless QAI_VISUAL_FASTPATH=1. When a test passes in a single agent attempt,
+the actions and the screenshot behind each of its STEPs are kept as the test's
+reference (keyed by the deployment, test name and summary, under
+QAI_VISUAL_REFS_DIR), plus a final step for the actions after the last STEP and
+the last frame of the run. On later runs the runner replays the recorded
+actions step by step and compares each new frame with the reference using a
+difference hash and a tiled SSIM. If every step matches, the test passes
+without a single model turn. At the first divergence the differing tiles are
+flagged, the browser is reset (reset_browser) and the normal agent run takes
+over.
+
+Needs Pillow (optional, as in screenshots.py); without it the fast-path is off.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from screenshots import Image, dhash, hamming
+from spool import ScreenshotSpool
+
+try:
+    from PIL import ImageChops, ImageStat
+except ImportError:  # Pillow is optional
+    ImageChops = ImageStat = None
+
+# SSIM stabilizers for 8-bit images
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+
+def visual_fastpath_enabled() -> bool:
+    if Image is None:
+        return False
+    return os.getenv("QAI_VISUAL_FASTPATH", "0").lower() in ("1", "true", "yes")
+
+
+def _test_key(test: Dict[str, Any], scope: str = "") -> str:
+    """Reference key: the same test name and summary in another project or deployment is another test."""
+    identity = f"{scope}\n{test.get('name') or ''}\n{(test.get('summary') or '').strip()}"
+    return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+
+def _tile_ssim(x: Any, y: Any) -> float:
+    """SSIM of two equally sized grayscale tiles from their means, variances and covariance."""
+    sx, sy = ImageStat.Stat(x), ImageStat.Stat(y)
+    mx, my = sx.mean[0], sy.mean[0]
+    vx, vy = sx.var[0], sy.var[0]
+    # var(x - y) from the halved, offset difference image; cov = (vx + vy - var(x - y)) / 2
+    vd = 4 * ImageStat.Stat(ImageChops.subtract(x, y, scale=2.0, offset=128)).var[0]
+    cov = (vx + vy - vd) / 2
+    return ((2 * mx * my + SSIM_C1) * (2 * cov + SSIM_C2)) / ((mx * mx + my * my + SSIM_C1) * (vx + vy + SSIM_C2))
+
+
+def compare_frames(reference: bytes, current: bytes, width: int = 320, grid: int = 8) -> Dict[str, Any]:
+    """Perceptual comparison of two screenshots.
+
+    Returns {dhash_distance, ssim, min_tile_ssim, tiles: [[col, row, ssim], ...]} with
+    SSIM computed per tile of a grid x grid layout on downscaled grayscale frames.
+    """
+    with Image.open(io.BytesIO(reference)) as ref_img, Image.open(io.BytesIO(current)) as cur_img:
+        distance = hamming(dhash(ref_img), dhash(cur_img))
+        height = max(grid, round(ref_img.height * width / ref_img.width))
+        x = ref_img.convert("L").resize((width, height))
+        y = cur_img.convert("L").resize((width, height))
+    tiles = []
+    for row in range(grid):
+        for col in range(grid):
+            box = (col * width // grid, row * height // grid, (col + 1) * width // grid, (row + 1) * height // grid)
+            tiles.append([col, row, round(_tile_ssim(x.crop(box), y.crop(box)), 4)])
+    scores = [t[2] for t in tiles]
+    return {
+        "dhash_distance": distance,
+        "ssim": round(sum(scores) / len(scores), 4),
+        "min_tile_ssim": min(scores),
+        "tiles": tiles,
+    }
+
+
+class VisualThresholds:
+    def __init__(self) -> None:
+        self.ssim_min = float(os.getenv("QAI_VISUAL_SSIM_MIN", 0.98))
+        self.tile_ssim_min = float(os.getenv("QAI_VISUAL_TILE_SSIM_MIN", 0.85))
+        self.dhash_max = int(os.getenv("QAI_VISUAL_DHASH_MAX", 4))
+
+    def check(self, comparison: Dict[str, Any]) -> Dict[str, Any]:
+        """Match verdict plus the tiles that differ (for flagging)."""
+        diff_tiles = [[c, r] for c, r, score in comparison["tiles"] if score < self.tile_ssim_min]
+        matched = (
+            comparison["ssim"] >= self.ssim_min
+            and comparison["dhash_distance"] <= self.dhash_max
+            and not diff_tiles
+        )
+        return {
+            "matched": matched,
+            "ssim": comparison["ssim"],
+            "min_tile_ssim": comparison["min_tile_ssim"],
+            "dhash_distance": comparison["dhash_distance"],
+            "diff_tiles": diff_tiles,
+        }
+
+
+class VisualReferenceStore:
+    """Per-test reference steps (JSON) and their frames, on local disk."""
+
+    def __init__(self, root: Optional[str] = None) -> None:
+        self.root = Path(root or os.getenv("QAI_VISUAL_REFS_DIR", "/tmp/qai/visual_refs"))
+        self.frames = self.root / "frames"
+
+    def get(self, test: Dict[str, Any], scope: str = "") -> Optional[Dict[str, Any]]:
+        path = self.root / f"{_test_key(test, scope)}.json"
+        try:
+            reference = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if not all((self.frames / step["frame"]).exists() for step in reference.get("steps") or []):
+            return None
+        return reference if reference.get("steps") else None
+
+    def discard(self, test: Dict[str, Any], scope: str = "") -> None:
+        """Drop a test's reference (frames are shared by content and left in place)."""
+        try:
+            (self.root / f"{_test_key(test, scope)}.json").unlink()
+        except OSError:
+            pass
+
+    def frame(self, name: str) -> bytes:
+        return (self.frames / name).read_bytes()
+
+    def save(
+        self,
+        test: Dict[str, Any],
+        step_log: List[Dict[str, Any]],
+        spool: ScreenshotSpool,
+        tail: Optional[Dict[str, Any]] = None,
+        scope: str = "",
+    ) -> bool:
+        """Keep a passing run's steps as the test's reference; every step needs a spooled frame.
+
+        tail is {actions, screenshot}: the actions after the last STEP and the run's
+        last frame. They become a final step so a replay ends where the run ended.
+        """
+        if not step_log or not all(entry.get("screenshot") for entry in step_log):
+            return False
+        entries = [{**entry, "final": False} for entry in step_log]
+        if tail and (tail.get("actions") or tail.get("screenshot") != step_log[-1]["screenshot"]):
+            if not tail.get("screenshot"):
+                return False  # the end state can't be checked
+            entries.append({
+                "text": "Final state", "actions": tail.get("actions"), "screenshot": tail["screenshot"], "final": True,
+            })
+        self.frames.mkdir(parents=True, exist_ok=True)
+        steps = []
+        for entry in entries:
+            source = spool.path(entry["screenshot"])
+            target = self.frames / source.name
+            if not target.exists():
+                try:
+                    # Content-addressed on both sides, so a hard link is safe (copy across filesystems)
+                    os.link(source, target)
+                except OSError:
+                    try:
+                        shutil.copyfile(source, target)
+                    except OSError:
+                        return False
+            step = {"text": entry["text"], "actions": entry.get("actions") or [], "frame": target.name}
+            if entry["final"]:
+                step["final"] = True
+            steps.append(step)
+        reference = {"name": test.get("name"), "scope": scope, "saved_at": time.time(), "steps": steps}
+        path = self.root / f"{_test_key(test, scope)}.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(reference), encoding="utf-8")
+        tmp.replace(path)
+        return True
+
+
+async def replay_action(computer: Any, action: Dict[str, Any]) -> None:
+    """Perform one recorded computer_call action through the cua computer interface."""
+    interface = computer.interface
+    kind = action.get("type")
+    if kind == "click":
+        button = action.get("button", "left")
+        if button == "right":
+            await interface.right_click(action["x"], action["y"])
+        else:
+            await interface.left_click(action["x"], action["y"])
+    elif kind == "double_click":
+        await interface.double_click(action["x"], action["y"])
+    elif kind == "move":
+        await interface.move_cursor(action["x"], action["y"])
+    elif kind == "type":
+        await interface.type_text(action["text"])
+    elif kind == "keypress":
+        keys = action.get("keys") or []
+        keys = [keys] if isinstance(keys, str) else keys
+        if len(keys) == 1:
+            await interface.press_key(keys[0])
+        else:
+            await interface.hotkey(*keys)
+    elif kind == "scroll":
+        await interface.move_cursor(action["x"], action["y"])
+        await interface.scroll(action.get("scroll_x", 0), action.get("scroll_y", 0))
+    elif kind == "drag":
+        path = [(p["x"], p["y"]) for p in action.get("path") or []]
+        await interface.drag(path)
+    elif kind == "wait":
+        await asyncio.sleep(float(action.get("ms", 1000)) / 1000)
+    elif kind == "screenshot":
+        pass
+    else:
+        raise ValueError(f"cannot replay action type {kind!r}")
+
+
+async def run_visual_check(
+    computer: Any,
+    reference: Dict[str, Any],
+    store: VisualReferenceStore,
+    spool: Optional[ScreenshotSpool] = None,
+    on_step: Optional[Any] = None,
+) -> Dict[str, Any]:
+    """Replay a reference step by step, comparing each resulting frame with the reference.
+
+    on_step(step, frame_ref) is awaited for every matched STEP (not for the final
+    step, which only checks the end state). Returns
+    {matched, steps_checked, steps_total, duration_s, diverged?} where diverged
+    holds the step index, text and comparison of the first mismatch (or the error).
+    """
+    thresholds = VisualThresholds()
+    settle_s = float(os.getenv("QAI_VISUAL_SETTLE_S", 1.0))
+    attempts = int(os.getenv("QAI_VISUAL_COMPARE_ATTEMPTS", 3))
+    started = time.perf_counter()
+    steps = reference["steps"]
+    checked = 0
+    diverged = None
+    for index, step in enumerate(steps, 1):
+        verdict: Dict[str, Any] = {}
+        try:
+            for action in step["actions"]:
+                await replay_action(computer, action)
+            expected = store.frame(step["frame"])
+            # Give the page a moment (and a few tries) to settle before calling it a difference
+            for _ in range(max(1, attempts)):
+                await asyncio.sleep(settle_s)
+                current = await computer.interface.screenshot()
+                verdict = thresholds.check(await asyncio.to_thread(compare_frames, expected, current))
+                if verdict["matched"]:
+                    break
+        except Exception as e:
+            diverged = {"step": index, "text": step["text"], "error": f"{type(e).__name__}: {e}"}
+            break
+        if not verdict["matched"]:
+            diverged = {"step": index, "text": step["text"], **verdict}
+            break
+        checked += 1
+        if on_step is not None and not step.get("final"):
+            await on_step(step, await asyncio.to_thread(spool.put, current) if spool is not None else None)
+    return {
+        "matched": diverged is None,
+        "steps_checked": checked,
+        "steps_total": len(steps),
+        "reference_saved_at": reference.get("saved_at"),
+        "duration_s": round(time.perf_counter() - started, 3),
+        **({"diverged": diverged} if diverged else {}),
+    }
+
+
+async def reset_browser(computer: Any, open_at: Tuple[int, int], settle_s: Optional[float] = None) -> None:
+    """Close the browser window a diverged replay left mid-flow and open a fresh one at open_at (its taskbar icon)."""
+    interface = computer.interface
+    settle_s = float(settle_s if settle_s is not None else os.getenv("QAI_VISUAL_SETTLE_S", 1.0))
+    await interface.hotkey("ctrl", "shift", "w")
+    await asyncio.sleep(settle_s)
+    await interface.left_click(*open_at)
+    await asyncio.sleep(settle_s)
+
+
+_store: Optional[VisualReferenceStore] = None
+
+
+def get_visual_reference_store() -> VisualReferenceStore:
+    global _store
+    if _store is None:
+        _store = VisualReferenceStore()
+    return _store
@@ -0,0 +1,152 @@
+"""
+Runner worker: executes suite jobs from the shared job queue (jobqueue.py).
+
+Start the API with QAI_WORKER_MODE=1 so /run-result only enqueues, then run any
+number of workers on hosts that share QAI_JOB_DB:
+
+    python worker.py --name w1 --concurrency 2
+
+Each worker slot leases one job at a time, heartbeats it while the agent runs
+and reports the per-test results. Whenever a result's last job reaches done or
+failed (including a lease that expired on its final attempt), one worker claims
+the result and writes the aggregated overall_result / run_status. Give every
+worker process a stable --name: it names its write-behind journal, which is
+replayed on restart.
+
+Workers lease containers through a shared SQLite lock table (QAI_LEASE_DB,
+default leases.db next to QAI_JOB_DB) so two workers never drive the same VM.
+"""
+import argparse
+import asyncio
+import os
+import socket
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+from database import get_write_queue
+from jobqueue import get_job_queue
+from concurrency import lease_within_limit, run_with_slot
+from leases import SqliteLeaseTable, get_lease_manager
+from runner import run_single_agent, finalize_result, _flush_writes
+
+load_dotenv()
+
+
+async def _heartbeat_job(queue: Any, job: Dict[str, Any], worker_id: str, lost: asyncio.Event) -> None:
+    """Extend the job's visibility timeout; flag `lost` if another worker took it over."""
+    interval = float(os.getenv("QAI_JOB_HEARTBEAT_S", queue.visibility_timeout / 3))
+    while True:
+        await asyncio.sleep(interval)
+        if not await asyncio.to_thread(queue.heartbeat, job["id"], worker_id):
+            print(f"[worker {worker_id}] lost lease on job {job['id']}; stopping it")
+            lost.set()
+            return
+
+
+def _group_result_id(group: str) -> Optional[int]:
+    """result_id of a "result:<id>" job group (see runner.enqueue_result)."""
+    kind, _, value = group.partition(":")
+    return int(value) if kind == "result" and value.isdigit() else None
+
+
+async def finalize_finished_results(worker_id: str) -> None:
+    """Aggregate every result whose jobs have all finished, however they finished."""
+    queue = get_job_queue()
+    for group in await asyncio.to_thread(queue.claim_finished_groups):
+        result_id = _group_result_id(group)
+        if result_id is None:
+            continue
+        try:
+            summary = await finalize_result(result_id)
+            print(f"[worker {worker_id}] result {result_id} finished: {summary['run_status']}")
+        except Exception as e:
+            print(f"[worker {worker_id}] finalizing result {result_id} failed: {e}")
+
+
+async def run_job(job: Dict[str, Any], worker_id: str) -> None:
+    try:
+        await _execute_job(job, worker_id)
+    finally:
+        await finalize_finished_results(worker_id)
+
+
+async def _execute_job(job: Dict[str, Any], worker_id: str) -> None:
+    queue = get_job_queue()
+    spec = dict(job["payload"])
+    lost = asyncio.Event()
+    heartbeat = asyncio.create_task(_heartbeat_job(queue, job, worker_id, lost))
+    try:
+        manager = get_lease_manager()
+        # Lost lease doubles as the suite's stop signal
+        spec["stop_event"] = lost
+        async with lease_within_limit(manager, 1, f"{worker_id}:job{job['id']}", job.get("priority") or 0) as containers:
+            spec["container_name"] = containers[0]
+            results = await run_with_slot(run_single_agent, spec)
+        await _flush_writes()
+    except Exception as e:
+        print(f"[worker {worker_id}] job {job['id']} failed: {e}")
+        await asyncio.to_thread(queue.fail, job["id"], worker_id, str(e))
+        return
+    finally:
+        heartbeat.cancel()
+
+    if lost.is_set():
+        return
+    report = [
+        {
+            "test_id": r.get("test_id"),
+            "name": r.get("name"),
+            "test_success": r.get("test_success"),
+            "run_status": getattr(r.get("run_status"), "value", r.get("run_status")),
+            "duration_s": r.get("duration_s"),
+            "usage": r.get("usage"),
+        }
+        for r in results
+    ]
+    if not await asyncio.to_thread(queue.complete, job["id"], worker_id, report):
+        print(f"[worker {worker_id}] job {job['id']} finished after its lease expired; result discarded")
+        return
+    print(f"[worker {worker_id}] job {job['id']} done ({sum(1 for r in report if r['test_success'])}/{len(report)} passed)")
+
+
+async def work(worker_id: str, once: bool = False, poll_interval: float = 2.0) -> None:
+    """Lease and run jobs until stopped (or, with once, until the queue is empty)."""
+    queue = get_job_queue()
+    while True:
+        job = await asyncio.to_thread(queue.lease, worker_id)
+        if job is None:
+            # Leases that expired on their last attempt fail jobs without any worker finishing them
+            await finalize_finished_results(worker_id)
+            if once:
+                return
+            await asyncio.sleep(poll_interval)
+            continue
+        print(f"[worker {worker_id}] leased job {job['id']} ({job['kind']}, attempt {job['attempts']})")
+        await run_job(job, worker_id)
+
+
+async def main(name: str, concurrency: int, once: bool) -> None:
+    manager = get_lease_manager()
+    if not manager.containers:
+        raise SystemExit("worker: no CUA_CONTAINER_[1-4] variables configured")
+    if not isinstance(manager.table, SqliteLeaseTable):
+        # In-memory leases are per process: workers would drive the same VMs at once
+        raise SystemExit("worker: QAI_LEASE_DB must point at a SQLite lease table shared by all workers")
+    get_write_queue().start()
+    await asyncio.gather(*(work(f"{name}/{slot}", once) for slot in range(concurrency)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run QAI suite jobs from the shared job queue")
+    parser.add_argument("--name", default=f"{socket.gethostname()}-{os.getpid()}", help="stable worker name")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("QAI_WORKER_CONCURRENCY", 1)))
+    parser.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    args = parser.parse_args()
+    # One write-behind journal per worker process
+    os.environ.setdefault("QAI_WRITE_JOURNAL", f"/tmp/qai/write_journal-{args.name}.jsonl")
+    # Container leases shared by every worker that shares the job queue
+    job_db = os.path.abspath(os.getenv("QAI_JOB_DB", "/tmp/qai/jobs.db"))
+    if not os.getenv("QAI_LEASE_DB"):
+        os.environ["QAI_LEASE_DB"] = os.path.join(os.path.dirname(job_db), "leases.db")
+    asyncio.run(main(args.name, args.concurrency, args.once))
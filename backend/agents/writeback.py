@@ -0,0 +1,340 @@
+"""
+Durable write-behind queue for database writes.
+
+Writes are appended to an on-disk journal (QAI_WRITE_JOURNAL) and applied by a
+background task in a worker thread, so agents never wait on Supabase. Journal
+appends are batched by a second task and written and fsynced in a worker thread
+too (one fsync per batch), so enqueueing never touches the disk. Pending
+updates to the same row are coalesced into one call carrying the latest value
+of each field. Failed writes are retried with exponential backoff, and after
+QAI_WRITE_BREAKER_THRESHOLD consecutive errors a circuit breaker pauses all
+writes for QAI_WRITE_BREAKER_COOLDOWN_S. Anything still in the journal when the
+process dies is replayed on the next start.
+
+Each runner process needs its own journal file. The queue holds an exclusive
+lock on it and falls back to a per-PID journal when another live process
+already owns the configured one.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: journals are not locked
+    fcntl = None
+
+Op = Dict[str, Any]
+
+
+def is_permanent_error(exc: BaseException) -> bool:
+    """PostgREST / Postgres errors that fail the same way on retry (unknown column, constraint, bad value)."""
+    code = str(getattr(exc, "code", "") or "")
+    return code.startswith("PGRST") or code[:2] in ("22", "23", "42")
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: Optional[int] = None, cooldown: Optional[float] = None) -> None:
+        self.threshold = int(threshold if threshold is not None else os.getenv("QAI_WRITE_BREAKER_THRESHOLD", 5))
+        self.cooldown = float(cooldown if cooldown is not None else os.getenv("QAI_WRITE_BREAKER_COOLDOWN_S", 30))
+        self.failures = 0
+        self.trips = 0
+        self._opened_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "open" if self.retry_after() > 0 else "half_open"
+
+    def retry_after(self) -> float:
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self._opened_at + self.cooldown - time.monotonic())
+
+    def success(self) -> None:
+        self.failures = 0
+        self._opened_at = None
+
+    def failure(self) -> None:
+        self.failures += 1
+        # Trip when closed, or re-open after a failed half-open probe
+        if self.failures >= self.threshold and self.state != "open":
+            self._opened_at = time.monotonic()
+            self.trips += 1
+            print(f"[writeback] circuit open after {self.failures} consecutive errors; pausing {self.cooldown:.0f}s")
+
+
+class WriteBehindQueue:
+    def __init__(
+        self,
+        apply: Callable[[Op], None],
+        after_apply: Optional[Callable[[Op], None]] = None,
+        journal_path: Optional[str] = None,
+        backoff_base: Optional[float] = None,
+        backoff_max: Optional[float] = None,
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
+        """apply(op) performs one write synchronously (it runs in a worker thread);
+        after_apply(op) runs on the event loop once the write succeeded."""
+        self.apply = apply
+        self.after_apply = after_apply
+        self._journal_lock = None
+        self.journal_path = self._claim_journal(
+            Path(journal_path or os.getenv("QAI_WRITE_JOURNAL", "/tmp/qai/write_journal.jsonl"))
+        )
+        self.backoff_base = float(backoff_base if backoff_base is not None else os.getenv("QAI_WRITE_BACKOFF_S", 0.5))
+        self.backoff_max = float(backoff_max if backoff_max is not None else os.getenv("QAI_WRITE_BACKOFF_MAX_S", 30))
+        self.breaker = breaker or CircuitBreaker()
+        self._pending: "OrderedDict[str, Op]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._journal_lines = 0
+        # Journal lines waiting for the journal task, and whether it should compact next
+        self._journal_buffer: List[str] = []
+        self._compact_requested = False
+        self._journal_busy = False
+        self._journal_task: Optional[asyncio.Task] = None
+        self._journal_wake: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self.stats = {"enqueued": 0, "coalesced": 0, "applied": 0, "retries": 0, "dropped": 0, "replayed": 0}
+        self._replay()
+
+    # Enqueueing
+
+    def update(self, table: str, row_id: Any, fields: Dict[str, Any]) -> None:
+        """Queue `UPDATE table SET fields WHERE id = row_id`."""
+        self._add({"op": "update", "table": table, "id": row_id, "fields": dict(fields)})
+
+    def upsert(self, table: str, row: Dict[str, Any], on_conflict: str) -> None:
+        """Queue an idempotent insert keyed on the on_conflict columns."""
+        self._add({"op": "upsert", "table": table, "row": dict(row), "on_conflict": on_conflict})
+
+    @staticmethod
+    def _key(op: Op) -> str:
+        if op["op"] == "update":
+            return f"update:{op['table']}:{op['id']}"
+        values = [str(op["row"].get(c.strip())) for c in op["on_conflict"].split(",")]
+        return f"upsert:{op['table']}:{':'.join(values)}"
+
+    def _add(self, op: Op, journal: bool = True) -> None:
+        key = self._key(op)
+        existing = self._pending.get(key)
+        if existing is not None and op["op"] == "update":
+            existing["fields"].update(op["fields"])
+            self.stats["coalesced"] += 1
+        else:
+            self._pending[key] = op
+        self._versions[key] = self._versions.get(key, 0) + 1
+        if journal:
+            self.stats["enqueued"] += 1
+            self._journal_buffer.append(json.dumps(op, default=str) + "\n")
+            if not self._ensure_journal_writer():
+                # No event loop to hand off to: nothing is blocked by writing right here
+                lines, self._journal_buffer = self._journal_buffer, []
+                self._write_journal(lines)
+            self._ensure_worker()
+
+    # Journal
+
+    def _claim_journal(self, path: Path) -> Path:
+        """Lock the journal for this process; use a per-PID journal if another process holds it."""
+        if fcntl is None:
+            return path
+        for candidate in (path, path.with_name(f"{path.stem}-{os.getpid()}{path.suffix}")):
+            try:
+                candidate.parent.mkdir(parents=True, exist_ok=True)
+                lock = open(candidate.with_suffix(".lock"), "a")
+            except OSError as e:
+                print(f"[writeback] cannot lock journal {candidate}: {e}")
+                return candidate
+            try:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock.close()
+                print(f"[writeback] journal {candidate} is in use by another process")
+                continue
+            self._journal_lock = lock
+            return candidate
+        return path
+
+    def _write_journal(self, lines: List[str]) -> None:
+        """Append a batch of journal lines with a single fsync (runs in a worker thread)."""
+        try:
+            self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_lines += len(lines)
+        except OSError as e:
+            print(f"[writeback] journal append failed: {e}")
+
+    def _rewrite_journal(self, lines: List[str]) -> None:
+        """Replace the journal with the given lines (runs in a worker thread)."""
+        try:
+            if not lines:
+                if self.journal_path.exists():
+                    self.journal_path.unlink()
+                self._journal_lines = 0
+                return
+            tmp = self.journal_path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.writelines(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.journal_path)
+            self._journal_lines = len(lines)
+        except OSError as e:
+            print(f"[writeback] journal compaction failed: {e}")
+
+    def _compact(self) -> None:
+        """Ask the journal task to rewrite the journal with just the still-pending (coalesced) writes."""
+        self._compact_requested = True
+        self._ensure_journal_writer()
+
+    def _ensure_journal_writer(self) -> bool:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        if self._journal_task is None or self._journal_task.done() or self._journal_task.get_loop() is not loop:
+            self._journal_wake = asyncio.Event()
+            self._journal_task = loop.create_task(self._run_journal())
+        self._journal_wake.set()
+        return True
+
+    async def _run_journal(self) -> None:
+        """Write buffered journal lines (and compactions) in order, off the event loop."""
+        while True:
+            if not self._journal_buffer and not self._compact_requested:
+                self._journal_wake.clear()
+                await self._journal_wake.wait()
+                continue
+            self._journal_busy = True
+            try:
+                if self._compact_requested:
+                    # The snapshot covers every op buffered so far (still pending or already applied)
+                    self._compact_requested = False
+                    self._journal_buffer = []
+                    lines = [json.dumps(op, default=str) + "\n" for op in self._pending.values()]
+                    await asyncio.to_thread(self._rewrite_journal, lines)
+                else:
+                    lines, self._journal_buffer = self._journal_buffer, []
+                    await asyncio.to_thread(self._write_journal, lines)
+            finally:
+                self._journal_busy = False
+
+    def _replay(self) -> None:
+        if not self.journal_path.exists():
+            return
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    self._add(json.loads(line), journal=False)
+                    self.stats["replayed"] += 1
+                except (ValueError, KeyError):
+                    continue  # torn last line from a crash
+        self._journal_lines = self.stats["replayed"]
+        if self._pending:
+            print(f"[writeback] replaying {len(self._pending)} journaled writes from {self.journal_path}")
+
+    # Draining
+
+    def start(self) -> None:
+        """Start draining replayed writes (call from the event loop at startup)."""
+        if self._pending:
+            self._ensure_worker()
+
+    def _ensure_worker(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no loop yet; the write stays journaled until start()
+        if self._worker is None or self._worker.done() or self._worker.get_loop() is not loop:
+            self._wake = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+        self._wake.set()
+
+    def _apply_op(self, op: Op) -> None:
+        try:
+            self.apply(op)
+        except Exception as e:
+            if not is_permanent_error(e):
+                raise
+            if op["op"] == "update" and len(op["fields"]) > 1:
+                # One bad column must not take the other fields of a coalesced update down with it
+                for name, value in op["fields"].items():
+                    try:
+                        self.apply({**op, "fields": {name: value}})
+                    except Exception as field_error:
+                        if not is_permanent_error(field_error):
+                            raise
+                        self._drop(op, f"{name}: {field_error}")
+                return
+            self._drop(op, str(e))
+
+    def _drop(self, op: Op, reason: str) -> None:
+        self.stats["dropped"] += 1
+        print(f"[writeback] ❌ dropping {self._key(op)} after permanent error: {reason}")
+
+    async def _run(self) -> None:
+        attempt = 0
+        while True:
+            if not self._pending:
+                self._compact()
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            wait = self.breaker.retry_after()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            key, op = next(iter(self._pending.items()))
+            version = self._versions[key]
+            snapshot = {**op, "fields": dict(op["fields"])} if op["op"] == "update" else op
+            try:
+                await asyncio.to_thread(self._apply_op, snapshot)
+            except Exception as e:
+                attempt += 1
+                self.stats["retries"] += 1
+                self.breaker.failure()
+                delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+                print(f"[writeback] {key} failed (attempt {attempt}), retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                continue
+            attempt = 0
+            self.breaker.success()
+            self.stats["applied"] += 1
+            # Fields merged in while the write was in flight keep the entry pending
+            if self._versions.get(key) == version:
+                del self._pending[key]
+                del self._versions[key]
+            if self.after_apply is not None:
+                self.after_apply(snapshot)
+            if self._journal_lines > 4 * len(self._pending) + 1000:
+                self._compact()
+
+    async def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued write is applied; False if the timeout expired first."""
+        if self._pending:
+            self._ensure_worker()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while self._pending or self._journal_buffer or self._compact_requested or self._journal_busy:
+            if deadline is not None and time.monotonic() >= deadline:
+                print(f"[writeback] flush timed out with {len(self._pending)} writes pending (kept in journal)")
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "pending": len(self._pending),
+            "breaker": self.breaker.state,
+            "breaker_trips": self.breaker.trips,
+            "journal": str(self.journal_path),
+        }
@@ -0,0 +1,153 @@
+"""
+Offline tests for result aggregation: critical tests ordered first,
+fail-fast cancelling whatever is left once a required test fails, and usage
+rolled up per suite and per result.
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
+
+import aggregate  # noqa: E402
+from aggregate import ResultAggregator, is_required, order_tests  # noqa: E402
+from telemetry import combine_usage  # noqa: E402
+
+
+TESTS = [
+    {"name": "browse", "summary": "Open the catalogue"},
+    {"name": "checkout", "summary": "Critical: pay for the cart"},
+    {"name": "search"},
+    {"name": "login", "required": True},
+    {"name": "footer", "summary": "Links in the footer"},
+]
+
+
+def run_suite(aggregator, tests, outcomes):
+    """Mimic run_single_agent: run tests in priority order, cancel the rest after fail-fast."""
+    ran = []
+
+    async def scenario():
+        for test in order_tests(tests):
+            if aggregator.stop_event.is_set():
+                await aggregator.record(1, test, "CANCELLED")
+                continue
+            ran.append(test["name"])
+            await aggregator.record(1, test, outcomes.get(test["name"], "PASSED"))
+
+    asyncio.run(scenario())
+    return ran
+
+
+def test_critical_tests_first_in_db_order():
+    assert [t["name"] for t in order_tests(TESTS)] == ["checkout", "login", "browse", "search", "footer"]
+    assert [is_required(t) for t in TESTS] == [False, True, False, True, False]
+    assert [t["name"] for t in order_tests(TESTS[2:3] + TESTS[4:])] == ["search", "footer"]
+
+
+def test_fail_fast_on_a_critical_failure_cancels_the_rest():
+    aggregator = ResultAggregator(1, [{"suite_id": 1, "tests": TESTS}], fail_fast=True, flush_interval=60)
+    ran = run_suite(aggregator, TESTS, {"checkout": "FAILED"})
+    assert ran == ["checkout"]
+    assert aggregator.stop_reason == "required test 'checkout' failed"
+    overall = aggregator.overall_result()
+    assert (overall["failed_tests"], overall["cancelled_tests"], overall["pending_tests"]) == (1, 4, 0)
+    assert aggregator.run_status(final=True) == "FAILED"
+
+
+def test_fail_fast_ignores_optional_failures():
+    aggregator = ResultAggregator(1, [{"suite_id": 1, "tests": TESTS}], fail_fast=True, flush_interval=60)
+    ran = run_suite(aggregator, TESTS, {"browse": "FAILED", "footer": "FAILED"})
+    assert ran == ["checkout", "login", "browse", "search", "footer"]
+    assert not aggregator.stop_event.is_set()
+    assert aggregator.overall_result()["failed_tests"] == 2
+
+
+def test_without_fail_fast_every_test_runs():
+    aggregator = ResultAggregator(1, [{"suite_id": 1, "tests": TESTS}], fail_fast=False, flush_interval=60)
+    ran = run_suite(aggregator, TESTS, {"login": "FAILED"})
+    assert len(ran) == len(TESTS) and not aggregator.stop_event.is_set()
+    assert aggregator.overall_result()["cancelled_tests"] == 0
+
+
+def usage(turns, cost, **extra):
+    return {"turns": turns, "input_tokens": turns * 1000, "cached_input_tokens": turns * 800,
+            "output_tokens": turns * 50, "screenshots": turns, "cost_usd": cost, "duration_s": turns * 2.5, **extra}
+
+
+def test_combine_usage_sums_counters_and_counts_parts():
+    total = combine_usage([usage(2, 0.1), None, usage(3, 0.2, avg_turn_latency_s=1.2), {}], count_key="attempts")
+    assert total == {"turns": 5, "input_tokens": 5000, "cached_input_tokens": 4000, "output_tokens": 250,
+                     "screenshots": 5, "cost_usd": 0.3, "duration_s": 12.5, "attempts": 2}
+    assert combine_usage([])["turns"] == 0 and "tests" not in combine_usage([])
+
+
+def test_usage_rolls_up_per_suite_and_result(monkeypatch):
+    result_writes, suite_writes = [], []
+
+    async def update_result_fields(result_id, fields):
+        result_writes.append((result_id, fields))
+
+    async def update_suite_fields(suite_id, fields):
+        suite_writes.append((suite_id, fields))
+
+    monkeypatch.setattr(aggregate, "update_result_fields", update_result_fields)
+    monkeypatch.setattr(aggregate, "update_suite_fields", update_suite_fields)
+    specs = [
+        {"suite_id": 1, "tests": [{"name": "login"}, {"name": "search"}]},
+        {"suite_id": 2, "tests": [{"name": "checkout"}]},
+    ]
+
+    async def scenario():
+        aggregator = ResultAggregator(7, specs, flush_interval=0)
+        await aggregator.record(1, {"name": "login"}, "PASSED", usage(2, 0.1))
+        await aggregator.record(1, {"name": "search"}, "FAILED", usage(4, 0.25))
+        # A rerun revises the test: its usage replaces the first report instead of adding to it
+        await aggregator.record(1, {"name": "search"}, "PASSED", usage(6, 0.4))
+        await aggregator.record(2, {"name": "checkout"}, "CANCELLED")
+        return aggregator, await aggregator.finalize()
+
+    aggregator, final = asyncio.run(scenario())
+    assert aggregator.usage(1) == combine_usage([usage(2, 0.1), usage(6, 0.4)], count_key="tests")
+    assert aggregator.usage(2)["tests"] == 0
+    assert final["usage"] == aggregator.usage(1) and final["usage"]["cost_usd"] == 0.5 and final["usage"]["tests"] == 2
+    assert result_writes[-1] == (7, {"overall_result": final["overall_result"], "usage": final["usage"],
+                                     "run_status": "FAILED"})
+    suite_usage = [(sid, f["usage"]) for sid, f in suite_writes if "usage" in f]
+    # Suite usage is written when it changes; suites without any usage are left alone
+    assert [sid for sid, _ in suite_usage] == [1, 1, 1]
+    assert suite_usage[-1][1]["turns"] == 8
+
+
+def test_finalize_counts_tests_cancelled_by_preflight(monkeypatch):
+    result_writes, suite_writes = [], []
+    # Stored rows after a failed preflight cancelled the pending tests of a resumed result
+    stored = [
+        {"suite_id": 1, "tests": [{"name": "login", "run_status": "PASSED"}, {"name": "search", "run_status": "CANCELLED"}]},
+        {"suite_id": 2, "tests": [{"name": "checkout", "run_status": "CANCELLED"}]},
+    ]
+
+    class Queue:
+        async def flush(self, timeout):
+            return True
+
+    async def get_suites_with_tests_for_result(result_id):
+        return stored
+
+    async def update_result_fields(result_id, fields):
+        result_writes.append((result_id, fields))
+
+    async def update_suite_fields(suite_id, fields):
+        suite_writes.append((suite_id, fields))
+
+    monkeypatch.setattr(aggregate, "get_write_queue", Queue)
+    monkeypatch.setattr(aggregate, "get_suites_with_tests_for_result", get_suites_with_tests_for_result)
+    monkeypatch.setattr(aggregate, "update_result_fields", update_result_fields)
+    monkeypatch.setattr(aggregate, "update_suite_fields", update_suite_fields)
+
+    summary = asyncio.run(aggregate.finalize_result(9))
+    assert summary["run_status"] == "FAILED"
+    overall = summary["overall_result"]
+    assert (overall["passed_tests"], overall["cancelled_tests"], overall["pending_tests"]) == (1, 2, 0)
+    assert result_writes[-1][1]["overall_result"] == overall and result_writes[-1][1]["run_status"] == "FAILED"
+    assert sorted((sid, f["suites-success"]) for sid, f in suite_writes if "suites-success" in f) == [(1, False), (2, False)]
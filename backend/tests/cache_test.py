@@ -0,0 +1,67 @@
+"""
+Offline tests for the dashboard read cache: TTL expiry, prefix invalidation and
+invalidations reaching another process only through a shared backend.
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
+
+import cache  # noqa: E402
+from cache import MemoryBackend, ReadCache  # noqa: E402
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def counting_loader(counter, value):
+    async def load():
+        counter.append(value)
+        return value
+    return load
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    reads = []
+    read_cache = ReadCache(MemoryBackend(), ttl=5)
+
+    assert asyncio.run(read_cache.get_or_load("results:all", counting_loader(reads, {"v": 1}))) == {"v": 1}
+    clock.now += 4.9
+    assert asyncio.run(read_cache.get_or_load("results:all", counting_loader(reads, {"v": 2}))) == {"v": 1}
+    clock.now += 0.2
+    assert asyncio.run(read_cache.get_or_load("results:all", counting_loader(reads, {"v": 3}))) == {"v": 3}
+    assert reads == [{"v": 1}, {"v": 3}]
+    assert read_cache.stats()["hits"] == 1 and read_cache.stats()["misses"] == 2
+
+
+def test_invalidation_drops_only_matching_prefix():
+    read_cache = ReadCache(MemoryBackend(), ttl=60)
+    for key in ("suites:1:all", "suites:2:all", "tests:7:all"):
+        asyncio.run(read_cache.get_or_load(key, counting_loader([], key)))
+    read_cache.invalidate("suites:1:")
+    backend = read_cache.backend
+    assert backend.get("suites:1:all") is None
+    assert backend.get("suites:2:all") == "suites:2:all" and backend.get("tests:7:all") == "tests:7:all"
+    assert read_cache.stats()["invalidations"] == 1
+
+
+def test_invalidations_cross_processes_only_with_a_shared_backend():
+    # Two ReadCache instances stand in for the API and the runner process
+    api, runner = ReadCache(MemoryBackend(), ttl=60), ReadCache(MemoryBackend(), ttl=60)
+    asyncio.run(api.get_or_load("results:all", counting_loader([], "old")))
+    runner.invalidate("results:")
+    assert asyncio.run(api.get_or_load("results:all", counting_loader([], "new"))) == "old"
+
+    shared = MemoryBackend()  # what Redis provides across processes
+    api, runner = ReadCache(shared, ttl=60), ReadCache(shared, ttl=60)
+    asyncio.run(api.get_or_load("results:all", counting_loader([], "old")))
+    runner.invalidate("results:")
+    assert asyncio.run(api.get_or_load("results:all", counting_loader([], "new"))) == "new"
@@ -0,0 +1,121 @@
+"""
+Offline tests for the AIMD agent limiter: error classification, additive
+increase / multiplicative decrease, one slot per agent run and leases capped
+by the limit.
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
+
+from concurrency import AIMDLimiter, classify_error, lease_within_limit, run_with_slot  # noqa: E402
+from leases import ContainerLeaseManager  # noqa: E402
+
+
+class ConnectionClosedError(Exception):
+    """Same name as the websockets exception the computer interface raises."""
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+def test_only_vm_and_transport_errors_count_as_vm_errors():
+    assert classify_error(ConnectionRefusedError(111, "Connection refused")) == "vm"
+    assert classify_error(ConnectionClosedError("received 1011 (internal error)")) == "vm"
+    assert classify_error(RuntimeError("computer-server at 10.0.0.4:8000 is unreachable")) == "vm"
+    assert classify_error(RateLimitError("slow down")) == "rate_limit"
+    assert classify_error(RuntimeError("Error code: 529 - overloaded_error")) == "rate_limit"
+    # Ordinary failures that merely mention the computer tool or a container element
+    assert classify_error(AssertionError("computer call returned no screenshot")) is None
+    assert classify_error(KeyError("computer_call_output")) is None
+    assert classify_error(ValueError("div.container not found on page")) is None
+
+
+def test_aimd_increase_and_cut():
+    limiter = AIMDLimiter(ceiling=4, initial=2, latency_target_s=10, cooldown_s=60)
+    limiter.on_turn(1.0)
+    limiter.on_turn(1.0)
+    assert limiter.current_limit == 3
+    limiter.on_error(ConnectionResetError("Connection reset by peer"))
+    assert limiter.current_limit == 1 and limiter.stats["vm_errors"] == 1
+    # Within the cooldown a second report of the same episode doesn't cut again
+    limiter.on_turn(30.0)
+    assert limiter.current_limit == 1 and limiter.stats["decreases"] == 1
+    limiter.on_error(AssertionError("computer call failed"))
+    assert limiter.stats["vm_errors"] == 1
+
+
+def test_nothing_is_leased_while_the_limiter_is_saturated():
+    manager = ContainerLeaseManager(["vm-1", "vm-2", "vm-3"], poll_interval=0.01)
+    limiter = AIMDLimiter(ceiling=2, initial=2)
+    events = []
+
+    async def result(name, count, hold):
+        async with lease_within_limit(manager, count, name, limiter=limiter) as containers:
+            events.append((name, list(containers)))
+
+            async def run():
+                await hold.wait()
+
+            await asyncio.gather(*(run_with_slot(run, limiter=limiter) for _ in containers))
+
+    async def scenario():
+        first_hold, second_hold = asyncio.Event(), asyncio.Event()
+        first = asyncio.create_task(result("first", 3, first_hold))
+        await asyncio.sleep(0.05)
+        # Capped at the limit: the first result leases two of the three VMs and runs on both
+        assert [len(c) for _, c in events] == [2] and limiter.in_flight == 2
+        second = asyncio.create_task(result("second", 1, second_hold))
+        await asyncio.sleep(0.05)
+        # The second result waits on the limiter without holding a lease on the free VM
+        assert len(events) == 1 and set(manager.table.holders()) == set(events[0][1])
+        first_hold.set()
+        await first
+        await asyncio.sleep(0.05)
+        assert events[1][0] == "second" and len(events[1][1]) == 1
+        second_hold.set()
+        await second
+        assert limiter.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_throttling_lowers_concurrency_inside_a_running_result():
+    manager = ContainerLeaseManager(["vm-1", "vm-2", "vm-3"], poll_interval=0.01)
+    limiter = AIMDLimiter(ceiling=3, initial=3, cooldown_s=60)
+    active, started = [0], []
+
+    async def run_suite(name):
+        active[0] += 1
+        started.append((name, active[0], limiter.current_limit))
+        try:
+            await asyncio.sleep(0.02)
+            if name == "a1":
+                raise RateLimitError("Error code: 429 - rate_limit_error")
+            await asyncio.sleep(0.05)
+        finally:
+            active[0] -= 1
+
+    async def container_queue(suites):
+        # Mirrors runner._run_container_queue: one slot per suite, a failed suite doesn't stop the queue
+        for name in suites:
+            try:
+                await run_with_slot(run_suite, name, limiter=limiter)
+            except RateLimitError:
+                pass
+
+    async def scenario():
+        async with lease_within_limit(manager, 3, "result", limiter=limiter) as containers:
+            assert len(containers) == 3
+            await asyncio.gather(*(container_queue(q) for q in (["a1", "a2"], ["b1", "b2"], ["c1", "c2"])))
+
+    asyncio.run(scenario())
+    assert limiter.current_limit == 1 and limiter.stats["rate_limits"] == 1
+    first_wave = [n for n, _, _ in started[:3]]
+    assert sorted(first_wave) == ["a1", "b1", "c1"]
+    # After the cut every remaining suite of the same result runs alone
+    assert sorted(n for n, _, _ in started[3:]) == ["a2", "b2", "c2"]
+    assert all((concurrent, limit) == (1, 1) for _, concurrent, limit in started[3:])
+    assert len(started) == 6 and limiter.in_flight == 0
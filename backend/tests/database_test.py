@@ -0,0 +1,207 @@
+"""
+Offline tests for the Supabase helpers in database.py against an in-memory
+PostgREST double that rejects columns the live schema doesn't have.
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("supabase")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
+
+import database  # noqa: E402
+from writeback import WriteBehindQueue  # noqa: E402
+
+# Live column names (note the hyphenated legacy ones)
+COLUMNS = {
+    "results": {"id", "created_at", "pr-link", "pr_name", "overall_result", "run_status", "eta_seconds",
+                "res-success", "preflight", "usage"},
+    "suites": {"id", "created_at", "result_id", "name", "suites-success", "s3-link", "usage"},
+    "tests": {"id", "created_at", "suite_id", "name", "summary", "test_success", "run_status", "steps", "s3_link",
+              "routing", "duration_s", "rerun", "runner_id", "heartbeat_at", "usage", "media", "evidence", "visual"},
+    "test_steps": {"id", "test_id", "seq", "created_at", "text", "actions", "screenshot"},
+}
+
+
+class APIError(Exception):
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+
+class Query:
+    def __init__(self, db, table):
+        self.db, self.table = db, table
+        self.action, self.payload = "select", None
+        self.filters, self.ordering, self.limit_to = [], None, None
+
+    def _check(self, row):
+        unknown = set(row) - COLUMNS[self.table]
+        if unknown:
+            raise APIError(f"Could not find the '{sorted(unknown)[0]}' column of '{self.table}'", "PGRST204")
+
+    def insert(self, payload):
+        self.action, self.payload = "insert", payload
+        return self
+
+    def upsert(self, row, on_conflict):
+        self.action, self.payload, self.on_conflict = "upsert", row, on_conflict.split(",")
+        return self
+
+    def delete(self):
+        self.action = "delete"
+        return self
+
+    def select(self, *_):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row.get(column) > value)
+        return self
+
+    def order(self, column, desc=False):
+        self.ordering = (column, desc)
+        return self
+
+    def limit(self, count):
+        self.limit_to = count
+        return self
+
+    def execute(self):
+        if self.action == "select" and self.db.reads_down:
+            raise APIError("connection refused", "08006")
+        rows = self.db.tables.setdefault(self.table, [])
+        if self.action == "insert":
+            payload = self.payload if isinstance(self.payload, list) else [self.payload]
+            self.db.inserts.append((self.table, payload))
+            inserted = []
+            for row in payload:
+                self._check(row)
+                self.db.next_id += 1
+                inserted.append({**row, "id": self.db.next_id})
+            rows.extend(inserted)
+            return Response(inserted)
+        if self.action == "upsert":
+            self._check(self.payload)
+            key = [self.payload.get(c) for c in self.on_conflict]
+            self.db.tables[self.table] = [r for r in rows if [r.get(c) for c in self.on_conflict] != key]
+            self.db.tables[self.table].append(dict(self.payload))
+            return Response([self.payload])
+        matched = [r for r in rows if all(f(r) for f in self.filters)]
+        if self.action == "delete":
+            self.db.tables[self.table] = [r for r in rows if r not in matched]
+            return Response(matched)
+        if self.ordering:
+            column, desc = self.ordering
+            matched.sort(key=lambda r: r[column], reverse=desc)
+        return Response(matched[: self.limit_to] if self.limit_to is not None else matched)
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.tables, self.inserts, self.next_id = {}, [], 0
+        self.reads_down = False
+
+    def table(self, name):
+        return Query(self, name)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeSupabase()
+    monkeypatch.setattr(database, "supabase", fake)
+    return fake
+
+
+def test_create_result_tree_uses_live_column_names(db):
+    tree = asyncio.run(database.create_result_tree("Feature: login", "https://github.com/o/r/pull/1", [
+        {"name": "auth", "tests": [{"name": "sign-in", "summary": "Sign in"}, {"name": "sign-out"}]},
+        {"name": "empty", "tests": []},
+    ]))
+    assert tree is not None
+    assert [(s["name"], [t["name"] for t in s["tests"]]) for s in tree["suites"]] == [
+        ("auth", ["sign-in", "sign-out"]), ("empty", []),
+    ]
+    # One multi-row insert per table, with the same keys create_result writes
+    assert [table for table, _ in db.inserts] == ["results", "suites", "tests"]
+    assert set(db.inserts[0][1][0]) == {"pr_name", "pr-link", "overall_result", "run_status"}
+    assert db.tables["results"][0]["pr-link"] == "https://github.com/o/r/pull/1"
+    assert {"suite_id", "name", "summary", "steps", "run_status", "test_success"} == set(db.inserts[2][1][0])
+
+
+def test_create_result_and_result_tree_write_the_same_result_keys(db):
+    asyncio.run(database.create_result("PR", "https://github.com/o/r/pull/2", {}, "QUEUED"))
+    asyncio.run(database.create_result_tree("PR", "https://github.com/o/r/pull/2", []))
+    single, tree = db.inserts[0][1][0], db.inserts[1][1][0]
+    assert set(tree) <= set(single)
+
+
+def test_step_log_appends_in_seq_order(db, tmp_path, monkeypatch):
+    queue = WriteBehindQueue(database._apply_write, journal_path=str(tmp_path / "journal.jsonl"))
+    monkeypatch.setattr(database, "_write_queue", queue)
+    monkeypatch.setattr(database, "_step_seq", {})
+    # Rows from before a resume, stored out of order
+    db.tables["test_steps"] = [
+        {"test_id": 7, "seq": 2, "text": "Clicking Sign in", "actions": [], "screenshot": None},
+        {"test_id": 7, "seq": 1, "text": "Navigating to home", "actions": [], "screenshot": None},
+    ]
+
+    async def scenario():
+        seqs = [
+            await database.append_test_step(7, "Typing email", [{"type": "type", "text": "a@b.c"}], "f00d"),
+            await database.append_test_step(8, "Opening pricing"),
+            await database.append_test_step(7, "Verifying dashboard"),
+        ]
+        assert await queue.flush(timeout=5)
+        return seqs, await database.get_test_steps(7), await database.get_test_steps(7, after=2), await database.get_test_steps(8)
+
+    seqs, steps, tail, other = asyncio.run(scenario())
+    assert seqs == [3, 1, 4]
+    assert [(s["seq"], s["text"]) for s in steps] == [
+        (1, "Navigating to home"), (2, "Clicking Sign in"), (3, "Typing email"), (4, "Verifying dashboard"),
+    ]
+    assert steps[2]["actions"] == [{"type": "type", "text": "a@b.c"}] and steps[2]["screenshot"] == "f00d"
+    assert [s["seq"] for s in tail] == [3, 4]
+    assert [(s["seq"], s["text"]) for s in other] == [(1, "Opening pricing")]
+
+
+def test_step_log_never_overwrites_rows_when_the_log_cannot_be_read(db, tmp_path, monkeypatch):
+    queue = WriteBehindQueue(database._apply_write, journal_path=str(tmp_path / "journal.jsonl"))
+    monkeypatch.setattr(database, "_write_queue", queue)
+    monkeypatch.setattr(database, "_step_seq", {})
+    db.tables["test_steps"] = [
+        {"test_id": 7, "seq": 1, "text": "Navigating to home", "actions": [], "screenshot": None},
+        {"test_id": 7, "seq": 2, "text": "Clicking Sign in", "actions": [], "screenshot": None},
+    ]
+
+    async def scenario():
+        db.reads_down = True
+        first = await database.append_test_step(7, "Typing email")
+        second = await database.append_test_step(7, "Submitting")
+        database.finish_test_steps(7)
+        db.reads_down = False
+        assert await queue.flush(timeout=5)
+        # The next run of the test re-reads the log and continues after the fallback rows
+        third = await database.append_test_step(7, "Rerun: navigating to home")
+        database.finish_test_steps(7)
+        assert await queue.flush(timeout=5)
+        return first, second, third, await database.get_test_steps(7)
+
+    first, second, third, steps = asyncio.run(scenario())
+    assert first > 2 and second == first + 1 and third == second + 1
+    assert [s["text"] for s in steps] == [
+        "Navigating to home", "Clicking Sign in", "Typing email", "Submitting", "Rerun: navigating to home",
+    ]
+    assert database._step_seq == {}
@@ -0,0 +1,60 @@
+"""
+Offline tests for duration estimates and longest-processing-time-first packing.
+"""
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
+
+from durations import DurationStore, plan_lpt, representative_run  # noqa: E402
+
+
+def suite(name, *seconds):
+    return {"suite_id": name, "tests": [{"name": f"{name}-{i}", "seconds": s} for i, s in enumerate(seconds)]}
+
+
+def test_lpt_packs_longest_suites_first_onto_the_least_loaded_container():
+    specs = [suite("a", 30), suite("b", 100), suite("c", 60), suite("d", 50), suite("e", 40)]
+    estimate = lambda spec: sum(t["seconds"] for t in spec["tests"])  # noqa: E731
+    queues, loads = plan_lpt(specs, ["vm-1", "vm-2"], estimate)
+    assert {c: [s["suite_id"] for s in q] for c, q in queues.items()} == {"vm-1": ["b", "e"], "vm-2": ["c", "d", "a"]}
+    assert loads == {"vm-1": 140.0, "vm-2": 140.0}
+    # More containers than suites: the spares stay idle
+    queues, loads = plan_lpt(specs[:1], ["vm-1", "vm-2"], estimate)
+    assert queues["vm-2"] == [] and loads["vm-2"] == 0.0
+
+
+def test_estimates_use_an_ewma_by_summary_then_name(tmp_path, monkeypatch):
+    monkeypatch.setenv("QAI_SUITE_OVERHEAD_S", "10")
+    store = DurationStore(str(tmp_path / "durations.json"), alpha=0.5, default_s=90)
+    login = {"name": "login", "summary": "Sign in with email"}
+    store.record(login, 100)
+    store.record(login, 50)
+    assert store.estimate(login) == 75
+    # Renamed test, same summary: the summary estimate carries over
+    assert store.estimate({"name": "sign-in", "summary": "Sign in with email"}) == 75
+    assert store.estimate({"name": "login"}) == 75
+    assert store.estimate({"name": "new"}) == 90
+    assert store.estimate_suite({"tests": [login, {"name": "new"}]}) == 175
+
+
+def test_writes_are_batched_until_flush(tmp_path):
+    path = tmp_path / "durations.json"
+    store = DurationStore(str(path))
+    store.record({"name": "a"}, 12)
+    store.record({"name": "b"}, 34)
+    assert not path.exists()
+    store.flush()
+    assert json.loads(path.read_text()) == {"name:a": {"ewma_s": 12, "samples": 1}, "name:b": {"ewma_s": 34, "samples": 1}}
+    mtime = path.stat().st_mtime_ns
+    store.flush()
+    assert path.stat().st_mtime_ns == mtime
+    assert DurationStore(str(path)).estimate({"name": "b"}) == 34
+
+
+def test_only_full_agent_runs_are_representative():
+    assert representative_run("PASSED") and representative_run("FAILED")
+    assert not representative_run("CANCELLED")
+    assert not representative_run("FAILED", replica=True)
+    assert not representative_run("PASSED", replayed=True)
@@ -0,0 +1,97 @@
+"""
+Cold-start guard for the serverless API handler (agents/api/index.py).
+
+Imports the handler in a fresh interpreter and fails when any agent runtime
+module ends up in sys.modules, or when the total `python -X importtime` import
+time exceeds QAI_IMPORT_BUDGET_MS (default 2000). mangum is only needed for the
+handler object at the bottom of index.py, so a stand-in is used when it isn't
+installed; missing fastapi or python-dotenv fails the tests rather than skipping.
+"""
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, Set
+
+import pytest
+
+API_DIR = Path(__file__).resolve().parent.parent / "agents" / "api"
+
+# Modules that must only be imported by the run endpoints
+AGENT_RUNTIME = {"runner", "agent", "computer", "record", "screenshots", "spool", "routing", "leases"}
+
+
+# Run in the child interpreter before `import index`
+MANGUM_STANDIN = (
+    "import importlib.util, sys, types\n"
+    "if importlib.util.find_spec('mangum') is None:\n"
+    "    sys.modules['mangum'] = types.SimpleNamespace(Mangum=lambda app: app)\n"
+)
+
+
+def _run_index(code: str, *flags: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=str(API_DIR))
+    proc = subprocess.run(
+        [sys.executable, *flags, "-c", MANGUM_STANDIN + code],
+        cwd=str(API_DIR),
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    return proc
+
+
+def loaded_modules() -> Set[str]:
+    """Top-level names of every module in sys.modules after `import index`."""
+    proc = _run_index("import index, json\nprint(json.dumps(sorted(sys.modules)))")
+    return {name.split(".")[0] for name in json.loads(proc.stdout.strip().splitlines()[-1])}
+
+
+def measure_import() -> Dict[str, int]:
+    """Return {top-level module: cumulative import time in us} for `import index`."""
+    proc = _run_index("import index", "-X", "importtime")
+    modules: Dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # header row
+        # Nested imports are indented under their parent; top-level ones add up to the total
+        if name.startswith(" ") and not name.startswith("  "):
+            modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def _require_api_deps() -> None:
+    missing = [dep for dep in ("fastapi", "dotenv") if importlib.util.find_spec(dep) is None]
+    if missing:
+        pytest.fail(f"API dependencies not installed: {missing} (pip install -r requirements.txt)")
+
+
+def test_handler_does_not_import_agent_runtime() -> None:
+    _require_api_deps()
+    loaded = loaded_modules()
+    # The check itself must see nested imports: index pulls in the database layer
+    assert {"index", "database", "listing", "cache"} <= loaded
+    assert not loaded & AGENT_RUNTIME, f"agent runtime imported at cold start: {sorted(loaded & AGENT_RUNTIME)}"
+
+
+def test_handler_import_time_budget() -> None:
+    _require_api_deps()
+    budget_ms = float(os.getenv("QAI_IMPORT_BUDGET_MS", 2000))
+    modules = measure_import()
+    total_ms = sum(modules.values()) / 1000
+    slowest = sorted(modules.items(), key=lambda kv: kv[1], reverse=True)[:5]
+    assert total_ms <= budget_ms, f"import took {total_ms:.0f} ms (budget {budget_ms:.0f} ms); slowest: {slowest}"
+
+
+if __name__ == "__main__":
+    modules = measure_import()
+    for name, us in sorted(modules.items(), key=lambda kv: kv[1], reverse=True)[:15]:
+        print(f"{us / 1000:8.1f} ms  {name}")
+    print(f"{sum(modules.values()) / 1000:8.1f} ms  total")
@@ -0,0 +1,103 @@
+"""
+Offline tests for the SQLite job queue used by worker.py: leasing order,
+heartbeats, visibility timeouts for crashed workers and group completion.
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
+
+from jobqueue import SqliteJobQueue  # noqa: E402
+
+
+def make_queue(tmp_path, visibility_timeout=60.0):
+    return SqliteJobQueue(str(tmp_path / "jobs.db"), visibility_timeout=visibility_timeout)
+
+
+def test_lease_order_and_exclusivity(tmp_path):
+    queue = make_queue(tmp_path)
+    low = queue.enqueue("suite", {"suite_id": 1}, priority=5)
+    high = queue.enqueue("suite", {"suite_id": 2}, priority=0)
+
+    first = queue.lease("w1")
+    second = queue.lease("w2")
+    assert (first["id"], second["id"]) == (high, low)
+    assert first["payload"] == {"suite_id": 2}
+    assert queue.lease("w3") is None
+
+
+def test_complete_requires_lease_holder(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = queue.enqueue("suite", {"suite_id": 1}, group="result:7")
+    job = queue.lease("w1")
+    assert not queue.complete(job_id, "w2", [])
+    assert queue.complete(job_id, "w1", [{"name": "login", "test_success": True}])
+    assert queue.group_finished("result:7")
+    assert queue.group_jobs("result:7")[0]["result"] == [{"name": "login", "test_success": True}]
+    assert job["attempts"] == 1
+
+
+def test_crashed_worker_job_becomes_visible_again(tmp_path):
+    queue = make_queue(tmp_path, visibility_timeout=0.2)
+    job_id = queue.enqueue("suite", {"suite_id": 1}, group="result:1")
+    assert queue.lease("crashed")["id"] == job_id
+    assert queue.lease("w2") is None
+    assert not queue.group_finished("result:1")
+
+    time.sleep(0.3)
+    retry = queue.lease("w2")
+    assert retry["id"] == job_id and retry["attempts"] == 2
+    # The crashed worker can no longer heartbeat or report
+    assert not queue.heartbeat(job_id, "crashed")
+    assert not queue.complete(job_id, "crashed", [])
+    assert queue.complete(job_id, "w2", [])
+
+
+def test_heartbeat_keeps_lease(tmp_path):
+    queue = make_queue(tmp_path, visibility_timeout=0.3)
+    job_id = queue.enqueue("suite", {})
+    queue.lease("w1")
+    for _ in range(3):
+        time.sleep(0.15)
+        assert queue.heartbeat(job_id, "w1")
+    assert queue.lease("w2") is None
+
+
+def test_attempts_are_bounded(tmp_path):
+    queue = make_queue(tmp_path, visibility_timeout=0.1)
+    job_id = queue.enqueue("suite", {}, group="g", max_attempts=2)
+    queue.lease("w1")
+    assert queue.fail(job_id, "w1", "container unreachable")
+    queue.lease("w2")
+    time.sleep(0.2)
+    assert queue.lease("w3") is None
+    job = queue.group_jobs("g")[0]
+    assert job["status"] == "failed" and job["attempts"] == 2
+    assert queue.group_finished("g")
+    assert queue.stats()["jobs"] == {"failed": 1}
+
+
+def test_finished_group_is_claimed_once_however_it_finished(tmp_path):
+    queue = make_queue(tmp_path, visibility_timeout=0.1)
+    done = queue.enqueue("suite", {"suite_id": 1}, group="result:1")
+    failed = queue.enqueue("suite", {"suite_id": 2}, group="result:1", max_attempts=1)
+    expired = queue.enqueue("suite", {"suite_id": 3}, group="result:2", max_attempts=1)
+
+    queue.lease("w1"), queue.lease("w2"), queue.lease("w3")
+    assert queue.complete(done, "w1", [])
+    assert queue.claim_finished_groups() == []
+    # The last job of result:1 fails for good; result:2's worker dies on its only attempt
+    assert queue.fail(failed, "w2", "agent crashed")
+    time.sleep(0.2)
+    assert sorted(queue.claim_finished_groups()) == ["result:1", "result:2"]
+    assert queue.claim_finished_groups() == []
+    assert [j["status"] for j in queue.group_jobs("result:2")] == ["failed"]
+    assert expired == queue.group_jobs("result:2")[0]["id"]
+
+    # Running the result again makes it claimable again once the new job ends
+    rerun = queue.enqueue("suite", {"suite_id": 3}, group="result:2")
+    assert queue.claim_finished_groups() == []
+    queue.lease("w4")
+    assert queue.complete(rerun, "w4", [])
+    assert queue.claim_finished_groups() == ["result:2"]
@@ -0,0 +1,106 @@
+"""
+Offline tests for container leases: priority admission, TTL expiry and
+reclaim through the shared SQLite table, renewal, and losing a lease.
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
+
+from leases import ContainerLeaseManager, LeaseLost, MemoryLeaseTable, SqliteLeaseTable  # noqa: E402
+
+
+def test_admission_by_priority_then_fifo():
+    manager = ContainerLeaseManager(["vm-1"], poll_interval=0.01)
+    order = []
+
+    async def run(owner, priority, started):
+        started.set()
+        async with manager.lease(1, owner, priority):
+            order.append(owner)
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        async with manager.lease(1, "holder"):
+            tasks = []
+            for owner, priority in (("low-a", 5), ("high", 0), ("low-b", 5), ("mid", 1)):
+                started = asyncio.Event()
+                tasks.append(asyncio.create_task(run(owner, priority, started)))
+                await started.wait()
+                await asyncio.sleep(0)
+            await asyncio.sleep(0.05)
+            assert [w["owner"] for w in manager.stats()["waiting"]] == ["high", "mid", "low-a", "low-b"]
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert order == ["high", "mid", "low-a", "low-b"]
+    assert manager.stats()["admitted"] == 5 and manager.stats()["queue_depth"] == 0
+
+
+def test_sqlite_leases_expire_and_are_reclaimed_across_processes(tmp_path):
+    db = str(tmp_path / "leases.db")
+    first, second = SqliteLeaseTable(db), SqliteLeaseTable(db)  # two runner processes
+    assert first.claim(["vm-1", "vm-2"], 2, "crashed", ttl=0.2) == ["vm-1", "vm-2"]
+    assert second.claim(["vm-1", "vm-2"], 1, "next", ttl=60) == []
+    time.sleep(0.3)
+    assert second.holders() == {}
+    assert second.claim(["vm-1", "vm-2"], 2, "next", ttl=60) == ["vm-1", "vm-2"]
+    assert first.holders() == {"vm-1": "next", "vm-2": "next"}
+    # The crashed owner's renewals find nothing to extend
+    assert first.renew("crashed", 60) == 0
+    second.release("next")
+    assert first.holders() == {}
+
+
+def test_renewal_keeps_a_lease_past_its_ttl(tmp_path):
+    table = SqliteLeaseTable(str(tmp_path / "leases.db"))
+    manager = ContainerLeaseManager(["vm-1"], table=table, ttl=0.3, poll_interval=0.01)
+    other = ContainerLeaseManager(["vm-1"], table=SqliteLeaseTable(table.path), ttl=0.3, poll_interval=0.01)
+
+    async def scenario():
+        async with manager.lease(1, "long-run") as containers:
+            await asyncio.sleep(0.8)
+            assert table.holders() == {"vm-1": "long-run"}
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(other.acquire(1, "intruder"), 0.2)
+            return containers
+
+    assert asyncio.run(scenario()) == ["vm-1"]
+    assert table.holders() == {}
+
+
+def test_expired_lease_is_reacquired_when_still_free():
+    table = MemoryLeaseTable()
+    manager = ContainerLeaseManager(["vm-1", "vm-2"], table=table, ttl=0.3, poll_interval=0.01)
+
+    async def scenario():
+        async with manager.lease(2, "stalled"):
+            # As if the loop stalled past the TTL: the rows are gone but nobody took the VMs
+            table.release("stalled")
+            await asyncio.sleep(0.2)
+            assert table.holders() == {"vm-1": "stalled", "vm-2": "stalled"}
+
+    asyncio.run(scenario())
+
+
+def test_lease_taken_by_another_owner_aborts_the_holder():
+    table = MemoryLeaseTable()
+    manager = ContainerLeaseManager(["vm-1", "vm-2"], table=table, ttl=0.3, poll_interval=0.01)
+    reached_end = []
+
+    async def scenario():
+        async with manager.lease(2, "stalled"):
+            table.release("stalled")
+            assert table.claim(["vm-2"], 1, "other", ttl=60) == ["vm-2"]
+            await asyncio.sleep(1)
+            reached_end.append(True)
+
+    with pytest.raises(LeaseLost, match="vm-2"):
+        asyncio.run(scenario())
+    assert reached_end == []
+    # The other owner keeps its container; the aborted holder left nothing behind
+    assert table.holders() == {"vm-2": "other"}
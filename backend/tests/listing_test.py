@@ -0,0 +1,87 @@
+"""
+Offline tests for the dashboard listing helpers: cursor validation before it
+reaches a PostgREST filter, LIKE escaping and keyset pagination.
+"""
+import base64
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
+
+from fastapi import HTTPException  # noqa: E402
+
+from listing import decode_cursor, encode_cursor, escape_like, paginate  # noqa: E402
+
+
+def raw_cursor(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+class Query:
+    def __init__(self, rows):
+        self.rows, self.filters, self.orders, self.limit_to = rows, [], [], None
+
+    def or_(self, expression):
+        self.filters.append(expression)
+        return self
+
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, count):
+        self.limit_to = count
+        return self
+
+    def execute(self):
+        return type("Response", (), {"data": self.rows[: self.limit_to]})()
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor({"created_at": "2026-03-01T10:00:00.123456+00:00", "id": 42, "name": "x"})
+    assert decode_cursor(cursor) == ("2026-03-01T10:00:00.123456+00:00", 42)
+
+
+@pytest.mark.parametrize("payload", [
+    # Filter injection through the timestamp
+    {"created_at": "2026-03-01,id.gt.0)", "id": 1},
+    {"created_at": "2026-03-01T10:00:00),or(id.gt.0", "id": 1},
+    {"created_at": None, "id": 1},
+    {"created_at": "2026-03-01T10:00:00", "id": "1),or(id.gt.0"},
+    {"created_at": "2026-03-01T10:00:00", "id": True},
+    {"created_at": "2026-03-01T10:00:00", "id": 0},
+    {"created_at": "2026-03-01T10:00:00", "id": 1.5},
+    {"id": 1},
+])
+def test_tampered_cursors_are_rejected(payload):
+    with pytest.raises(HTTPException) as err:
+        decode_cursor(raw_cursor(payload))
+    assert err.value.status_code == 400
+
+
+def test_garbage_cursor_is_rejected():
+    with pytest.raises(HTTPException):
+        decode_cursor("not base64 json!")
+
+
+def test_paginate_filters_after_the_cursor_position():
+    rows = [{"created_at": f"2026-03-0{d}T00:00:00+00:00", "id": d} for d in (5, 4, 3)]
+    query = Query(rows)
+    page, next_cursor = paginate(query, 2, raw_cursor({"created_at": "2026-03-06T00:00:00Z", "id": 9}))
+    assert query.filters == [
+        "created_at.lt.2026-03-06T00:00:00+00:00,and(created_at.eq.2026-03-06T00:00:00+00:00,id.lt.9)"
+    ]
+    assert query.orders == [("created_at", True), ("id", True)] and query.limit_to == 3
+    assert [r["id"] for r in page] == [5, 4] and decode_cursor(next_cursor) == ("2026-03-04T00:00:00+00:00", 4)
+    assert paginate(Query(rows[:1]), 2, None) == (rows[:1], None)
+
+
+def test_escape_like_matches_wildcards_literally():
+    assert escape_like("100%_done") == "100\\%\\_done"
+    assert escape_like("a\\b") == "a\\\\b"
+    assert escape_like("Feature: login") == "Feature: login"
@@ -0,0 +1,80 @@
+"""
+Offline tests for the deployment pre-flight probe against a local HTTP stand-in.
+"""
+import asyncio
+import socket
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
+
+from preflight import describe_failure, extract_routes, run_preflight  # noqa: E402
+
+STATUS_BY_PATH = {"/": 200, "/login": 200, "/pricing": 200, "/admin": 403, "/checkout": 502}
+
+
+class StandIn(BaseHTTPRequestHandler):
+    def do_GET(self):
+        status = STATUS_BY_PATH.get(self.path, 404)
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def base_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def specs(*summaries):
+    return [{"suite_id": 1, "tests": [{"name": f"t{i}", "summary": s} for i, s in enumerate(summaries)]}]
+
+
+def test_extract_routes_from_summaries():
+    base = "https://shop.example.com"
+    routes = extract_routes(base, specs(
+        "Open /login and sign in, then visit https://shop.example.com/pricing.",
+        "Check https://other.example.com/x is ignored and so is and/or wording",
+        "Go to '/settings/profile' then /login again",
+    ))
+    assert routes == [
+        "https://shop.example.com/pricing",
+        "https://shop.example.com/login",
+        "https://shop.example.com/settings/profile",
+    ]
+
+
+def test_healthy_deployment_passes(base_url):
+    report = asyncio.run(run_preflight(base_url, specs("Sign in on /login", "Admins only: /admin")))
+    assert report["ok"]
+    assert [c["status"] for c in report["checked"]] == [200, 200, 403]
+    assert [w["url"] for w in report["warnings"]] == [f"{base_url}/admin"]
+
+
+def test_5xx_route_fails_fast(base_url):
+    report = asyncio.run(run_preflight(base_url, specs("Buy something on /checkout")))
+    assert not report["ok"]
+    assert report["failures"][0]["status"] == 502
+    assert report["duration_ms"] < 2000
+    assert "/checkout -> 502" in describe_failure(report)
+
+
+def test_unreachable_deployment_fails():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    report = asyncio.run(run_preflight(f"http://127.0.0.1:{port}", specs("Open /login"), timeout=1))
+    assert not report["ok"]
+    assert all(f["status"] is None and f["error"] for f in report["failures"])
@@ -0,0 +1,127 @@
+"""
+Offline tests for preview rendering when ffmpeg fails: fake ffprobe/ffmpeg
+scripts on PATH stand in for the VM's binaries and uploads are captured.
+"""
+import json
+import os
+import stat
+import sys
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
+
+from previews import render_previews  # noqa: E402
+
+FFPROBE = """#!/bin/sh
+echo '{"streams": [{"width": 1280, "height": 800}], "format": {"duration": "%s"}}'
+"""
+
+# Writes its output file (the last argument) unless an argument matches $FAKE_FFMPEG_FAIL
+FFMPEG = """#!/bin/sh
+for arg in "$@"; do
+  out="$arg"
+  case "$arg" in $FAKE_FFMPEG_FAIL) echo "fake ffmpeg: cannot encode $arg" >&2; exit 1;; esac
+done
+printf 'frame' > "$out"
+"""
+
+
+def install(bin_dir, name, body):
+    path = bin_dir / name
+    path.write_text(body)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+
+
+@pytest.fixture
+def video(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    install(bin_dir, "ffprobe", FFPROBE % "12.0")
+    install(bin_dir, "ffmpeg", FFMPEG)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}/usr/bin{os.pathsep}/bin")
+    monkeypatch.setenv("FAKE_FFMPEG_FAIL", "__never__")
+    path = tmp_path / "test.mp4"
+    path.write_bytes(b"mp4")
+    return path
+
+
+@pytest.fixture
+def uploads(monkeypatch):
+    sent = []
+
+    class Response:
+        def __init__(self, name):
+            self.name = name
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def read(self):
+            return json.dumps({"fileUrl": f"https://files.example/{self.name}"}).encode()
+
+    def urlopen(req, timeout=None):
+        name = req.full_url.rsplit("/", 1)[-1]
+        sent.append(name)
+        return Response(name)
+
+    monkeypatch.setattr(urllib.request, "urlopen", urlopen)
+    return sent
+
+
+def put_urls():
+    return {
+        key: {"put_url": f"https://bucket.example/{key}", "url": f"https://cdn.example/{key}", "content_type": ctype}
+        for key, ctype in (("poster", "image/jpeg"), ("sprite", "image/jpeg"), ("preview", "video/mp4"))
+    }
+
+
+def test_all_renditions_rendered_and_uploaded(video, uploads):
+    result = render_previews(str(video), step_offsets=[1.0, 4.5, 30.0], put_urls=put_urls())
+    assert result["ok"] and result["errors"] == []
+    assert result["poster"] == "https://cdn.example/poster" and result["preview"] == "https://cdn.example/preview"
+    assert result["sprite"]["offsets_s"] == [1.0, 4.5, 11.8] and result["sprite"]["tile_height"] == 200
+    assert sorted(uploads) == ["poster", "preview", "sprite"]
+
+
+def test_failed_preview_encode_keeps_the_other_renditions(video, uploads, monkeypatch):
+    monkeypatch.setenv("FAKE_FFMPEG_FAIL", "libx264")
+    result = render_previews(str(video), step_offsets=[2.0], put_urls=put_urls())
+    assert result["ok"] and result["preview"] is None and result["poster"] == "https://cdn.example/poster"
+    assert result["sprite"]["url"] == "https://cdn.example/sprite"
+    assert "preview" not in uploads and "preview" not in result["bytes"]
+    assert result["errors"] == ["fake ffmpeg: cannot encode libx264"]
+
+
+def test_ffmpeg_failing_everywhere_uploads_nothing_stale(video, uploads, monkeypatch):
+    # Renditions from an earlier run of the same recording are still on disk
+    media = video.parent / "test_media"
+    media.mkdir()
+    for name in ("poster.jpg", "sprite.jpg", "preview.mp4"):
+        (media / name).write_bytes(b"old")
+    monkeypatch.setenv("FAKE_FFMPEG_FAIL", "*")
+    result = render_previews(str(video), step_offsets=[1.0, 2.0], put_urls=put_urls())
+    assert not result["ok"]
+    assert (result["poster"], result["preview"], result["sprite"]) == (None, None, None)
+    assert uploads == [] and result["bytes"] == {"video": 3}
+    assert len(result["errors"]) == 4  # poster, both tiles, preview; no sprite without tiles
+
+
+def test_missing_ffmpeg_is_reported_not_raised(video, uploads, monkeypatch):
+    (video.parent / "bin" / "ffmpeg").unlink()
+    result = render_previews(str(video), step_offsets=[1.0], put_urls=put_urls())
+    assert not result["ok"] and uploads == []
+    # One error per invocation: poster, the tile and the preview (via `nice` or a FileNotFoundError)
+    assert len(result["errors"]) == 3 and all("ffmpeg" in e for e in result["errors"])
+
+
+def test_unreadable_video_is_empty(video, uploads, monkeypatch):
+    install(video.parent / "bin", "ffprobe", FFPROBE % "N/A")
+    result = render_previews(str(video), put_urls=put_urls())
+    assert result["ok"] is False and result["error"] == "empty_video" and uploads == []
+    assert render_previews(str(video.parent / "missing.mp4"))["error"] == "video_not_found"
@@ -0,0 +1,39 @@
+"""
+The agent preamble must be byte-identical for every test, suite and deployment
+so providers can serve it from the prompt cache; everything that varies goes in
+the per-test context message.
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
+
+from prompts import AGENT_PREAMBLE, build_agent_preamble, build_test_context  # noqa: E402
+
+SUITES = [{"name": "navigation"}, {"name": "checkout"}]
+TESTS = [
+    {"name": "admissions-header", "summary": "Critical: header link opens Admissions"},
+    {"name": "first-event", "summary": "Open the first event"},
+]
+
+
+def test_preamble_is_identical_across_tests(monkeypatch):
+    preambles = set()
+    for url in ("https://qai-zeta.vercel.app", "https://preview-123.vercel.app"):
+        monkeypatch.setenv("DEPLOYMENT_URL", url)
+        for suite in SUITES:
+            for index, test in enumerate(TESTS, 1):
+                build_test_context(test, suite, index, len(TESTS))
+                preambles.add(build_agent_preamble().encode("utf-8"))
+    assert preambles == {AGENT_PREAMBLE.encode("utf-8")}
+
+
+def test_per_test_details_stay_out_of_the_preamble(monkeypatch):
+    monkeypatch.setenv("DEPLOYMENT_URL", "https://preview-123.vercel.app")
+    context = build_test_context(TESTS[0], SUITES[1], 1, 2)
+    assert "BASE URL: https://preview-123.vercel.app" in context
+    assert "SUITE: checkout" in context and "TEST 1 OF 2: admissions-header" in context
+    assert "Priority: HIGH" in context
+    preamble = build_agent_preamble()
+    for varying in ("preview-123", "checkout", "admissions-header", "Priority:"):
+        assert varying not in preamble
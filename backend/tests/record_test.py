@@ -1,7 +1,7 @@
 from computer import Computer
 import os
 from dotenv import load_dotenv, find_dotenv
-from ..agents.record import start_recording, stop_recording
+from ..agents.record import start_recording, stop_recording, upload_video
 import asyncio
 
 load_dotenv(find_dotenv())
@@ -23,6 +23,7 @@ async def main():
         
         await asyncio.sleep(5)
         
-        await computer.venv_exec("demo_venv", stop_recording)
+        stopped = await computer.venv_exec("demo_venv", stop_recording)
+        await computer.venv_exec("demo_venv", upload_video, path=stopped.get("path"))
 
 asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,91 @@
+"""
+Offline tests for checkpoint recovery: which verdicts each resume mode keeps
+and requeueing tests orphaned by a dead runner.
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("supabase")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
+
+import recovery  # noqa: E402
+from recovery import split_resumed  # noqa: E402
+
+SPECS = [
+    {"suite_id": 1, "tests": [
+        {"id": 11, "name": "login", "run_status": "PASSED"},
+        {"id": 12, "name": "checkout", "run_status": "FAILED"},
+    ]},
+    {"suite_id": 2, "tests": [
+        {"id": 21, "name": "search", "run_status": "QUEUED"},
+        {"id": 22, "name": "filters", "run_status": "CANCELLED"},
+    ]},
+    {"suite_id": 3, "tests": [{"id": 31, "name": "footer", "run_status": "PASSED"}]},
+]
+
+
+def names(pending_specs):
+    return {spec["suite_id"]: [t["name"] for t in spec["tests"]] for spec in pending_specs}
+
+
+def test_without_resume_every_test_runs():
+    kept, pending = split_resumed(SPECS)
+    assert kept == [] and names(pending) == {1: ["login", "checkout"], 2: ["search", "filters"], 3: ["footer"]}
+
+
+def test_retry_runs_failed_and_unfinished_tests_again():
+    kept, pending = split_resumed(SPECS, "retry")
+    assert [t["name"] for _, t in kept] == ["login", "footer"]
+    assert names(pending) == {1: ["checkout"], 2: ["search", "filters"]}
+    # Suites are copied, not trimmed in place
+    assert len(SPECS[0]["tests"]) == 2 and pending[0]["suite_id"] == 1
+
+
+def test_recover_keeps_every_verdict_and_reruns_interrupted_tests():
+    kept, pending = split_resumed(SPECS, "recover")
+    assert [(spec["suite_id"], t["name"]) for spec, t in kept] == [(1, "login"), (1, "checkout"), (3, "footer")]
+    assert names(pending) == {2: ["search", "filters"]}
+
+
+def test_unknown_resume_mode_is_rejected():
+    with pytest.raises(ValueError, match="unknown resume mode"):
+        split_resumed(SPECS, "yes")
+
+
+def test_orphaned_tests_are_requeued_and_their_results_returned(monkeypatch):
+    updates, queried = [], {}
+
+    async def get_orphaned_running_tests(stale_before):
+        queried["stale_before"] = stale_before
+        return [
+            {"id": 21, "suite_id": 2, "name": "search", "runner_id": "dead-1"},
+            {"id": 41, "suite_id": 4, "name": "profile", "runner_id": "dead-1"},
+            {"id": 51, "suite_id": None, "name": "stray", "runner_id": "dead-2"},
+        ]
+
+    async def get_result_ids_for_suites(suite_ids):
+        queried["suite_ids"] = suite_ids
+        return [7, 9]
+
+    async def update_test_fields(test_id, fields):
+        updates.append((test_id, fields))
+
+    class Queue:
+        async def flush(self, timeout):
+            queried["flushed"] = timeout
+            return True
+
+    monkeypatch.setenv("QAI_ORPHAN_AFTER_S", "60")
+    monkeypatch.setattr(recovery, "get_orphaned_running_tests", get_orphaned_running_tests)
+    monkeypatch.setattr(recovery, "get_result_ids_for_suites", get_result_ids_for_suites)
+    monkeypatch.setattr(recovery, "update_test_fields", update_test_fields)
+    monkeypatch.setattr(recovery, "get_write_queue", lambda: Queue())
+
+    assert asyncio.run(recovery.recover_orphaned_tests()) == [7, 9]
+    assert updates == [(21, {"run_status": "QUEUED"}), (41, {"run_status": "QUEUED"}), (51, {"run_status": "QUEUED"})]
+    assert queried["suite_ids"] == [2, 4] and "flushed" in queried
+    assert queried["stale_before"].endswith("+00:00")
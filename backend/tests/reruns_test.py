@@ -0,0 +1,95 @@
+"""
+Offline tests for failed-test reruns: only FAILED tests get replicas, quorum
+verdicts, and fail-fast leaving CANCELLED tests (and every other verdict) alone.
+"""
+import asyncio
+import sys
+from enum import Enum
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
+
+from aggregate import ResultAggregator  # noqa: E402
+from reruns import RerunStage, quorum_verdict  # noqa: E402
+
+
+class Status(Enum):
+    PASSED = "PASSED"
+    FAILED = "FAILED"
+    CANCELLED = "CANCELLED"
+
+
+def result(name, status, **extra):
+    return {"name": name, "suite_id": extra.pop("suite_id", 1), "run_status": status,
+            "test_success": status == Status.PASSED, **extra}
+
+
+def test_quorum_verdict_majority_and_flakiness():
+    assert quorum_verdict([False, True, True]) == {"votes": ["FAILED", "PASSED", "PASSED"], "passed": True, "flakiness": 0.333}
+    assert not quorum_verdict([False, True])["passed"]
+
+
+def test_only_failed_tests_are_rerun():
+    ran = []
+
+    async def run_replica(spec, test_result, container):
+        ran.append((test_result["name"], container))
+        return True
+
+    async def scenario():
+        stage = RerunStage(2, 1, run_replica, poll_interval=0.01)
+        stage.submit({"suite_id": 1}, [
+            result("ok", Status.PASSED),
+            result("flaky", Status.FAILED),
+            result("skipped", Status.CANCELLED),
+        ])
+        stage.primary_finished()
+        await stage.drain("vm-1")
+        return stage.verdicts()
+
+    applied = asyncio.run(scenario())
+    assert ran == [("flaky", "vm-1"), ("flaky", "vm-1")]
+    assert [t["name"] for t in applied] == ["flaky"]
+    assert applied[0]["test_success"] and applied[0]["rerun"]["votes"] == ["FAILED", "PASSED", "PASSED"]
+
+
+def test_fail_fast_stops_reruns_and_keeps_cancelled_tests():
+    specs = [
+        {"suite_id": 1, "tests": [{"name": "flaky"}]},
+        {"suite_id": 2, "tests": [{"name": "login", "summary": "Critical: sign in"}, {"name": "checkout"}]},
+    ]
+    ran = []
+
+    async def run_replica(spec, test_result, container):
+        ran.append(test_result["name"])
+        return True
+
+    async def scenario():
+        aggregator = ResultAggregator(1, specs, fail_fast=True, flush_interval=0)
+        stage = RerunStage(2, 2, run_replica, poll_interval=0.01, stop_event=aggregator.stop_event)
+
+        # Suite 1 finishes first with an optional failure: replicas are queued
+        flaky = result("flaky", Status.FAILED)
+        await aggregator.record(1, specs[0]["tests"][0], "FAILED")
+        stage.submit(specs[0], [flaky])
+        stage.primary_finished()
+
+        # Suite 2: a required test fails, fail-fast cancels the rest
+        login = result("login", Status.FAILED, suite_id=2, summary="Critical: sign in")
+        await aggregator.record(2, specs[1]["tests"][0], "FAILED")
+        assert aggregator.stop_event.is_set()
+        checkout = result("checkout", Status.CANCELLED, suite_id=2)
+        await aggregator.record(2, specs[1]["tests"][1], "CANCELLED")
+        stage.submit(specs[1], [login, checkout])
+        stage.primary_finished()
+
+        await asyncio.gather(stage.drain("vm-1"), stage.drain("vm-2"))
+        applied = stage.verdicts()
+        return aggregator, applied, (flaky, login, checkout)
+
+    aggregator, applied, (flaky, login, checkout) = asyncio.run(scenario())
+    assert ran == [] and applied == []
+    assert checkout["run_status"] == Status.CANCELLED and "rerun" not in checkout
+    assert flaky["run_status"] == Status.FAILED and login["run_status"] == Status.FAILED
+    overall = aggregator.overall_result()
+    assert (overall["failed_tests"], overall["cancelled_tests"], overall["passed_tests"]) == (2, 1, 0)
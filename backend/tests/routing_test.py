@@ -0,0 +1,57 @@
+"""
+Offline tests for tiered model routing: the complexity heuristic, the
+threshold that picks the starting tier, and when an attempt escalates.
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
+
+from routing import ModelRouter, estimate_complexity, is_low_confidence  # noqa: E402
+
+
+def spec(summary="", *steps):
+    return {"name": "t", "summary": summary, "instructions": [{"role": "user", "content": s} for s in steps]}
+
+
+def test_complexity_counts_keywords_chaining_length_and_priority():
+    assert estimate_complexity(spec("Open the about page")) == 0
+    assert estimate_complexity(spec("Sign in", "enter the password")) == 2
+    assert estimate_complexity(spec("", "open the menu then click docs; scroll")) == 2
+    assert estimate_complexity(spec(" ".join(["word"] * 80))) == 2
+    # "critical" makes the test HIGH priority, worth two points
+    assert estimate_complexity(spec("Critical: footer links")) == 2
+    assert estimate_complexity({"name": "bare"}) == 0
+
+
+def test_threshold_picks_the_starting_tier():
+    router = ModelRouter("strong", fast_model="fast", threshold=2)
+    assert router.route(spec("Sign in"))["initial_model"] == "fast"
+    decision = router.route(spec("Sign in", "enter the password"))
+    assert (decision["tier"], decision["initial_model"], decision["complexity"]) == ("strong", "strong", 2)
+    # Without a distinct fast model every test runs on the strong one
+    assert ModelRouter("strong", fast_model="", threshold=2).route(spec())["tier"] == "strong"
+    assert ModelRouter("strong", fast_model="strong", threshold=2).route(spec())["tier"] == "strong"
+
+
+def test_threshold_from_environment(monkeypatch):
+    monkeypatch.setenv("CUA_MODEL_FAST", "fast")
+    monkeypatch.setenv("QAI_ROUTER_COMPLEXITY_THRESHOLD", "1")
+    router = ModelRouter("strong")
+    assert router.enabled and router.threshold == 1
+    assert router.route(spec())["tier"] == "fast" and router.route(spec("checkout"))["tier"] == "strong"
+
+
+def test_escalation_reasons():
+    router = ModelRouter("strong", fast_model="fast", threshold=3)
+    decision = router.route(spec())
+    assert router.escalation_reason(decision, "PASSED", "The page loaded and shows the title") is None
+    assert router.escalation_reason(decision, "PASSED", "It appears to work") == "low_confidence"
+    assert router.escalation_reason(decision, "FAILED", None) == "failed"
+    assert router.escalation_reason(decision, "RUNNING", None) == "no_verdict"
+    assert router.escalation_reason(decision, "CANCELLED", None) is None
+    assert router.escalate(decision, "failed") == "strong"
+    assert decision["escalated"] and decision["final_model"] == "strong"
+    # Already on the strong model: nothing to escalate to
+    assert router.escalation_reason(decision, "FAILED", None) is None
+    assert not is_low_confidence(None) and is_low_confidence("Could not find the button")
@@ -0,0 +1,93 @@
+"""
+Offline tests for the screenshot preprocessor: downscaling with coordinates
+mapped back to the screen, and near-duplicate frame suppression.
+"""
+import asyncio
+import base64
+import io
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("PIL")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+from screenshots import PLACEHOLDER_IMAGE_URL, ScreenshotPreprocessor  # noqa: E402
+
+
+def data_url(size=(2048, 1280), boxes=()):
+    img = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(img)
+    for box in boxes:
+        draw.rectangle(box, fill="black")
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode("ascii")
+
+
+def frame_message(url):
+    return {"type": "computer_call_output", "call_id": "c", "output": {"type": "input_image", "image_url": url}}
+
+
+def click(x, y):
+    return {"type": "computer_call", "call_id": "c", "action": {"type": "click", "button": "left", "x": x, "y": y}}
+
+
+HOME = data_url(boxes=[(1024, 0, 2048, 1280)])
+MENU = data_url(boxes=[(x, 0, x + 120, 1280) for x in range(200, 2048, 480)])
+
+
+def sent_size(url):
+    header, payload = url.split(",", 1)
+    assert header == "data:image/jpeg;base64"
+    with Image.open(io.BytesIO(base64.b64decode(payload))) as img:
+        return img.size
+
+
+def test_downscaled_frame_coordinates_map_back_to_screen():
+    pre = ScreenshotPreprocessor(max_width=1024)
+    messages = asyncio.run(pre.on_llm_start([{"role": "user", "content": "go"}, frame_message(HOME)]))
+    assert sent_size(messages[1]["output"]["image_url"]) == (1024, 640)
+
+    drag = {"type": "computer_call", "action": {"type": "drag", "path": [{"x": 10, "y": 10}, {"x": 500, "y": 300}]}}
+    mapped = asyncio.run(pre.on_llm_end([click(100, 50), drag, {"type": "message", "content": "STEP: Clicking"}]))
+    assert (mapped[0]["action"]["x"], mapped[0]["action"]["y"]) == (200, 100)
+    assert mapped[1]["action"]["path"] == [{"x": 20, "y": 20}, {"x": 1000, "y": 600}]
+    assert mapped[2] == {"type": "message", "content": "STEP: Clicking"}
+
+
+def test_scale_follows_latest_frame_only():
+    pre = ScreenshotPreprocessor(max_width=1024)
+    asyncio.run(pre.on_llm_start([frame_message(HOME)]))
+    assert pre.scale == (2.0, 2.0)
+
+    # A new test starts with no screenshot yet: nothing was downscaled, so nothing is rescaled
+    asyncio.run(pre.on_llm_start([{"role": "user", "content": "next test"}]))
+    assert asyncio.run(pre.on_llm_end([click(100, 50)]))[0]["action"]["x"] == 100
+
+    # Latest frame is already small enough and passes at 1:1
+    small = data_url(size=(800, 500))
+    asyncio.run(pre.on_llm_start([frame_message(HOME), frame_message(small)]))
+    assert pre.scale == (1.0, 1.0)
+
+
+def test_near_duplicate_frames_keep_only_the_newest():
+    pre = ScreenshotPreprocessor(max_width=1024, dedup_distance=2)
+    messages = [frame_message(HOME), click(1, 1), frame_message(HOME), click(1, 1), frame_message(MENU)]
+    result = asyncio.run(pre.on_llm_start(messages))
+    urls = [m["output"]["image_url"] for m in result if m["type"] == "computer_call_output"]
+    assert urls[0] == PLACEHOLDER_IMAGE_URL
+    assert urls[1] != PLACEHOLDER_IMAGE_URL and urls[2] != PLACEHOLDER_IMAGE_URL
+    assert pre.stats["duplicates_suppressed"] == 1
+    # The caller's history is left untouched
+    assert messages[0]["output"]["image_url"] == HOME
+
+
+def test_dedup_can_be_disabled():
+    pre = ScreenshotPreprocessor(max_width=1024, dedup_distance=-1)
+    result = asyncio.run(pre.on_llm_start([frame_message(HOME), frame_message(HOME)]))
+    assert PLACEHOLDER_IMAGE_URL not in [m["output"]["image_url"] for m in result]
@@ -0,0 +1,138 @@
+"""
+Offline tests for run-request coalescing: concurrent keyed and unkeyed calls
+share one execution, idempotency keys replay finished responses, and the run
+endpoints scope their keys per endpoint.
+"""
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+AGENTS_DIR = Path(__file__).resolve().parent.parent / "agents"
+sys.path.insert(0, str(AGENTS_DIR))
+
+from singleflight import SingleFlight  # noqa: E402
+
+
+def counting_run(calls, delay=0.05):
+    async def run():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return {"run": len(calls)}
+    return run
+
+
+def test_keyed_and_unkeyed_calls_share_one_execution():
+    flights, calls = SingleFlight(ttl=60), []
+
+    async def scenario():
+        run = counting_run(calls)
+        return await asyncio.gather(
+            flights.do("result:1", run),
+            flights.do("result:1", run, idempotency_key="run-result:ci-42"),
+            flights.do("result:1", run, idempotency_key="run-result:ci-43"),
+        )
+
+    assert asyncio.run(scenario()) == [{"run": 1}] * 3
+    assert len(calls) == 1 and flights.stats["coalesced"] == 2
+    # Both keys that joined the run remember its response
+    assert flights.snapshot()["remembered"] == 2 and flights.snapshot()["in_flight"] == []
+
+
+def test_idempotency_key_replays_the_finished_response():
+    flights, calls = SingleFlight(ttl=60), []
+
+    async def scenario():
+        run = counting_run(calls, delay=0)
+        first = await flights.do("result:1", run, idempotency_key="run-result:ci-42")
+        replay = await flights.do("result:1", run, idempotency_key="run-result:ci-42")
+        unkeyed = await flights.do("result:1", run)
+        return first, replay, unkeyed
+
+    first, replay, unkeyed = asyncio.run(scenario())
+    assert first == replay == {"run": 1}
+    # Without a key a finished run is executed again
+    assert unkeyed == {"run": 2} and flights.stats["replayed"] == 1
+
+
+def test_failed_and_expired_runs_are_not_replayed():
+    flights = SingleFlight(ttl=0)
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("VM unavailable")
+        return "ok"
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await flights.do("suite:3", flaky, idempotency_key="run-suite:k")
+        assert await flights.do("suite:3", flaky, idempotency_key="run-suite:k") == "ok"
+        await asyncio.sleep(0.01)
+        # ttl=0: the response has expired, so the key runs again
+        assert await flights.do("suite:3", flaky, idempotency_key="run-suite:k") == "ok"
+
+    asyncio.run(scenario())
+    assert len(attempts) == 3 and flights.stats["replayed"] == 0
+
+
+@pytest.fixture
+def api(monkeypatch):
+    pytest.importorskip("fastapi")
+    pytest.importorskip("httpx")
+    pytest.importorskip("mangum")
+    from fastapi.testclient import TestClient
+
+    sys.path.insert(0, str(AGENTS_DIR / "api"))
+    import index
+
+    calls = []
+
+    async def run_qai_tests(suite_id, *args):
+        calls.append(("suite", suite_id))
+        await asyncio.sleep(0.05)
+        return {"suite_id": suite_id, "run": len(calls), "agent_result": {"status": "success"}}
+
+    monkeypatch.setattr(index, "run_requests", SingleFlight(ttl=60))
+    monkeypatch.setattr(index, "_load_runner", lambda: SimpleNamespace(run_qai_tests=run_qai_tests))
+    return TestClient(index.app), index, calls
+
+
+def test_run_suite_endpoint_coalesces_and_replays(api):
+    client, index, calls = api
+
+    async def concurrent():
+        # Keyed and unkeyed calls for the same suite arrive together
+        return await asyncio.gather(
+            index.run_suite_endpoint(index.RunSuiteRequest(suite_id=5), idempotency_key=None),
+            index.run_suite_endpoint(index.RunSuiteRequest(suite_id=5), idempotency_key="ci-1"),
+        )
+
+    unkeyed, keyed = asyncio.run(concurrent())
+    assert unkeyed["data"] == keyed["data"] and calls == [("suite", 5)]
+
+    replay = client.post("/run-suite", json={"suite_id": 5}, headers={"Idempotency-Key": "ci-1"})
+    assert replay.status_code == 200 and replay.json()["data"]["run"] == 1 and len(calls) == 1
+    body_key = client.post("/run-suite", json={"suite_id": 5, "idempotency_key": "ci-1"})
+    assert body_key.json()["data"]["run"] == 1
+    fresh = client.post("/run-suite", json={"suite_id": 5}, headers={"Idempotency-Key": "ci-2"})
+    assert fresh.json()["data"]["run"] == 2 and len(calls) == 2
+
+
+def test_idempotency_keys_are_scoped_per_endpoint(api):
+    client, index, calls = api
+
+    async def run_result():
+        # What /run-result stores for the key "shared"
+        return await index.run_requests.do(
+            "result:9", lambda: asyncio.sleep(0, result={"result_id": 9}), idempotency_key="run-result:shared",
+        )
+
+    assert asyncio.run(run_result()) == {"result_id": 9}
+    response = client.post("/run-suite", json={"suite_id": 5}, headers={"Idempotency-Key": "shared"})
+    # The suite actually ran instead of replaying the result's summary
+    assert response.json()["data"]["suite_id"] == 5 and calls == [("suite", 5)]
+    assert sorted(index.run_requests._done) == ["run-result:shared", "run-suite:shared"]
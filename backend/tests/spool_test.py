@@ -0,0 +1,112 @@
+"""
+Offline tests for the screenshot spool: content-addressed dedup, pruning the
+oldest frames past the size cap (never those of tests still using the spool),
+and references swapped in and out of agent items off the event loop.
+"""
+import asyncio
+import base64
+import os
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
+
+from spool import ScreenshotSpool, ScreenshotSpooler, is_spool_ref, ref_digest, spool_output_item  # noqa: E402
+
+
+def frames(spool):
+    return sorted(p.name for p in spool.root.glob("*/*.*"))
+
+
+def screenshot_item(data, mime="image/png"):
+    return {"type": "computer_call_output", "call_id": "c1",
+            "output": {"type": "input_image", "image_url": f"data:{mime};base64," + base64.b64encode(data).decode()}}
+
+
+def test_identical_frames_are_stored_once(tmp_path):
+    spool = ScreenshotSpool(str(tmp_path), max_mb=10)
+    first = spool.put(b"frame-a")
+    assert spool.put(b"frame-a") == first and is_spool_ref(first)
+    other = spool.put(b"frame-b", ext=".JPG")
+    assert other.endswith(".jpg") and other != first
+    assert len(frames(spool)) == 2 and spool.read(first) == b"frame-a"
+    assert spool.path(first).parent.name == ref_digest(first)[:2]
+    assert spool.stats == {"frames": 3, "stored": 2, "deduplicated": 1, "bytes_stored": 14, "pruned": 0}
+    assert spool.data_url(other) == "data:image/jpeg;base64," + base64.b64encode(b"frame-b").decode()
+    assert spool.read("qai-spool://" + "0" * 64 + ".png") is None
+
+
+def test_prune_removes_the_oldest_frames_past_the_cap(tmp_path):
+    spool = ScreenshotSpool(str(tmp_path), max_mb=2500 / (1024 * 1024))
+    refs = [spool.put(bytes([n]) * 1000) for n in range(4)]
+    for age, ref in enumerate(refs):
+        mtime = 1_000_000 + age * 10
+        os.utime(spool.path(ref), (mtime, mtime))
+    # Storing a duplicate of the oldest frame marks it as recently used
+    assert spool.put(bytes([0]) * 1000) == refs[0]
+    # A frame still being written is never pruned
+    partial = spool.path(refs[1]).parent / "tmpabc.tmp"
+    partial.write_bytes(b"x" * 5000)
+
+    assert spool.prune() == 2
+    assert [spool.read(ref) is not None for ref in refs] == [True, False, False, True]
+    assert partial.exists() and spool.stats["pruned"] == 2
+    assert spool.prune() == 0
+
+
+def test_output_items_are_spooled_and_rehydrated_for_the_model(tmp_path):
+    spool = ScreenshotSpool(str(tmp_path), max_mb=10)
+    item = screenshot_item(b"jpeg-bytes", "image/jpeg")
+    ref = spool_output_item(item, spool)
+    assert item["output"]["image_url"] == ref and ref.endswith(".jpg")
+    assert spool_output_item(item, spool) == ref and spool.stats["frames"] == 1
+    assert spool_output_item({"type": "message", "content": "hi"}, spool) is None
+
+    spooler = ScreenshotSpooler(spool)
+    second = screenshot_item(b"jpeg-bytes", "image/jpeg")
+    asyncio.run(spooler.on_computer_call_end({"type": "computer_call"}, [second]))
+    assert second["output"]["image_url"] == ref and spool.stats["deduplicated"] == 1
+
+    missing = {"type": "computer_call_output", "output": {"image_url": "qai-spool://" + "f" * 64 + ".png"}}
+    messages = [{"role": "user", "content": "go"}, item, missing]
+    sent = asyncio.run(spooler.on_llm_start(messages))
+    assert sent[1]["output"]["image_url"] == "data:image/jpeg;base64," + base64.b64encode(b"jpeg-bytes").decode()
+    # The history keeps the reference; a frame that was pruned is passed through unchanged
+    assert item["output"]["image_url"] == ref and sent[2] is missing and sent[0] is messages[0]
+
+
+def test_prune_keeps_frames_of_tests_still_in_use(tmp_path):
+    spool = ScreenshotSpool(str(tmp_path), max_mb=2500 / (1024 * 1024))
+    old = [spool.put(bytes([n]) * 1000) for n in range(2)]
+    for ref in old:
+        os.utime(spool.path(ref), (1_000_000, 1_000_000))
+    with spool.use():
+        # Written (or, for a duplicate, touched) by a running test: all over the cap together
+        current = [spool.put(bytes([n]) * 1000) for n in range(1, 4)]
+        assert spool.prune() == 1
+        assert spool.read(old[0]) is None and all(spool.read(ref) is not None for ref in current)
+        assert spool.snapshot()["in_use"] == 1
+    # Once the test is done its frames are ordinary LRU candidates again
+    assert spool.prune() == 1 and spool.snapshot()["in_use"] == 0
+
+
+def test_spooler_writes_frames_off_the_event_loop(tmp_path, monkeypatch):
+    spool = ScreenshotSpool(str(tmp_path), max_mb=10)
+    threads = []
+    put = spool.put
+
+    def recording_put(data, ext="png"):
+        threads.append(threading.get_ident())
+        return put(data, ext)
+
+    monkeypatch.setattr(spool, "put", recording_put)
+
+    async def scenario():
+        item = screenshot_item(b"png-bytes")
+        await ScreenshotSpooler(spool).on_computer_call_end({"type": "computer_call"}, [item])
+        return threading.get_ident(), item
+
+    loop_thread, item = asyncio.run(scenario())
+    assert is_spool_ref(item["output"]["image_url"])
+    assert threads and loop_thread not in threads
@@ -0,0 +1,155 @@
+"""
+Offline tests for direct-to-object-store uploads against a local S3-compatible
+stand-in: parallel part PUTs from the VM helper, the runner's multipart flow,
+and the /upload-video fallback.
+"""
+import hashlib
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
+
+import storage  # noqa: E402
+from record import upload_parts, upload_video  # noqa: E402
+
+
+class S3StandIn(BaseHTTPRequestHandler):
+    """Just enough of the S3 REST API (path-style) for multipart and single PUT uploads."""
+
+    def _reply(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def do_PUT(self):
+        url, state = urlparse(self.path), self.server.state
+        query = parse_qs(url.query)
+        data = self._body()
+        etag = '"%s"' % hashlib.md5(data).hexdigest()
+        if "partNumber" in query:
+            with state["lock"]:
+                state["active"] += 1
+                state["max_active"] = max(state["max_active"], state["active"])
+            time.sleep(0.05)
+            state["uploads"][query["uploadId"][0]][int(query["partNumber"][0])] = (etag, data)
+            with state["lock"]:
+                state["active"] -= 1
+        else:
+            state["objects"][url.path] = data
+        self._reply(200, headers={"ETag": etag})
+
+    def do_POST(self):
+        url, state = urlparse(self.path), self.server.state
+        query = parse_qs(url.query, keep_blank_values=True)
+        body = self._body()
+        if url.path == "/upload-video":
+            # The legacy endpoint: one multipart form with the file under "video"
+            name = re.search(rb'filename="([^"]+)"', body).group(1).decode()
+            state["objects"][url.path] = body
+            return self._reply(200, ('{"fileUrl": "https://files.example/video_1_%s"}' % name).encode())
+        if "uploads" in query:
+            upload_id = f"upload-{len(state['uploads']) + 1}"
+            state["uploads"][upload_id] = {}
+            xml = f"<InitiateMultipartUploadResult><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+            return self._reply(200, xml.encode())
+        parts = state["uploads"].pop(query["uploadId"][0])
+        listed = re.findall(rb"<PartNumber>(\d+)</PartNumber>\s*<ETag>([^<]+)</ETag>", body)
+        listed = [(int(n), e.decode().replace("&quot;", '"')) for n, e in listed]
+        assert [e for _, e in listed] == [parts[n][0] for n, _ in listed]
+        state["objects"][url.path] = b"".join(parts[n][1] for n, _ in listed)
+        self._reply(200, b"<CompleteMultipartUploadResult><ETag>\"done\"</ETag></CompleteMultipartUploadResult>")
+
+    def do_DELETE(self):
+        self.server.state["uploads"].pop(parse_qs(urlparse(self.path).query)["uploadId"][0], None)
+        self._reply(204)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def s3():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), S3StandIn)
+    server.state = {"uploads": {}, "objects": {}, "active": 0, "max_active": 0, "lock": threading.Lock()}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", server.state
+    server.shutdown()
+
+
+def test_upload_parts_in_parallel(s3, tmp_path):
+    endpoint, state = s3
+    video = tmp_path / "session.mp4"
+    video.write_bytes(bytes(range(256)) * 40)  # 10240 bytes -> 5 parts of 2048
+    state["uploads"]["u1"] = {}
+    urls = [f"{endpoint}/bucket/session.mp4?partNumber={n}&uploadId=u1" for n in range(1, 6)]
+
+    sent = upload_parts(str(video), urls, 2048, concurrency=5)
+    assert sent["ok"] and sent["bytes"] == 10240
+    assert [p["PartNumber"] for p in sent["parts"]] == [1, 2, 3, 4, 5]
+    parts = state["uploads"]["u1"]
+    assert b"".join(parts[n][1] for n in sorted(parts)) == video.read_bytes()
+    assert [p["ETag"] for p in sent["parts"]] == [parts[n][0] for n in sorted(parts)]
+    assert state["max_active"] > 1
+
+
+def test_upload_parts_needs_enough_urls(tmp_path):
+    video = tmp_path / "session.mp4"
+    video.write_bytes(b"x" * 5000)
+    sent = upload_parts(str(video), ["http://127.0.0.1:9/part1"], 2048)
+    assert not sent["ok"] and "need 3 part urls" in sent["error"]
+
+
+def test_object_store_multipart_roundtrip(s3, tmp_path, monkeypatch):
+    pytest.importorskip("boto3")
+    from storage import MIN_PART_SIZE, ObjectStore
+
+    endpoint, state = s3
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    store = ObjectStore("recordings", endpoint_url=endpoint, region="us-east-1", part_size=MIN_PART_SIZE)
+    video = tmp_path / "session.mp4"
+    video.write_bytes(b"\x00\x01" * (MIN_PART_SIZE + 1024))  # 2 full parts and a short one
+
+    key = store.object_key(str(video))
+    upload = store.create_multipart(key, video.stat().st_size)
+    assert len(upload["part_urls"]) == 3
+    sent = upload_parts(str(video), upload["part_urls"], upload["part_size"], concurrency=3)
+    assert sent["ok"]
+    url = store.complete_multipart(upload, sent["parts"])
+
+    assert url == f"{endpoint}/recordings/{key}"
+    assert state["objects"][f"/recordings/{key}"] == video.read_bytes()
+
+
+def test_upload_video_posts_the_recording_to_the_endpoint(s3, tmp_path):
+    endpoint, state = s3
+    video = tmp_path / "session.mp4"
+    video.write_bytes(b"\x00mp4" * 100)
+
+    posted = upload_video(str(video), upload_url=f"{endpoint}/upload-video")
+    assert posted == {"ok": True, "response": {"fileUrl": "https://files.example/video_1_session.mp4"}}
+    assert video.read_bytes() in state["objects"]["/upload-video"]
+    assert upload_video(str(tmp_path / "missing.mp4"))["error"] == "video_not_found"
+    assert not upload_video(str(video), upload_url="http://127.0.0.1:9/upload-video")["ok"]
+
+
+def test_direct_uploads_need_qai_s3_bucket(monkeypatch):
+    monkeypatch.delenv("QAI_S3_BUCKET", raising=False)
+    monkeypatch.setenv("S3_BUCKET_NAME", "node-server-bucket")
+    monkeypatch.setattr(storage, "_store", None)
+    monkeypatch.setattr(storage, "_store_checked", False)
+    assert storage.get_object_store() is None
@@ -0,0 +1,178 @@
+"""
+Offline tests for the visual regression fast-path: frame comparison, the
+reference store and step-by-step replay (through the final actions) against a
+scripted computer.
+"""
+import asyncio
+import io
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("PIL")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+from screenshots import dhash, hamming  # noqa: E402
+from spool import ScreenshotSpool  # noqa: E402
+from visual import (  # noqa: E402
+    VisualReferenceStore, VisualThresholds, compare_frames, reset_browser, run_visual_check, visual_fastpath_enabled,
+)
+
+
+def frame(extra=None):
+    img = Image.new("RGB", (1280, 800), "white")
+    draw = ImageDraw.Draw(img)
+    for i in range(12):
+        draw.rectangle([60 + i * 95, 80, 130 + i * 95, 160 + i * 40], outline="black", width=3)
+    draw.text((100, 40), "Sign in", fill="black")
+    if extra:
+        extra(draw)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+HOME = frame()
+BANNER = frame(lambda d: d.rectangle([880, 600, 1240, 760], fill="red"))
+DASHBOARD = frame(lambda d: d.rectangle([40, 300, 400, 700], fill="blue"))
+
+
+def test_dhash_is_stable_across_scale_and_sensitive_to_layout():
+    with Image.open(io.BytesIO(HOME)) as home, Image.open(io.BytesIO(BANNER)) as banner:
+        assert dhash(home) == dhash(home.convert("L"))
+        assert hamming(dhash(home), dhash(home.resize((640, 400)))) <= VisualThresholds().dhash_max
+        # One bit per adjacent pixel pair of the 9x8 thumbnail
+        assert 0 < dhash(home) < 2 ** 64 and dhash(home, size=4) < 2 ** 16
+        assert dhash(Image.new("RGB", (64, 64), "white")) == 0
+        mirrored = home.transpose(Image.FLIP_LEFT_RIGHT)
+        assert hamming(dhash(home), dhash(mirrored)) > hamming(dhash(home), dhash(banner))
+    assert hamming(0b1011, 0b0010) == 2
+
+
+def test_compare_frames_flags_changed_region():
+    thresholds = VisualThresholds()
+    assert thresholds.check(compare_frames(HOME, frame()))["matched"]
+    verdict = thresholds.check(compare_frames(HOME, BANNER))
+    assert not verdict["matched"]
+    assert verdict["diff_tiles"] and all(col >= 5 and row >= 6 for col, row in verdict["diff_tiles"])
+
+
+class ScriptedComputer:
+    """Computer double: each click advances to the next scripted screen."""
+
+    def __init__(self, screens):
+        self.screens = list(screens)
+        self.clicks = []
+        self.hotkeys = []
+        self.interface = self
+
+    async def left_click(self, x, y):
+        self.clicks.append((x, y))
+
+    async def hotkey(self, *keys):
+        self.hotkeys.append(keys)
+
+    async def screenshot(self):
+        return self.screens[min(len(self.clicks), len(self.screens) - 1)]
+
+
+def make_reference(tmp_path, tail=None, scope=""):
+    spool = ScreenshotSpool(str(tmp_path / "spool"))
+    store = VisualReferenceStore(str(tmp_path / "refs"))
+    test = {"name": "login", "summary": "Sign in and see the dashboard"}
+    step_log = [
+        {"text": "Opened the login page", "actions": [], "screenshot": spool.put(HOME)},
+        {"text": "Clicked sign in", "actions": [{"type": "click", "x": 10, "y": 20}], "screenshot": spool.put(BANNER)},
+    ]
+    if tail is not None:
+        tail = {"actions": tail["actions"], "screenshot": spool.put(tail["frame"])}
+    assert store.save(test, step_log, spool, tail, scope)
+    return spool, store, test
+
+
+def test_replay_matches_unchanged_ui(tmp_path, monkeypatch):
+    monkeypatch.setenv("QAI_VISUAL_SETTLE_S", "0")
+    spool, store, test = make_reference(tmp_path)
+    reference = store.get(test)
+    matched_steps = []
+
+    async def on_step(step, frame_ref):
+        matched_steps.append((step["text"], frame_ref))
+
+    computer = ScriptedComputer([HOME, BANNER])
+    result = asyncio.run(run_visual_check(computer, reference, store, spool, on_step))
+    assert result["matched"] and result["steps_checked"] == 2
+    assert computer.clicks == [(10, 20)]
+    assert [text for text, _ in matched_steps] == ["Opened the login page", "Clicked sign in"]
+
+
+def test_replay_reports_divergence(tmp_path, monkeypatch):
+    monkeypatch.setenv("QAI_VISUAL_SETTLE_S", "0")
+    spool, store, test = make_reference(tmp_path)
+    result = asyncio.run(run_visual_check(ScriptedComputer([HOME, HOME]), store.get(test), store, spool))
+    assert not result["matched"]
+    assert result["steps_checked"] == 1
+    assert result["diverged"]["step"] == 2 and result["diverged"]["diff_tiles"]
+
+    store.discard(test)
+    assert store.get(test) is None
+
+
+def test_fastpath_is_off_unless_enabled(monkeypatch):
+    monkeypatch.delenv("QAI_VISUAL_FASTPATH", raising=False)
+    assert not visual_fastpath_enabled()
+    monkeypatch.setenv("QAI_VISUAL_FASTPATH", "1")
+    assert visual_fastpath_enabled()
+
+
+def test_references_are_scoped_per_deployment(tmp_path):
+    _, store, test = make_reference(tmp_path, scope="https://shop.example.com")
+    assert store.get(test, "https://shop.example.com")["scope"] == "https://shop.example.com"
+    assert store.get(test, "https://blog.example.com") is None and store.get(test) is None
+    store.discard(test, "https://blog.example.com")
+    assert store.get(test, "https://shop.example.com") is not None
+
+
+def test_replay_runs_the_actions_after_the_last_step(tmp_path, monkeypatch):
+    monkeypatch.setenv("QAI_VISUAL_SETTLE_S", "0")
+    tail = {"actions": [{"type": "click", "x": 30, "y": 40}], "frame": DASHBOARD}
+    spool, store, test = make_reference(tmp_path, tail=tail)
+    reference = store.get(test)
+    assert [step.get("final", False) for step in reference["steps"]] == [False, False, True]
+    matched_steps = []
+
+    async def on_step(step, frame_ref):
+        matched_steps.append(step["text"])
+
+    computer = ScriptedComputer([HOME, BANNER, DASHBOARD])
+    result = asyncio.run(run_visual_check(computer, reference, store, spool, on_step))
+    assert result["matched"] and result["steps_checked"] == 3
+    assert computer.clicks == [(10, 20), (30, 40)]
+    # The final step only checks the end state; it isn't logged as a STEP
+    assert matched_steps == ["Opened the login page", "Clicked sign in"]
+
+    # Ending somewhere else after the last STEP is a divergence
+    result = asyncio.run(run_visual_check(ScriptedComputer([HOME, BANNER, BANNER]), reference, store, spool))
+    assert not result["matched"] and result["diverged"]["step"] == 3
+
+
+def test_reference_without_a_final_frame_is_not_saved(tmp_path):
+    spool = ScreenshotSpool(str(tmp_path / "spool"))
+    store = VisualReferenceStore(str(tmp_path / "refs"))
+    test = {"name": "search"}
+    step_log = [{"text": "Opened search", "actions": [], "screenshot": spool.put(HOME)}]
+    assert not store.save(test, step_log, spool, {"actions": [{"type": "click", "x": 1, "y": 2}], "screenshot": None})
+    assert store.get(test) is None
+    # Nothing after the last STEP: no final step
+    assert store.save(test, step_log, spool, {"actions": [], "screenshot": step_log[0]["screenshot"]})
+    assert [step.get("final", False) for step in store.get(test)["steps"]] == [False]
+
+
+def test_reset_browser_reopens_a_fresh_window():
+    computer = ScriptedComputer([HOME])
+    asyncio.run(reset_browser(computer, (536, 742), settle_s=0))
+    assert computer.hotkeys == [("ctrl", "shift", "w")] and computer.clicks == [(536, 742)]
@@ -0,0 +1,103 @@
+"""
+Offline tests for the write-behind queue: journal I/O stays off the event loop
+and is batched, coalescing, replay after a crash, and one journal per process.
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agents"))
+
+import writeback  # noqa: E402
+from writeback import WriteBehindQueue  # noqa: E402
+
+
+def test_journal_writes_are_batched_off_the_event_loop(tmp_path, monkeypatch):
+    fsync_threads = []
+    real_fsync = os.fsync
+
+    def recording_fsync(fd):
+        fsync_threads.append(threading.current_thread())
+        real_fsync(fd)
+
+    monkeypatch.setattr(writeback.os, "fsync", recording_fsync)
+    applied = []
+    queue = WriteBehindQueue(applied.append, journal_path=str(tmp_path / "journal.jsonl"))
+
+    async def scenario():
+        loop_thread = threading.current_thread()
+        for i in range(50):
+            queue.update("tests", i, {"run_status": "RUNNING"})
+        # Enqueueing returned without touching the disk
+        assert fsync_threads == []
+        assert await queue.flush(timeout=5)
+        return loop_thread
+
+    loop_thread = asyncio.run(scenario())
+    assert len(applied) == 50
+    assert fsync_threads and all(t is not loop_thread for t in fsync_threads)
+    assert len(fsync_threads) < 50
+    # Everything applied: the journal was compacted away
+    assert not (tmp_path / "journal.jsonl").exists()
+
+
+def test_updates_to_one_row_are_coalesced(tmp_path):
+    applied = []
+    queue = WriteBehindQueue(applied.append, journal_path=str(tmp_path / "journal.jsonl"))
+
+    async def scenario():
+        queue.update("tests", 1, {"run_status": "RUNNING"})
+        queue.update("tests", 1, {"heartbeat_at": "t1"})
+        queue.update("tests", 1, {"run_status": "PASSED"})
+        assert await queue.flush(timeout=5)
+
+    asyncio.run(scenario())
+    assert [op["fields"] for op in applied] == [{"run_status": "PASSED", "heartbeat_at": "t1"}]
+    assert queue.stats["coalesced"] == 2
+
+
+def test_journaled_writes_replay_after_a_crash(tmp_path):
+    journal = tmp_path / "journal.jsonl"
+
+    def unreachable(op):
+        raise ConnectionError("supabase down")
+
+    first = WriteBehindQueue(unreachable, journal_path=str(journal), backoff_base=60)
+
+    async def enqueue():
+        first.update("results", 9, {"run_status": "RUNNING"})
+        first.upsert("test_steps", {"test_id": 3, "seq": 1, "text": "Navigating"}, on_conflict="test_id,seq")
+        while not journal.exists() or len(journal.read_text().splitlines()) < 2:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(enqueue())
+    first._journal_lock.close()  # the process died
+
+    applied = []
+    second = WriteBehindQueue(applied.append, journal_path=str(journal))
+    assert second.stats["replayed"] == 2
+
+    async def drain():
+        second.start()
+        assert await second.flush(timeout=5)
+
+    asyncio.run(drain())
+    assert [(op["table"], op["op"]) for op in applied] == [("results", "update"), ("test_steps", "upsert")]
+
+
+@pytest.mark.skipif(writeback.fcntl is None, reason="journal locking needs fcntl")
+def test_a_second_process_does_not_share_the_journal(tmp_path):
+    journal = tmp_path / "journal.jsonl"
+    owner = WriteBehindQueue(lambda op: None, journal_path=str(journal))
+    other = WriteBehindQueue(lambda op: None, journal_path=str(journal))
+    assert owner.journal_path == journal
+    assert other.journal_path == tmp_path / f"journal-{os.getpid()}.jsonl"
+
+    other.update("tests", 1, {"run_status": "QUEUED"})  # no loop running: journaled inline
+    assert json.loads(other.journal_path.read_text())["id"] == 1
+    assert not journal.exists()
@@ -84,17 +84,26 @@ export default function Page() {
     Array(extendedTestSuite?.tests.length ?? 0).fill(false)
   );
   const showPlayer = useMemo(() => openTests.some(Boolean), [openTests]);
-  const selectedVideoSrc = useMemo(() => {
+  // The low-res preview plays first; the full recording is only fetched on request
+  const [fullVideo, setFullVideo] = useState(false);
+  const selectedVideo = useMemo(() => {
     const idx = openTests.findIndex((v) => v);
     if (idx === -1) return undefined;
-    const url = extendedTestSuite?.tests?.[idx]?.s3_link;
-    if (!url || typeof url !== "string") return undefined;
-    console.log(url)
-    return url;
-  }, [openTests, extendedTestSuite]);
+    const test = extendedTestSuite?.tests?.[idx];
+    const full = test?.s3_link || undefined;
+    const preview = test?.media?.preview || undefined;
+    const src = (fullVideo ? full : preview) || full || preview;
+    if (!src) return undefined;
+    return {
+      src,
+      poster: test?.media?.poster || undefined,
+      canLoadFull: !!full && src !== full,
+    };
+  }, [openTests, extendedTestSuite, fullVideo]);
 
   useEffect(() => {
     setControlType("video");
+    setFullVideo(false);
   }, [showPlayer]);
 
     if (extendedTestSuite === null) {
@@ -163,10 +172,18 @@ export default function Page() {
           <div className="mb-6 flex flex-col gap-4">
             {/* Video */}
             <div className="card aspect-[4/3] rounded-xl overflow-hidden">
-              {controlType === "video" && selectedVideoSrc && (
-                <VideoPlayer src={selectedVideoSrc} />
+              {controlType === "video" && selectedVideo && (
+                <VideoPlayer src={selectedVideo.src} poster={selectedVideo.poster} />
               )}
             </div>
+            {selectedVideo?.canLoadFull && (
+              <button
+                className="self-end text-sm hover:underline"
+                onClick={() => setFullVideo(true)}
+              >
+                Load full-resolution recording
+              </button>
+            )}
             {/* Other */}
             <div className="card h-12 rounded-xl flex flex-row items-center px-4">
               <ControlBar
@@ -13,7 +13,7 @@ import {
   MediaFullscreenButton,
 } from "media-chrome/react";
 
-export default function VideoPlayer({ src }: { src: string }) {
+export default function VideoPlayer({ src, poster }: { src: string; poster?: string }) {
   return (
     <MediaController
       style={{
@@ -24,6 +24,7 @@ export default function VideoPlayer({ src }: { src: string }) {
       <ReactPlayer
         slot="media"
         src={src}
+        poster={poster}
         controls={false}
         style={{
           width: "100%",
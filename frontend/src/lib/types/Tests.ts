@@ -25,6 +25,21 @@ export type Test = {
     run_status: TestStatus;
     steps: string[];
     s3_link: string;
+    media?: TestMedia | null;
+};
+
+export type TestMedia = {
+    video: string | null;
+    poster: string | null;
+    preview: string | null;
+    sprite: {
+        url: string;
+        columns: number;
+        rows: number;
+        tile_width: number;
+        tile_height: number;
+        offsets_s: number[];
+    } | null;
 };
 
 export type TestStep = {